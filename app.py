@@ -1,78 +1,120 @@
 import streamlit as st
-import groq
 import os
 from dotenv import load_dotenv
-from groq import Groq
-import json
-import requests
-from PIL import Image
-import io
-import base64
-from datetime import datetime
-
-# Load environment variables
-try:
-    # First try from Streamlit secrets
-    api_key = st.secrets["general"]["api_key"]
-except Exception as e:
-    # Fallback to environment variable if needed
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
-        st.error("Error: Groq API key not found. Please set it in Streamlit secrets or as an environment variable.")
-        st.stop()
-
-# Initialize Groq client with the API key
-client = Groq(api_key=api_key)
-
-# Define fallback models if primary models are unavailable
-FALLBACK_MODELS = {
-    "mistral-saba-24b": "llama3-8b-8192",       # Fallback to Llama if Mistral is unavailable
-    "llama-3.3-70b-versatile": "llama3-8b-8192" # Fallback to smaller Llama if larger is unavailable
-}
-
-# Updated primary model to use
-DEFAULT_MODEL = "mistral-saba-24b"  # New replacement for mixtral-8x7b-32768
-HIGH_QUALITY_MODEL = "llama-3.3-70b-versatile"
-FAST_MODEL = "llama3-8b-8192"
-
-# Helper function to validate API messages
-def validate_messages(messages):
-    """Ensure all message content fields are strings to prevent Groq API errors"""
-    for msg in messages:
-        if 'content' in msg and msg['content'] is not None and not isinstance(msg['content'], str):
-            msg['content'] = str(msg['content'])
-    return messages
-
-# Helper function to attempt API call with fallback models
-def safe_completion_create(messages, model, temperature, max_tokens, **kwargs):
-    """Try to create a completion with fallback to alternative models if needed"""
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import time
+from bob_core.config import HEDGING, SHOW_SEGMENTED, TEAM_LATENCY_BUDGET, TEAM_MODE
+from bob_core.engine import ComedyEngine, FALLBACK_MEME, set_caller
+from bob_core.memes import get_meme_templates
+from bob_core.prompts import system_prompt_tokens
+from bob_core.telemetry import set_labels
+
+def load_api_key():
     try:
-        return client.chat.completions.create(
-            messages=validate_messages(messages),
-            model=model,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            **kwargs
+        # First try from Streamlit secrets
+        return st.secrets["general"]["api_key"]
+    except Exception:
+        # Fallback to environment variable if needed
+        return os.getenv("GROQ_API_KEY")
+
+@st.cache_resource
+def get_engine():
+    """One engine per process: pooled Groq clients, cache, router and budgets shared by every session and rerun"""
+    api_key = load_api_key()
+    return ComedyEngine(api_key=api_key) if api_key else None
+
+engine = get_engine()
+if engine is None:
+    st.error("Error: Groq API key not found. Please set it in Streamlit secrets or as an environment variable.")
+    st.stop()
+
+script_ctx = get_script_run_ctx()
+
+# Fallbacks this run's requests hit on engine threads, which every session shares
+fallback_notices = []
+
+def warn_fallback(model, fallback_model):
+    if get_script_run_ctx(suppress_warning=True) is script_ctx:
+        st.warning(f"Primary model {model} unavailable. Using fallback model {fallback_model}.")
+    else:
+        # Only this session's script thread may write to its page
+        fallback_notices.append((model, fallback_model))
+
+def show_fallbacks():
+    """Warn about the fallbacks engine threads recorded for this run"""
+    while fallback_notices:
+        model, fallback_model = fallback_notices.pop(0)
+        st.warning(f"Primary model {model} unavailable. Using fallback model {fallback_model}.")
+
+set_caller(session=script_ctx.session_id if script_ctx else None, on_fallback=warn_fallback)
+
+def render_stream(token_stream, label):
+    """Write a TokenStream into the page as tokens arrive and show its timings"""
+    text = st.write_stream(token_stream)
+    if token_stream.total_time is not None:
+        engine.stream_metrics.record(label, token_stream)
+        st.caption(
+            f"First token in {token_stream.time_to_first_token:.2f}s · "
+            f"complete in {token_stream.total_time:.2f}s ({token_stream.model})"
         )
-    except Exception as primary_error:
-        # If we have a fallback model for this one, try it
-        fallback_model = FALLBACK_MODELS.get(model)
-        if fallback_model:
-            try:
-                st.warning(f"Primary model {model} unavailable. Using fallback model {fallback_model}.")
-                return client.chat.completions.create(
-                    messages=validate_messages(messages),
-                    model=fallback_model,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    **kwargs
-                )
-            except Exception as fallback_error:
-                # Both primary and fallback failed
-                raise Exception(f"Primary error: {str(primary_error)}. Fallback error: {str(fallback_error)}")
-        else:
-            # No fallback available, raise the original error
-            raise primary_error
+    return text
+
+def render_segmented_show(outline, show_events):
+    """Give every show segment its own placeholder and fill them all as they stream in"""
+    segment_slots = []
+    for segment in outline:
+        st.subheader(segment["title"])
+        segment_slots.append((st.empty(), st.empty()))
+    segment_texts = [""] * len(outline)
+    started = time.perf_counter()
+    for event, index, payload in show_events:
+        if event == "token":
+            segment_texts[index] += payload
+            if stream_output:
+                segment_slots[index][0].markdown(segment_texts[index] + "▌")
+        elif event == "segment":
+            segment_slots[index][0].markdown(payload.text)
+            if payload.total_time is not None:
+                engine.stream_metrics.record("show segment", payload)
+        elif event == "transition" and payload:
+            segment_slots[index][1].markdown(f"*{payload}*")
+        elif event == "error":
+            segment_slots[index][0].error(f"Error generating this segment: {payload}")
+    st.caption(f"{len(outline)} segments in {time.perf_counter() - started:.2f}s")
+
+def render_meme_stream(meme_events, meme_slots, template_choice):
+    """Start rendering each meme as soon as its texts are parsed and fill in captions as they arrive"""
+    specs = [None] * len(meme_slots)
+    renders = {}
+    shown = {}
+    failed = 0
+
+    def show_rendered(wait):
+        for index, render in renders.items():
+            caption = specs[index]["description"]
+            if shown.get(index) == caption or not (wait or render.done()):
+                continue
+            meme_image = render.result()
+            if meme_image is None:
+                meme_image = engine.get_meme_image(specs[index]["meme_template"], specs[index]["top_text"], specs[index]["bottom_text"])
+            meme_slots[index].image(meme_image, caption=caption or None, use_column_width=True)
+            shown[index] = caption
+
+    for event, index, payload in meme_events:
+        if event in ("spec", "failed"):
+            failed += event == "failed"
+            # Fallback to simpler format for entries that never came back valid
+            spec = dict(payload or FALLBACK_MEME)
+            if template_choice != "Random":
+                spec["meme_template"] = template_choice
+            specs[index] = spec
+            renders[index] = engine.meme_pool.submit(engine.produce_meme_image, spec)
+        elif event == "description":
+            specs[index]["description"] = payload
+        show_rendered(wait=False)
+    if failed == len(meme_slots):
+        st.error("Failed to parse meme data. Showing a fallback meme instead.")
+    show_rendered(wait=True)
 
 # Set page config
 st.set_page_config(
@@ -158,201 +200,88 @@ with st.sidebar:
     max_tokens = st.slider("Response Length", 100, 1000, 500, 50)
     meme_count = st.slider("Number of Memes", 1, 5, 2)
 
-def create_system_prompt(style, intensity):
-    return f"""You are Bob Buster, Hollywood's most ruthless comedy agent. Your style is {style} with an intensity of {intensity}/5.
-    You are known for:
-    - Sharp, witty comebacks
-    - Brutally honest observations
-    - Dark humor that pushes boundaries
-    - Quick improvisation skills
-    - Cultural awareness and topical references
-    - Visual humor and meme creation
-    
-    Guidelines:
-    1. Keep jokes concise and impactful
-    2. Use appropriate language based on intensity
-    3. Include relevant cultural references
-    4. Maintain character consistency
-    5. Adapt tone based on context
-    6. For visual comedy, describe memes and visual elements vividly"""
-
-def generate_meme_prompt(topic, style, intensity):
-    return f"""Create a funny meme about {topic}.
-    Style: {style}
-    Intensity: {intensity}/5
-    
-    Respond with a JSON object containing:
-    {{
-        "top_text": "short text for top of meme (max 50 chars)",
-        "bottom_text": "short text for bottom of meme (max 50 chars)",
-        "meme_template": "one of: drake, distracted, change_my_mind, two_buttons, expanding_brain, this_is_fine, stonks, surprised_pikachu",
-        "description": "brief description of the meme"
-    }}
-    
-    Keep texts short and punchy. No hashtags or special characters."""
-
-def get_meme_templates():
-    return {
-        "drake": "https://api.memegen.link/images/drake/{top}/{bottom}",
-        "distracted": "https://api.memegen.link/images/distracted/{top}/{bottom}",
-        "change_my_mind": "https://api.memegen.link/images/changemy/{top}/{bottom}",
-        "two_buttons": "https://api.memegen.link/images/buttons/{top}/{bottom}",
-        "expanding_brain": "https://api.memegen.link/images/brain/{top}/{bottom}",
-        "this_is_fine": "https://api.memegen.link/images/fine/{top}/{bottom}",
-        "stonks": "https://api.memegen.link/images/stonks/{top}/{bottom}",
-        "surprised_pikachu": "https://api.memegen.link/images/pikachu/{top}/{bottom}"
-    }
+    stream_output = st.checkbox("Stream responses", value=True)
 
-def sanitize_text(text):
-    # More thorough text sanitization
-    text = text.replace("'", "").replace('"', "")  # Remove quotes
-    text = text.replace("\n", " ").replace("\r", " ")  # Remove newlines
-    text = " ".join(text.split())  # Remove extra spaces
-    return text.replace(" ", "-").replace("?", "~q").replace("/", "~s").replace("#", "~h").replace("&", "~a")
+    with st.expander("Cache Stats"):
+        st.json(engine.cache.stats())
 
-def get_meme_image(template_name, top_text, bottom_text):
-    try:
-        templates = get_meme_templates()
-        template = template_name.lower() if template_name.lower() in templates else "drake"
-        url_template = templates[template]
-        
-        # Sanitize and truncate text
-        top = sanitize_text(top_text)[:50]  # Limit length
-        bottom = sanitize_text(bottom_text)[:50]  # Limit length
-        
-        return url_template.format(top=top, bottom=bottom)
-    except Exception as e:
-        st.error(f"Error generating meme: {str(e)}")
-        return templates["drake"].format(top="Error", bottom="generating-meme")
-
-def create_comedy_team_prompt(style, intensity):
-    return {
-        "writer": {
-            "role": "system",
-            "content": f"""You are a professional comedy writer with {style} style.
-            Your role is to create the initial joke structure and setup.
-            Intensity: {intensity}/5
-            Focus on crafting clever setups and unexpected twists.
-            Keep responses concise and impactful."""
-        },
-        "roaster": {
-            "role": "system",
-            "content": f"""You are a savage roast master with {style} style.
-            Your role is to add brutal but funny punchlines.
-            Intensity: {intensity}/5
-            Focus on clever observations and witty comebacks.
-            Keep responses concise and sharp."""
-        },
-        "refiner": {
-            "role": "system",
-            "content": f"""You are a comedy refiner with {style} style.
-            Your role is to polish jokes and make them sharper.
-            Intensity: {intensity}/5
-            Focus on timing, word choice, and delivery.
-            Keep responses concise and polished."""
-        }
-    }
+    with st.expander("Meme Render Cache"):
+        st.json(engine.meme_renderer.stats())
 
-def generate_team_comedy(topic, style, intensity, temperature):
-    # Define model assignments for each role
-    model_assignments = {
-        "writer": "llama3-8b-8192",      # Fast, creative setup generation
-        "roaster": DEFAULT_MODEL, # Strong reasoning for punchlines
-        "refiner": "llama3-70b-8192"     # High-quality output refinement
-    }
-    
-    team_prompts = create_comedy_team_prompt(style, intensity)
-    results = {}
-    
-    try:
-        # Writer creates setup using llama3-8b
-        writer_messages = [
-            team_prompts["writer"],
-            {"role": "user", "content": f"Create a clever setup for a joke about {topic}. Keep it under 50 words."}
-        ]
-        writer_completion = safe_completion_create(
-            messages=writer_messages,
-            model=model_assignments["writer"],
-            temperature=temperature,
-            max_tokens=100
-        )
-        setup = writer_completion.choices[0].message.content
-        results["setup"] = setup
-        
-        # Roaster adds punchline using mixtral-8x7b
-        roaster_messages = [
-            team_prompts["roaster"],
-            {"role": "user", "content": f"Add a savage punchline to this setup:\n{setup}\nMake it sharp and memorable."}
-        ]
-        roaster_completion = safe_completion_create(
-            messages=roaster_messages,
-            model=model_assignments["roaster"],
-            temperature=temperature,
-            max_tokens=150
-        )
-        raw_joke = roaster_completion.choices[0].message.content
-        results["raw_joke"] = raw_joke
-        
-        # Refiner polishes using llama3-70b
-        refiner_messages = [
-            team_prompts["refiner"],
-            {"role": "user", "content": f"Polish this joke to perfection:\n{raw_joke}\nMake it concise and impactful."}
-        ]
-        refiner_completion = safe_completion_create(
-            messages=refiner_messages,
-            model=model_assignments["refiner"],
-            temperature=temperature,
-            max_tokens=200
-        )
-        final_joke = refiner_completion.choices[0].message.content
-        results["final_joke"] = final_joke
-        
-        return {
-            "final_joke": final_joke,
-            "development_stages": {
-                "setup": setup,
-                "raw_joke": raw_joke
-            },
-            "models_used": model_assignments
-        }
-        
-    except Exception as e:
-        st.error(f"Error in comedy team generation: {str(e)}")
-        return None
+    with st.expander("Model Router"):
+        st.json(engine.router.snapshot())
+
+    with st.expander("Rate Limits"):
+        st.json(engine.scheduler.snapshot())
+
+    if HEDGING:
+        with st.expander("Hedged Requests"):
+            st.json(engine.hedger.snapshot())
+
+    if engine.prewarm is not None:
+        with st.expander("Prewarmed Pool"):
+            st.json(engine.prewarm.snapshot())
+
+    if engine.archive is not None:
+        with st.expander("Joke Archive"):
+            st.json(engine.archive.stats())
+
+    if engine.budget is not None:
+        with st.expander("Output Budget"):
+            st.caption(f"System prompt: ~{system_prompt_tokens(style, intensity)} tokens per request")
+            st.json(engine.budget.snapshot())
+
+    with st.expander("Request Coalescing"):
+        st.json(engine.single_flight.snapshot())
+
+    with st.expander("Streaming Latency"):
+        st.json(engine.stream_metrics.summary())
+
+    if st.checkbox("Show Ops panel", value=False):
+        with st.expander("Ops", expanded=True):
+            st.caption("Latency, tokens and cost per tab from recent completion spans")
+            ops_summary = engine.tracer.summary()
+            if ops_summary:
+                st.dataframe([{"tab": tab, **stats} for tab, stats in ops_summary.items()], hide_index=True)
+                st.dataframe(engine.tracer.recent(20), hide_index=True)
+            else:
+                st.write("No completion calls yet.")
 
 # Main content
 tab1, tab2, tab3, tab4, tab5 = st.tabs(["🎯 Generate Jokes", "🔥 Personal Roast", "🎭 Comedy Show", "🖼️ Visual Comedy", "👥 Comedy Team"])
 
 with tab1:
+    set_labels(tab="jokes")
     st.header("Generate Jokes")
     topic = st.text_input("Enter a topic for jokes:")
     
     if st.button("Generate Jokes"):
         if topic:
             with st.spinner("Crafting some savage humor..."):
-                messages = [
-                    {"role": "system", "content": create_system_prompt(style, intensity)},
-                    {"role": "user", "content": f"Generate 3 jokes about {topic}. Make them sharp, witty, and slightly savage."}
-                ]
-                
                 try:
-                    chat_completion = safe_completion_create(
-                        messages=messages,
-                        model=DEFAULT_MODEL,
-                        temperature=temperature,
-                        max_tokens=max_tokens,
-                        top_p=0.9
+                    chat_completion = engine.generate_jokes(
+                        topic,
+                        style,
+                        intensity,
+                        temperature,
+                        max_tokens,
+                        stream=stream_output
                     )
                     
-                    jokes = chat_completion.choices[0].message.content
-                    st.markdown(jokes)
+                    if stream_output:
+                        render_stream(chat_completion, "jokes")
+                    else:
+                        jokes = chat_completion.choices[0].message.content
+                        st.markdown(jokes)
                 except Exception as e:
                     st.error(f"Error generating jokes: {str(e)}")
                     st.write("Please try again with a different topic or settings.")
+            show_fallbacks()
         else:
             st.warning("Please enter a topic!")
 
 with tab2:
+    set_labels(tab="roast")
     st.header("Personal Roast")
     name = st.text_input("Enter a name to roast:")
     context = st.text_area("Add some context (optional):")
@@ -360,58 +289,76 @@ with tab2:
     if st.button("Generate Roast"):
         if name:
             with st.spinner("Preparing a savage roast..."):
-                messages = [
-                    {"role": "system", "content": create_system_prompt(style, intensity)},
-                    {"role": "user", "content": f"Create a savage roast for {name}. Context: {context}"}
-                ]
-                
                 try:
-                    chat_completion = safe_completion_create(
-                        messages=messages,
-                        model=DEFAULT_MODEL,
-                        temperature=temperature,
-                        max_tokens=max_tokens,
-                        top_p=0.9
+                    chat_completion = engine.generate_roast(
+                        name,
+                        context,
+                        style,
+                        intensity,
+                        temperature,
+                        max_tokens,
+                        stream=stream_output
                     )
                     
-                    roast = chat_completion.choices[0].message.content
-                    st.markdown(roast)
+                    if stream_output:
+                        render_stream(chat_completion, "roast")
+                    else:
+                        roast = chat_completion.choices[0].message.content
+                        st.markdown(roast)
                 except Exception as e:
                     st.error(f"Error generating roast: {str(e)}")
                     st.write("Please try again with a different name or settings.")
+            show_fallbacks()
         else:
             st.warning("Please enter a name to roast!")
 
 with tab3:
+    set_labels(tab="show")
     st.header("Comedy Show")
     st.markdown("""
         Experience a full comedy show with Bob Buster! 
         Get ready for a mix of jokes, roasts, and improv.
     """)
     
+    segmented_show = st.checkbox(
+        "Full-length show (segments written in parallel)",
+        value=SHOW_SEGMENTED,
+        help="Plans the show, then writes the opener, bits, crowd work and closer at the same time (about 10 requests instead of 1)"
+    )
+    
     if st.button("Start Comedy Show"):
-        with st.spinner("Preparing your comedy show..."):
-            messages = [
-                {"role": "system", "content": create_system_prompt(style, intensity)},
-                {"role": "user", "content": "Create a 5-minute comedy show with a mix of jokes, roasts, and improv. Include transitions and audience interactions."}
-            ]
-            
+        if segmented_show:
             try:
-                chat_completion = safe_completion_create(
-                    messages=messages,
-                    model=DEFAULT_MODEL,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    top_p=0.9
-                )
-                
-                show = chat_completion.choices[0].message.content
-                st.markdown(show)
+                with st.spinner("Planning your comedy show..."):
+                    show_events = engine.segmented_show(style, intensity, temperature, max_tokens)
+                    _, _, outline = next(show_events)
+                render_segmented_show(outline, show_events)
             except Exception as e:
                 st.error(f"Error generating comedy show: {str(e)}")
                 st.write("Please try again with different settings.")
+        else:
+            with st.spinner("Preparing your comedy show..."):
+                try:
+                    chat_completion = engine.generate_show(
+                        style,
+                        intensity,
+                        temperature,
+                        max_tokens,
+                        stream=stream_output
+                    )
+                    
+                    if stream_output:
+                        render_stream(chat_completion, "show")
+                    else:
+                        show = chat_completion.choices[0].message.content
+                        st.markdown(show)
+                except Exception as e:
+                    st.error(f"Error generating comedy show: {str(e)}")
+                    st.write("Please try again with different settings.")
+        show_fallbacks()
 
 with tab4:
+    set_labels(tab="meme")
     st.header("Visual Comedy & Memes")
     st.markdown("""
         Experience Bob Buster's visual humor with custom memes and visual jokes!
@@ -433,58 +380,30 @@ with tab4:
             with st.spinner("Creating savage memes..."):
                 try:
                     try:
-                        messages = [
-                            {"role": "system", "content": create_system_prompt(style, intensity)},
-                            {"role": "user", "content": generate_meme_prompt(meme_topic, style, intensity)}
-                        ]
-                        
-                        chat_completion = safe_completion_create(
-                            messages=messages,
-                            model=DEFAULT_MODEL,
-                            temperature=temperature,
-                            max_tokens=max_tokens,
-                            response_format={"type": "json_object"}
-                        )
-                        
-                        try:
-                            meme_data = json.loads(chat_completion.choices[0].message.content)
-                            
-                            for i in range(meme_count):
-                                template = template_choice if template_choice != "Random" else meme_data.get('meme_template', 'drake')
-                                meme_url = get_meme_image(
-                                    template,
-                                    meme_data.get('top_text', 'Error'),
-                                    meme_data.get('bottom_text', 'generating meme')
-                                )
-                                
-                                st.image(meme_url, caption=meme_data.get('description', ''), use_column_width=True)
-                                st.markdown("---")
-                        
-                        except json.JSONDecodeError:
-                            st.error("Failed to parse meme data. Trying again with simplified format...")
-                            # Fallback to simpler format
-                            meme_url = get_meme_image(
-                                template_choice if template_choice != "Random" else "drake",
-                                "When the meme",
-                                "Doesn't generate properly"
-                            )
-                            st.image(meme_url, caption="Fallback meme", use_column_width=True)
+                        meme_slots = []
+                        for _ in range(meme_count):
+                            meme_slots.append(st.empty())
+                            st.markdown("---")
+                        meme_events = engine.stream_meme_specs(meme_topic, style, intensity, meme_count, temperature, max_tokens)
+                        render_meme_stream(meme_events, meme_slots, template_choice)
                     
                     except Exception as e:
                         st.error(f"Error with Groq API: {str(e)}")
                         # Fallback meme on API error
-                        meme_url = get_meme_image(
+                        meme_image = engine.get_meme_image(
                             "drake",
                             "When Groq API",
                             "Throws an error"
                         )
-                        st.image(meme_url, caption="API Error Fallback", use_column_width=True)
+                        st.image(meme_image, caption="API Error Fallback", use_column_width=True)
                 except Exception as e:
                     st.error(f"Critical error: {str(e)}")
+            show_fallbacks()
         else:
             st.warning("Please enter a topic for meme generation!")
 
 with tab5:
+    set_labels(tab="team")
     st.header("Comedy Team")
     st.markdown("""
         Experience collaborative comedy creation powered by multiple Groq models! Watch as our team of specialized AI comedians work together:
@@ -494,22 +413,40 @@ with tab5:
     """)
     
     team_topic = st.text_input("Enter a topic for the comedy team:")
+    team_modes = {
+        "staged": "Staged - three models in turn (best quality)",
+        "two_stage": "Two-stage - draft, then polish",
+        "fused": "Fused - one call (fastest)",
+        "auto": "Auto - best that fits a latency budget"
+    }
+    team_mode = st.selectbox(
+        "Team mode",
+        list(team_modes),
+        index=list(team_modes).index(TEAM_MODE) if TEAM_MODE in team_modes else 0,
+        format_func=team_modes.get
+    )
+    latency_budget = None
+    if team_mode == "auto":
+        latency_budget = st.slider("Latency budget (seconds)", 1.0, 20.0, TEAM_LATENCY_BUDGET, 0.5)
     show_process = st.checkbox("Show joke development process", value=False)
     show_models = st.checkbox("Show models used", value=False)
     
     if st.button("Generate Team Comedy"):
         if team_topic:
             with st.spinner("Comedy team at work..."):
-                result = generate_team_comedy(team_topic, style, intensity, temperature)
+                result = engine.generate_team_comedy(team_topic, style, intensity, temperature, mode=team_mode, latency_budget=latency_budget)
                 
-                if result:
+                if result["error"]:
+                    st.error(f"Error in comedy team generation: {result['error']}")
+                else:
                     if show_process:
                         with st.expander("See how the joke evolved"):
-                            st.markdown("### Initial Setup (Llama-3 8B)")
+                            models_used = result["models_used"]
+                            st.markdown(f"### Initial Setup ({models_used['writer']})")
                             st.write(result["development_stages"]["setup"])
-                            st.markdown("### Raw Joke (Mixtral-8x7B)")
+                            st.markdown(f"### Raw Joke ({models_used['roaster']})")
                             st.write(result["development_stages"]["raw_joke"])
-                            st.markdown("### Final Polished Version (Llama-3 70B)")
+                            st.markdown(f"### Final Polished Version ({models_used['refiner']})")
                             st.write(result["final_joke"])
                     else:
                         st.markdown("### Final Joke")
@@ -519,5 +456,11 @@ with tab5:
                         st.markdown("### Models Used")
                         for role, model in result["models_used"].items():
                             st.write(f"**{role.title()}**: {model}")
+                    
+                    timings = result["timings"]
+                    st.caption(" · ".join(
+                        f"{step.replace('_', ' ').title()} {seconds:.2f}s" for step, seconds in timings.items() if step != "total"
+                    ) + f" · Total {timings['total']:.2f}s ({result['mode'].replace('_', '-')} mode)")
+            show_fallbacks()
         else:
             st.warning("Please enter a topic for the comedy team!") 
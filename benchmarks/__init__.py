@@ -0,0 +1 @@
+"""Offline benchmarks: a fake Groq server and a headless driver for every tab."""
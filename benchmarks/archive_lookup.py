@@ -0,0 +1,119 @@
+"""Lookup latency of the joke archive as it grows.
+
+Fills a scratch archive with synthetic jokes spread over a set of topics,
+then times lookups that hit an archived topic exactly, hit a reworded one
+through the MinHash index, and miss. Everything runs locally; no API calls.
+
+    python -m benchmarks.archive_lookup --items 1000000 --topics 50000 --output archive.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.run import percentile
+
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "ta", "vo", "zi", "be", "do", "fu", "ga", "hi", "jo", "pe", "sa")
+STYLES = ("Savage Roast", "Witty One-liner", "Dark Humor")
+
+
+def vocabulary(rng, size):
+    """Made-up words, so topics overlap about as much as real ones rather than sharing a handful of words"""
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def synthetic_topic(rng, words):
+    return " ".join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+
+
+def fill(archive, items, topics, rng):
+    words = vocabulary(rng, 5000)
+    topic_names = sorted({synthetic_topic(rng, words) for _ in range(topics)})
+    topics = len(topic_names)
+    started = time.perf_counter()
+    for n in range(items):
+        archive.add("jokes", topic_names[n % topics], STYLES[n // topics % len(STYLES)], 3, f"synthetic joke number {n}", model="bench")
+    return topic_names, time.perf_counter() - started
+
+
+def time_lookups(archive, queries):
+    latencies = []
+    hits = 0
+    for topic, style in queries:
+        started = time.perf_counter()
+        found = archive.find("jokes", topic, style, 3, count=1)
+        latencies.append(time.perf_counter() - started)
+        hits += found is not None
+    return {
+        "lookups": len(queries),
+        "hits": hits,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies) * 1000
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time joke archive lookups at a given size")
+    parser.add_argument("--items", type=int, default=200000, help="Archived jokes")
+    parser.add_argument("--topics", type=int, default=20000, help="Distinct topics they are spread over")
+    parser.add_argument("--lookups", type=int, default=2000, help="Lookups per kind")
+    parser.add_argument("--path", help="Archive file to fill (default: a temporary file)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    from bob_core.archive import JokeArchive
+
+    rng = random.Random(args.seed)
+    scratch = None
+    path = args.path
+    if path is None:
+        scratch = tempfile.TemporaryDirectory()
+        path = os.path.join(scratch.name, "archive.sqlite3")
+    # Serve from any single match and never retire items, so every hit stays a hit
+    archive = JokeArchive(path, similarity=0.4, min_items=1, max_serves=1 << 30)
+    topic_names, fill_time = fill(archive, args.items, args.topics, rng)
+
+    picks = [(rng.choice(topic_names), rng.choice(STYLES)) for _ in range(args.lookups)]
+    results = {
+        "exact": time_lookups(archive, picks),
+        # Same words with plurals and punctuation: normalized to the archived key
+        "reworded": time_lookups(archive, [(f"{topic.title()}s!", style) for topic, style in picks]),
+        # A word added: found through the MinHash index when similar enough
+        "similar": time_lookups(archive, [(f"{topic} again", style) for topic, style in picks]),
+        "miss": time_lookups(archive, [(f"zebra quantum {n}", rng.choice(STYLES)) for n in range(args.lookups)])
+    }
+    stats = archive.stats()
+    archive.close()
+
+    print(f"{stats['items']} items over {stats['topics']} topics, filled in {fill_time:.1f}s")
+    print(f"{'lookup':<10} {'hits':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for kind, r in results.items():
+        print(f"{kind:<10} {r['hits']:>6} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f} {r['max_ms']:>8.3f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "settings": {"items": args.items, "topics": args.topics, "lookups": args.lookups},
+                "fill_seconds": fill_time,
+                "archive": stats,
+                "results": results
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if scratch is not None:
+        scratch.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""Local stand-in for Groq's OpenAI-compatible chat completions endpoint.
+
+Serves POST /openai/v1/chat/completions (plain and SSE streaming, including
+JSON mode for the meme prompts) with configurable latency, token speed,
+429 responses and model outages, so the app can be benchmarked offline.
+GET /stats returns request counts and POST /reset clears them.
+
+Point the app at it with GROQ_BASE_URL=http://127.0.0.1:<port>.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MEME_TEMPLATES = [
+    "drake", "distracted", "change_my_mind", "two_buttons",
+    "expanding_brain", "this_is_fine", "stonks", "surprised_pikachu"
+]
+
+_MEME_COUNT = re.compile(r'"memes" array of exactly (\d+)')
+_SEGMENT_COUNT = re.compile(r'"segments" array of exactly (\d+)')
+_JOKE_COUNT = re.compile(r"Generate (\d+) jokes")
+
+WORDS = (
+    "Bob leaned into the mic and said the quiet part loud while the audience "
+    "pretended they had never done exactly that on a Monday morning before coffee"
+).split()
+
+
+class FakeGroqConfig:
+    """Latency, throughput and failure behaviour of the fake server.
+
+    Time to first token is drawn from a log-normal distribution around
+    `median_latency`; the rest of the reply arrives at `tokens_per_second`.
+    `model_latency` overrides the median per model. Models in `outages`
+    answer 503; `rate_limit_rate` is the share of requests answered 429.
+    Text replies are `reply_tokens` words, or log-normally spread around it
+    with `reply_spread`, and cut off at max_tokens.
+    """
+
+    def __init__(self, median_latency=0.3, latency_sigma=0.5, tokens_per_second=400.0,
+                 reply_tokens=80, rate_limit_rate=0.0, retry_after=0.5, outages=(),
+                 model_latency=None, seed=None, reply_spread=0.0):
+        self.median_latency = median_latency
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.reply_spread = reply_spread
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.outages = set(outages)
+        self.model_latency = dict(model_latency or {})
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def first_token_delay(self, model):
+        median = self.model_latency.get(model, self.median_latency)
+        with self._lock:
+            return median * self.random.lognormvariate(0.0, self.latency_sigma)
+
+    def rate_limited(self):
+        with self._lock:
+            return self.random.random() < self.rate_limit_rate
+
+    def reply_length(self):
+        if not self.reply_spread:
+            return self.reply_tokens
+        with self._lock:
+            return max(1, int(self.reply_tokens * self.random.lognormvariate(0.0, self.reply_spread)))
+
+
+class FakeGroqStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.streams = 0
+            self.by_model = {}
+            self.by_status = {}
+            self.completion_tokens = 0
+
+    def record(self, model, status, stream=False, tokens=0):
+        with self._lock:
+            self.requests += 1
+            self.streams += int(stream)
+            self.by_model[model] = self.by_model.get(model, 0) + 1
+            self.by_status[str(status)] = self.by_status.get(str(status), 0) + 1
+            self.completion_tokens += tokens
+
+    def add_tokens(self, tokens):
+        with self._lock:
+            self.completion_tokens += tokens
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "streams": self.streams,
+                "by_model": dict(self.by_model),
+                "by_status": dict(self.by_status),
+                "completion_tokens": self.completion_tokens
+            }
+
+
+def numbered_jokes(count, serial, length):
+    """`length` words laid out as an intro, `count` numbered jokes and an outro, like a real joke reply"""
+    words = [WORDS[(serial + i) % len(WORDS)] for i in range(max(length, count + 4))]
+    per_joke = max(1, (len(words) - 4) * 2 // (3 * count))
+    jokes = [" ".join(words[4 + i * per_joke:4 + (i + 1) * per_joke]) for i in range(count)]
+    outro = " ".join(words[4 + count * per_joke:])
+    text = " ".join(words[:4]) + ":\n\n" + "\n\n".join(f"{i}. {joke}" for i, joke in enumerate(jokes, 1))
+    return text + "\n\n" + outro if outro else text
+
+
+def reply_content(body, serial, reply_tokens):
+    """Reply text for a request: JSON memes, show outlines or team jokes in JSON mode (or when a prompt asks for JSON), otherwise filler words"""
+    prompt = " ".join(str(msg.get("content") or "") for msg in body.get("messages", []))
+    if (body.get("response_format") or {}).get("type") == "json_object" or "Respond with a JSON object" in prompt:
+        segments = _SEGMENT_COUNT.search(prompt)
+        if segments:
+            count = int(segments.group(1))
+            kinds = ["opener"] + ["bit"] * (count - 3) + ["crowd_work", "closer"]
+            return json.dumps({"segments": [
+                {"kind": kind, "title": f"Segment {i + 1}", "premise": f"benchmark premise {serial}-{i + 1}"}
+                for i, kind in enumerate(kinds)
+            ]})
+        team_fields = [field for field in ("setup", "raw_joke", "final_joke") if f'"{field}"' in prompt]
+        if team_fields:
+            return json.dumps({
+                field: " ".join(WORDS[(serial + i + offset) % len(WORDS)] for i in range(reply_tokens // 3))
+                for offset, field in enumerate(team_fields)
+            })
+        match = _MEME_COUNT.search(prompt)
+
+        def meme(index):
+            return {
+                "top_text": f"When request {serial} hits",
+                "bottom_text": f"and it is meme number {index + 1}",
+                "meme_template": MEME_TEMPLATES[(serial + index) % len(MEME_TEMPLATES)],
+                "description": "benchmark meme"
+            }
+
+        if match:
+            return json.dumps({"memes": [meme(i) for i in range(int(match.group(1)))]})
+        return json.dumps(meme(0))
+    jokes = _JOKE_COUNT.search(prompt)
+    if jokes:
+        return numbered_jokes(int(jokes.group(1)), serial, reply_tokens)
+    return " ".join(WORDS[(serial + i) % len(WORDS)] for i in range(reply_tokens))
+
+
+def _split_tokens(content):
+    # One "token" per word keeps the stream realistic enough for timing
+    parts = re.findall(r"\S+\s*", content)
+    return parts or [content]
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeGroq/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._json(200, self.server.stats.snapshot())
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        if self.path.rstrip("/") == "/reset":
+            self.server.stats.reset()
+            self._json(200, {"ok": True})
+            return
+        if not self.path.endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "not found"}})
+            return
+        body = json.loads(raw or b"{}")
+        self._complete(body)
+
+    def _complete(self, body):
+        config = self.server.config
+        stats = self.server.stats
+        model = body.get("model", "unknown")
+        stream = bool(body.get("stream"))
+
+        if model in config.outages:
+            stats.record(model, 503, stream)
+            self._json(503, {"error": {"message": f"{model} is unavailable", "type": "service_unavailable"}})
+            return
+        if config.rate_limited():
+            stats.record(model, 429, stream)
+            self._json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}},
+                headers={"retry-after": str(config.retry_after)}
+            )
+            return
+
+        with self.server.serial_lock:
+            self.server.serial += 1
+            serial = self.server.serial
+        content = reply_content(body, serial, config.reply_length())
+        tokens = _split_tokens(content)
+        finish_reason = "stop"
+        limit = int(body.get("max_tokens") or 0)
+        if limit and len(tokens) > limit and not content.startswith("{"):
+            # Text replies stop at max_tokens, like a real model's
+            tokens = tokens[:limit]
+            content = "".join(tokens).rstrip()
+            finish_reason = "length"
+        prompt_tokens = sum(len(str(msg.get("content") or "")) for msg in body.get("messages", [])) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens)
+        }
+        completion_id = f"chatcmpl-fake-{serial}"
+        created = int(time.time())
+        delay = config.first_token_delay(model)
+        per_token = 1.0 / config.tokens_per_second if config.tokens_per_second else 0.0
+        # A stream counts the tokens it actually sent, so a client closing it early generates fewer
+        stats.record(model, 200, stream, 0 if stream else len(tokens))
+
+        if not stream:
+            time.sleep(delay + per_token * len(tokens))
+            self._json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": finish_reason,
+                    "message": {"role": "assistant", "content": content}
+                }],
+                "usage": usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(delta, finish_reason=None, extra=None):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **(extra or {})
+            }
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+            self.wfile.flush()
+
+        try:
+            time.sleep(delay)
+            chunk({"role": "assistant", "content": ""})
+            for token in tokens:
+                chunk({"content": token})
+                stats.add_tokens(1)
+                if per_token:
+                    time.sleep(per_token)
+            chunk({}, finish_reason, {"x_groq": {"id": completion_id, "usage": usage}})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early (e.g. a losing hedge)
+            pass
+
+
+class FakeGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, config=None):
+        super().__init__(address, FakeGroqHandler)
+        self.config = config or FakeGroqConfig()
+        self.stats = FakeGroqStats()
+        self.serial = 0
+        self.serial_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """Start a fake server on a background thread; port 0 picks a free port"""
+    server = FakeGroqServer((host, port), config)
+    thread = threading.Thread(target=server.serve_forever, name="fake-groq", daemon=True)
+    thread.start()
+    return server
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--median-latency", type=float, default=0.3, help="Median time to first token in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of the time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="Streaming speed after the first token")
+    parser.add_argument("--reply-tokens", type=int, default=80, help="Words per text reply (capped by max_tokens)")
+    parser.add_argument("--reply-spread", type=float, default=0.0, help="Log-normal spread of text reply lengths around --reply-tokens")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After seconds sent with a 429")
+    parser.add_argument("--outage", action="append", default=[], help="Model that answers 503 (repeatable)")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="Median latency override for one model (repeatable)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+
+
+def config_from_args(args):
+    model_latency = {}
+    for item in args.model_latency:
+        model, _, seconds = item.partition("=")
+        model_latency[model] = float(seconds)
+    return FakeGroqConfig(
+        median_latency=args.median_latency,
+        latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second,
+        reply_tokens=args.reply_tokens,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        outages=args.outage,
+        model_latency=model_latency,
+        seed=args.seed,
+        reply_spread=args.reply_spread
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    server = FakeGroqServer((args.host, args.port), config_from_args(args))
+    print(f"Fake Groq API on {server.base_url} (GROQ_BASE_URL={server.base_url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
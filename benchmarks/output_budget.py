@@ -0,0 +1,158 @@
+"""Generated tokens and latency per mode with and without output budgeting.
+
+Each mode (streamed jokes, roast and show, streamed memes) is run against
+the fake Groq server twice: once sending the Response Length as-is and
+reading every reply to the end, once with learned per-mode budgets and
+early stopping. Reply lengths are spread log-normally (--reply-spread) so
+some replies ramble on like a real model's; each run gets a fresh server
+with the same seed, so both see the same replies. Budgets are learned in a
+warm-up round first. Per mode it reports the tokens the server actually
+generated per request and latency percentiles, plus the learned budgets.
+
+    python -m benchmarks.output_budget --requests 40 --output output_budget.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import urllib.request
+
+from benchmarks.fake_groq import add_config_arguments, config_from_args, start_server
+from benchmarks.run import percentile
+
+MODES = ("jokes", "roast", "show", "meme")
+
+
+def server_tokens(server):
+    with urllib.request.urlopen(server.base_url + "/stats") as response:
+        return json.load(response)["completion_tokens"]
+
+
+def run_once(engine, mode, n, args):
+    """One request in `mode`, read to the end like the app does"""
+    topic = f"benchmark topic {n}"
+    if mode == "meme":
+        for _ in engine.stream_meme_specs(topic, args.style, args.intensity, args.meme_count, args.temperature, args.max_tokens):
+            pass
+        return
+    if mode == "jokes":
+        token_stream = engine.generate_jokes(topic, args.style, args.intensity, args.temperature, args.max_tokens, stream=True)
+    elif mode == "roast":
+        token_stream = engine.generate_roast(topic, "", args.style, args.intensity, args.temperature, args.max_tokens, stream=True)
+    else:
+        token_stream = engine.generate_show(args.style, args.intensity, args.temperature, args.max_tokens, stream=True)
+    for _ in token_stream:
+        pass
+
+
+def run_mode(engine, server, mode, args):
+    for n in range(args.warmup):
+        run_once(engine, mode, -1 - n, args)
+    latencies = []
+    tokens = server_tokens(server)
+    for n in range(args.requests):
+        started = time.perf_counter()
+        run_once(engine, mode, n, args)
+        latencies.append(time.perf_counter() - started)
+    generated = server_tokens(server) - tokens
+    return {
+        "mode": mode,
+        "requests": args.requests,
+        "generated_tokens_per_request": generated / args.requests,
+        "p50_latency": percentile(latencies, 0.5),
+        "p95_latency": percentile(latencies, 0.95),
+        "p99_latency": percentile(latencies, 0.99)
+    }
+
+
+def run_variant(budgeted, args):
+    from bob_core import config
+    from bob_core.engine import ComedyEngine
+
+    server = start_server(config_from_args(args))
+    os.environ["GROQ_BASE_URL"] = server.base_url
+    config.OUTPUT_BUDGET = budgeted
+    config.EARLY_STOP = budgeted
+    engine = ComedyEngine(api_key=os.environ["GROQ_API_KEY"], prewarm=False)
+    results = [run_mode(engine, server, mode, args) for mode in args.modes]
+    server.shutdown()
+    return results, engine.budget.snapshot() if engine.budget else None
+
+
+def _fmt(value, digits=3):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def print_table(baseline, budgeted):
+    print(f"{'mode':<7} {'tokens':>7} {'budget':>7} {'saved':>6} {'p50':>7} {'p50 bud':>8} {'p95':>7} {'p95 bud':>8}")
+    for before, after in zip(baseline, budgeted):
+        saved = 1 - after["generated_tokens_per_request"] / before["generated_tokens_per_request"]
+        print(
+            f"{before['mode']:<7} {_fmt(before['generated_tokens_per_request'], 0):>7} "
+            f"{_fmt(after['generated_tokens_per_request'], 0):>7} {saved:>6.0%} "
+            f"{_fmt(before['p50_latency']):>7} {_fmt(after['p50_latency']):>8} "
+            f"{_fmt(before['p95_latency']):>7} {_fmt(after['p95_latency']):>8}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare generated tokens and latency per mode with and without output budgets")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated modes to run")
+    parser.add_argument("--requests", type=int, default=40, help="Measured requests per mode")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests per mode that budgets are learned from")
+    parser.add_argument("--max-tokens", type=int, default=500, help="Response Length sent by the app")
+    parser.add_argument("--meme-count", type=int, default=2)
+    parser.add_argument("--style", default="Savage Roast")
+    parser.add_argument("--intensity", type=int, default=3)
+    parser.add_argument("--temperature", type=float, default=0.9)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    add_config_arguments(parser)
+    parser.set_defaults(reply_tokens=160, reply_spread=0.35, tokens_per_second=400.0, seed=7)
+    args = parser.parse_args(argv)
+
+    args.modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    os.environ["GROQ_API_KEY"] = "benchmark"
+    os.environ.setdefault("BOB_DEFAULT_RPM", "100000")
+    os.environ.setdefault("BOB_DEFAULT_TPM", "100000000")
+    # Every request must reach the server, or repeated ones would be served from the cache
+    os.environ["BOB_CACHE_PATH"] = ""
+    os.environ["BOB_CACHE_VARIANTS"] = "1000000"
+    os.environ["BOB_ARCHIVE_PATH"] = ""
+    os.environ.setdefault("BOB_SPAN_LOG", "")
+
+    baseline, _ = run_variant(False, args)
+    budgeted, budgets = run_variant(True, args)
+    print_table(baseline, budgeted)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "settings": {
+                    "requests": args.requests,
+                    "warmup": args.warmup,
+                    "max_tokens": args.max_tokens,
+                    "server": {
+                        "median_latency": args.median_latency,
+                        "tokens_per_second": args.tokens_per_second,
+                        "reply_tokens": args.reply_tokens,
+                        "reply_spread": args.reply_spread
+                    }
+                },
+                "baseline": baseline,
+                "budgeted": budgeted,
+                "budgets": budgets
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""Time Streamlit reruns of the app with no button pressed.
+
+Every widget interaction reruns app.py top to bottom, so this is the fixed
+cost a user pays per click before any completion starts. Reruns are driven
+headlessly (streamlit.testing); no request reaches the network.
+
+    python -m benchmarks.rerun --runs 50
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+APP = ROOT / "app.py"
+
+
+def time_reruns(runs, warmup=3):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(APP), default_timeout=60)
+    for _ in range(warmup):
+        at.run()
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - started)
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time reruns of app.py with no button pressed")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--output", help="Write the timings summary as JSON to this path")
+    args = parser.parse_args(argv)
+
+    os.environ["GROQ_API_KEY"] = os.environ.get("GROQ_API_KEY") or "benchmark"
+    os.environ.setdefault("BOB_CACHE_PATH", "")
+    os.environ.setdefault("BOB_ARCHIVE_PATH", "")
+    os.environ.setdefault("BOB_SPAN_LOG", "")
+    timings = time_reruns(args.runs)
+    ordered = sorted(timings)
+    summary = {
+        "runs": len(timings),
+        "mean_ms": statistics.mean(timings) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000
+    }
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""Offline benchmark of every tab's code path against the fake Groq server.
+
+Each virtual user is a headless Streamlit session (streamlit.testing) that
+fills in a tab and clicks its button, so the full request path (cache,
+coalescing, scheduler, router, hedging, streaming, meme rendering) runs
+exactly as in the app. Per scenario and concurrency level it reports
+throughput, action latency percentiles, time to first token (from the span
+log) and upstream calls per action, and writes the results as JSON.
+
+    python -m benchmarks.run --concurrency 1,4,8 --output results.json
+    python -m benchmarks.run --compare results.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.fake_groq import add_config_arguments, config_from_args, start_server
+
+ROOT = Path(__file__).resolve().parent.parent
+APP = ROOT / "app.py"
+
+SCENARIOS = ("jokes", "roast", "show", "meme", "team")
+STREAMING_SCENARIOS = {"jokes", "roast", "show"}
+
+# Metrics where a higher value is a regression
+REGRESSION_METRICS = ("p50_latency", "p95_latency", "p99_latency", "p50_ttft", "upstream_calls_per_action")
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _button(at, label):
+    return next(button for button in at.button if button.label == label)
+
+
+def _text_input(at, label):
+    return next(widget for widget in at.text_input if widget.label == label)
+
+
+def perform(at, scenario, topic):
+    """Fill in a tab and click its button; the AppTest reruns the script"""
+    if scenario == "jokes":
+        _text_input(at, "Enter a topic for jokes:").input(topic)
+        _button(at, "Generate Jokes").click()
+    elif scenario == "roast":
+        _text_input(at, "Enter a name to roast:").input(topic)
+        _button(at, "Generate Roast").click()
+    elif scenario == "show":
+        _button(at, "Start Comedy Show").click()
+    elif scenario == "meme":
+        _text_input(at, "Enter a topic for meme generation:").input(topic)
+        _button(at, "Generate Memes").click()
+    elif scenario == "team":
+        _text_input(at, "Enter a topic for the comedy team:").input(topic)
+        _button(at, "Generate Team Comedy").click()
+    at.run()
+
+
+_compile_lock = threading.Lock()
+
+
+def _serialize_script_compiles():
+    """Compile the app script under a lock.
+
+    CPython 3.11's ast.parse is not safe to call from several threads at once,
+    which concurrent headless sessions otherwise do on every rerun.
+    """
+    from streamlit.runtime.scriptrunner import script_cache
+
+    get_bytecode = script_cache.ScriptCache.get_bytecode
+    if getattr(get_bytecode, "serialized", False):
+        return
+
+    def locked_get_bytecode(self, script_path):
+        with _compile_lock:
+            return get_bytecode(self, script_path)
+
+    locked_get_bytecode.serialized = True
+    script_cache.ScriptCache.get_bytecode = locked_get_bytecode
+
+
+def new_session(stream, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    _serialize_script_compiles()
+
+    at = AppTest.from_file(str(APP), default_timeout=timeout).run()
+    stream_box = next(box for box in at.checkbox if box.label == "Stream responses")
+    stream_box.set_value(stream)
+    at.run()
+    return at
+
+
+def run_user(at, scenario, user, actions, tag, results):
+    for action in range(actions):
+        topic = f"{tag} user {user} action {action}"
+        started = time.perf_counter()
+        error = None
+        try:
+            perform(at, scenario, topic)
+            if at.exception:
+                error = at.exception[0].value
+            elif at.error:
+                error = at.error[0].value
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+        results.append({"latency": time.perf_counter() - started, "error": error})
+
+
+def read_spans(path, since):
+    spans = []
+    if not os.path.exists(path):
+        return spans
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("ts", 0) >= since:
+                spans.append(record)
+    return spans
+
+
+def server_stats(base_url):
+    with urllib.request.urlopen(f"{base_url}/stats", timeout=5) as response:
+        return json.load(response)
+
+
+def run_scenario(scenario, stream, concurrency, actions, base_url, span_log, timeout, run_id):
+    # Sessions are set up one at a time; only the clicked actions are timed
+    sessions = [new_session(stream, timeout) for _ in range(concurrency)]
+    tag = f"{run_id} {scenario} {'stream' if stream else 'plain'} c{concurrency}"
+    before = server_stats(base_url)
+    started_ts = time.time()
+    results = []
+    threads = [
+        threading.Thread(target=run_user, args=(at, scenario, user, actions, tag, results))
+        for user, at in enumerate(sessions)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    after = server_stats(base_url)
+    # Spans are written by a background thread; give it a moment to flush
+    time.sleep(0.3)
+    spans = [span for span in read_spans(span_log, started_ts) if span.get("tab") == scenario]
+
+    latencies = [r["latency"] for r in results if not r["error"]]
+    ttfts = [s["time_to_first_token"] for s in spans if s.get("time_to_first_token") is not None]
+    upstream = after["requests"] - before["requests"]
+    errors = [r["error"] for r in results if r["error"]]
+    return {
+        "scenario": scenario,
+        "stream": stream,
+        "concurrency": concurrency,
+        "actions": len(results),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "wall_time": wall,
+        "throughput": len(results) / wall if wall else None,
+        "p50_latency": percentile(latencies, 0.5),
+        "p95_latency": percentile(latencies, 0.95),
+        "p99_latency": percentile(latencies, 0.99),
+        "p50_ttft": percentile(ttfts, 0.5),
+        "p95_ttft": percentile(ttfts, 0.95),
+        "upstream_calls": upstream,
+        "upstream_calls_per_action": upstream / len(results) if results else None,
+        "upstream_429s": after["by_status"].get("429", 0) - before["by_status"].get("429", 0),
+        "upstream_503s": after["by_status"].get("503", 0) - before["by_status"].get("503", 0),
+        "spans": len(spans),
+        "fallback_spans": sum(1 for s in spans if s.get("model") and s["model"] != s["requested_model"]),
+        "completion_tokens": sum(s.get("completion_tokens", 0) for s in spans)
+    }
+
+
+def result_key(result):
+    return f"{result['scenario']}/{'stream' if result['stream'] else 'plain'}/c{result['concurrency']}"
+
+
+def compare(current, baseline, threshold):
+    """Regressions of more than `threshold` (a fraction) against a baseline run"""
+    baseline_results = {result_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = baseline_results.get(result_key(result))
+        if old is None:
+            continue
+        for metric in REGRESSION_METRICS:
+            before, after = old.get(metric), result.get(metric)
+            if before is None or after is None or before <= 0:
+                continue
+            change = (after - before) / before
+            if change > threshold:
+                regressions.append({
+                    "case": result_key(result), "metric": metric,
+                    "baseline": before, "current": after, "change": change
+                })
+    return regressions
+
+
+def _fmt(value, digits=3):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def print_table(results):
+    print(f"{'case':<24} {'thru/s':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'ttft50':>7} {'calls/act':>9} {'err':>4}")
+    for r in results:
+        print(
+            f"{result_key(r):<24} {_fmt(r['throughput'], 2):>7} {_fmt(r['p50_latency']):>7} "
+            f"{_fmt(r['p95_latency']):>7} {_fmt(r['p99_latency']):>7} {_fmt(r['p50_ttft']):>7} "
+            f"{_fmt(r['upstream_calls_per_action'], 2):>9} {r['errors']:>4}"
+        )
+
+
+def configure_app_env(args, base_url, span_log):
+    """Point the app at the fake server before the first session imports it"""
+    os.environ["GROQ_API_KEY"] = os.environ.get("GROQ_API_KEY") or "benchmark"
+    os.environ["GROQ_BASE_URL"] = base_url
+    os.environ["BOB_SPAN_LOG"] = span_log
+    if not args.cache:
+        # Memory-only and effectively unlimited variants so every action reaches the scheduler
+        os.environ["BOB_CACHE_PATH"] = ""
+        os.environ["BOB_CACHE_VARIANTS"] = "1000000"
+        os.environ["BOB_ARCHIVE_PATH"] = ""
+    if not args.rate_limits:
+        os.environ.setdefault("BOB_DEFAULT_RPM", "100000")
+        os.environ.setdefault("BOB_DEFAULT_TPM", "100000000")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of Bob Roast Machine against a fake Groq server")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated tabs to drive")
+    parser.add_argument("--concurrency", default="1,4", help="Comma-separated numbers of concurrent users")
+    parser.add_argument("--actions", type=int, default=3, help="Button clicks per user per scenario")
+    parser.add_argument("--stream", choices=("on", "off", "both"), default="both",
+                        help="Streaming mode for the jokes, roast and show tabs")
+    parser.add_argument("--base-url", help="Use an already running fake server instead of starting one")
+    parser.add_argument("--cache", action="store_true", help="Keep the app's response cache settings")
+    parser.add_argument("--rate-limits", action="store_true", help="Keep the app's default rate limits")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds allowed for one script run")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Baseline results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression, e.g. 0.2 for 20%%")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.base_url:
+        base_url = args.base_url.rstrip("/")
+    else:
+        server = start_server(config_from_args(args))
+        base_url = server.base_url
+    span_log = os.path.join(tempfile.mkdtemp(prefix="bob-bench-"), "spans.jsonl")
+    configure_app_env(args, base_url, span_log)
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    modes = {"on": [True], "off": [False], "both": [True, False]}[args.stream]
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+
+    results = []
+    for scenario in scenarios:
+        for stream in (modes if scenario in STREAMING_SCENARIOS else [False]):
+            for concurrency in levels:
+                result = run_scenario(scenario, stream, concurrency, args.actions, base_url, span_log, args.timeout, run_id)
+                results.append(result)
+                print_table([result])
+
+    report = {
+        "run_id": run_id,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "actions": args.actions,
+            "cache": args.cache,
+            "rate_limits": args.rate_limits,
+            "server": None if args.base_url else {
+                "median_latency": args.median_latency,
+                "latency_sigma": args.latency_sigma,
+                "tokens_per_second": args.tokens_per_second,
+                "reply_tokens": args.reply_tokens,
+                "rate_limit_rate": args.rate_limit_rate,
+                "outages": args.outage,
+                "seed": args.seed
+            }
+        },
+        "results": results
+    }
+    print()
+    print_table(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    status = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['case']} {r['metric']}: {_fmt(r['baseline'])} -> {_fmt(r['current'])} (+{r['change']:.0%})")
+        if regressions:
+            status = 1
+        else:
+            print(f"No regressions beyond {args.threshold:.0%} against {args.compare}")
+    if server is not None:
+        server.shutdown()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""Load test of the HTTP service against the fake Groq server.
+
+Starts the fake upstream and then, for each worker count, a
+`python -m bob_core.service` process with that many uvicorn workers. A
+fixed number of concurrent clients keep sending requests (SSE streams for
+the text endpoints) for a set time, and throughput, latency and time to
+first token are reported per worker count.
+
+    python -m benchmarks.service_load --workers 1,2,4 --concurrency 32 --duration 15
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks.fake_groq import add_config_arguments, config_from_args, start_server
+from benchmarks.run import percentile
+
+ENDPOINTS = ("jokes", "roast", "show", "memes", "team")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def service_env(base_url):
+    env = dict(os.environ)
+    env.update(
+        GROQ_API_KEY=env.get("GROQ_API_KEY") or "benchmark",
+        GROQ_BASE_URL=base_url,
+        BOB_SPAN_LOG="",
+        # Memory-only cache with unlimited variants so every request reaches the upstream
+        BOB_CACHE_PATH="",
+        BOB_CACHE_VARIANTS="1000000",
+        BOB_ARCHIVE_PATH="",
+        BOB_DEFAULT_RPM="100000",
+        BOB_DEFAULT_TPM="100000000"
+    )
+    return env
+
+
+def start_service(workers, port, base_url, timeout=30.0):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "bob_core.service", "--workers", str(workers), "--port", str(port)],
+        env=service_env(base_url)
+    )
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"service exited with status {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("service did not become healthy")
+
+
+def request_body(endpoint, n):
+    topic = f"load {n}"
+    if endpoint == "roast":
+        return {"name": topic, "context": "load test"}
+    if endpoint == "memes":
+        return {"topic": topic, "count": 2}
+    if endpoint == "show":
+        return {"max_tokens": 300 + n % 200}
+    return {"topic": topic}
+
+
+async def send(client, endpoint, n):
+    """One request; returns (latency, time to first token or None, error)"""
+    started = time.perf_counter()
+    body = request_body(endpoint, n)
+    if endpoint not in ("memes", "team"):
+        ttft = None
+        error = None
+        async with client.stream("POST", f"/v1/{endpoint}", json=body) as response:
+            if response.status_code != 200:
+                return time.perf_counter() - started, None, f"HTTP {response.status_code}"
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[7:]
+                    if event == "token" and ttft is None:
+                        ttft = time.perf_counter() - started
+                elif line.startswith("data: ") and event == "error":
+                    error = json.loads(line[6:])["error"]
+        return time.perf_counter() - started, ttft, error
+    response = await client.post(f"/v1/{endpoint}", json=body)
+    error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+    return time.perf_counter() - started, None, error
+
+
+async def drive(port, endpoints, concurrency, duration):
+    import httpx
+
+    counter = itertools.count()
+    results = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120, limits=limits) as client:
+        deadline = time.perf_counter() + duration
+
+        async def user():
+            while time.perf_counter() < deadline:
+                n = next(counter)
+                endpoint = endpoints[n % len(endpoints)]
+                try:
+                    latency, ttft, error = await send(client, endpoint, n)
+                except Exception as e:
+                    latency, ttft, error = None, None, f"{type(e).__name__}: {str(e)}"
+                results.append({"endpoint": endpoint, "latency": latency, "ttft": ttft, "error": error})
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+    return results, wall
+
+
+def summarize(workers, results, wall):
+    ok = [r for r in results if not r["error"]]
+    latencies = [r["latency"] for r in ok]
+    ttfts = [r["ttft"] for r in ok if r["ttft"] is not None]
+    errors = [r["error"] for r in results if r["error"]]
+    return {
+        "workers": workers,
+        "requests": len(results),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "wall_time": wall,
+        "throughput": len(ok) / wall if wall else None,
+        "p50_latency": percentile(latencies, 0.5),
+        "p95_latency": percentile(latencies, 0.95),
+        "p99_latency": percentile(latencies, 0.99),
+        "p50_ttft": percentile(ttfts, 0.5),
+        "p95_ttft": percentile(ttfts, 0.95),
+        "by_endpoint": {
+            endpoint: sum(1 for r in ok if r["endpoint"] == endpoint)
+            for endpoint in sorted({r["endpoint"] for r in results})
+        }
+    }
+
+
+def _fmt(value, digits=3):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def print_table(results):
+    print(f"{'workers':>7} {'reqs':>6} {'thru/s':>8} {'p50':>7} {'p95':>7} {'ttft50':>7} {'err':>4}")
+    for r in results:
+        print(
+            f"{r['workers']:>7} {r['requests']:>6} {_fmt(r['throughput'], 1):>8} {_fmt(r['p50_latency']):>7} "
+            f"{_fmt(r['p95_latency']):>7} {_fmt(r['p50_ttft']):>7} {r['errors']:>4}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the HTTP service at several worker counts")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated uvicorn worker counts")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds of load per worker count")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated endpoints to mix")
+    parser.add_argument("--base-url", help="Use an already running fake server instead of starting one")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    server = None
+    if args.base_url:
+        base_url = args.base_url.rstrip("/")
+    else:
+        server = start_server(config_from_args(args))
+        base_url = server.base_url
+
+    results = []
+    for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+        port = free_port()
+        process = start_service(workers, port, base_url)
+        try:
+            # One short pass so every worker has built its engine and clients
+            asyncio.run(drive(port, endpoints, workers * 2, 1.0))
+            result = summarize(workers, *asyncio.run(drive(port, endpoints, args.concurrency, args.duration)))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+        results.append(result)
+        print_table([result])
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "endpoints": endpoints,
+            "server": None if args.base_url else {
+                "median_latency": args.median_latency,
+                "tokens_per_second": args.tokens_per_second,
+                "reply_tokens": args.reply_tokens
+            }
+        },
+        "results": results
+    }
+    print()
+    print_table(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if server is not None:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
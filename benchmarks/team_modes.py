@@ -0,0 +1,173 @@
+"""Latency and token cost of the Comedy Team modes on a fixed topic set.
+
+Every topic is run through each mode (staged, two_stage, fused) one at a
+time, against the fake Groq server or, with --live, the real API. Per mode
+it reports latency percentiles, upstream calls, tokens and estimated cost
+per joke, and keeps the final jokes of the first round so the modes can be
+compared side by side for quality.
+
+    python -m benchmarks.team_modes --repeat 3 --output team_modes.json
+    python -m benchmarks.team_modes --live --repeat 1 --output team_modes_live.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from benchmarks.fake_groq import add_config_arguments, config_from_args, start_server
+from benchmarks.run import percentile
+
+TOPICS = (
+    "Mondays", "airline food", "cats", "crypto",
+    "gym selfies", "group chats", "self-checkout", "remote work"
+)
+MODES = ("staged", "two_stage", "fused")
+
+
+def run_mode(engine, mode, topics, repeat, style, intensity, temperature):
+    from bob_core.telemetry import collect_usage, labels
+
+    runs = []
+    for round_number in range(repeat):
+        for topic in topics:
+            with collect_usage() as usage, labels(tab=f"team:{mode}"):
+                started = time.perf_counter()
+                result = engine.generate_team_comedy_batch([topic], style, intensity, temperature, mode=mode)[0]
+                latency = time.perf_counter() - started
+            runs.append({
+                "round": round_number,
+                "topic": topic,
+                "mode": result["mode"],
+                "latency": latency,
+                "error": result["error"],
+                "final_joke": result.get("final_joke"),
+                "calls": usage.calls,
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "cost": usage.cost
+            })
+    return runs
+
+
+def summarize(mode, runs):
+    ok = [r for r in runs if not r["error"]]
+    latencies = [r["latency"] for r in ok]
+
+    def mean(field):
+        return sum(r[field] for r in ok) / len(ok) if ok else None
+
+    return {
+        "mode": mode,
+        "runs": len(runs),
+        "errors": len(runs) - len(ok),
+        "error_samples": [r["error"] for r in runs if r["error"]][:3],
+        "redone_staged": sum(1 for r in ok if r["mode"] != mode),
+        "p50_latency": percentile(latencies, 0.5),
+        "p95_latency": percentile(latencies, 0.95),
+        "calls_per_joke": mean("calls"),
+        "prompt_tokens_per_joke": mean("prompt_tokens"),
+        "completion_tokens_per_joke": mean("completion_tokens"),
+        "cost_per_joke": mean("cost"),
+        "samples": {r["topic"]: r["final_joke"] for r in runs if r["round"] == 0 and not r["error"]}
+    }
+
+
+def _fmt(value, digits=3):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def print_table(results):
+    staged = next((r for r in results if r["mode"] == "staged"), None)
+    print(f"{'mode':<10} {'p50':>7} {'p95':>7} {'speedup':>8} {'calls':>6} {'prompt':>7} {'compl':>7} {'cost/joke':>10} {'err':>4}")
+    for r in results:
+        speedup = None
+        if staged and staged["p50_latency"] and r["p50_latency"]:
+            speedup = staged["p50_latency"] / r["p50_latency"]
+        print(
+            f"{r['mode']:<10} {_fmt(r['p50_latency']):>7} {_fmt(r['p95_latency']):>7} "
+            f"{_fmt(speedup, 2):>8} {_fmt(r['calls_per_joke'], 1):>6} {_fmt(r['prompt_tokens_per_joke'], 0):>7} "
+            f"{_fmt(r['completion_tokens_per_joke'], 0):>7} {_fmt(r['cost_per_joke'], 6):>10} {r['errors']:>4}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare latency and token cost of the Comedy Team modes")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated modes to compare")
+    parser.add_argument("--repeat", type=int, default=3, help="Rounds over the topic set per mode")
+    parser.add_argument("--topics", help="Comma-separated topics instead of the built-in set")
+    parser.add_argument("--style", default="Savage Roast")
+    parser.add_argument("--intensity", type=int, default=3)
+    parser.add_argument("--temperature", type=float, default=0.9)
+    parser.add_argument("--live", action="store_true", help="Call the real Groq API with GROQ_API_KEY (spends tokens)")
+    parser.add_argument("--output", help="Write results and sample jokes as JSON to this path")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+    topics = [t.strip() for t in args.topics.split(",") if t.strip()] if args.topics else list(TOPICS)
+
+    server = None
+    if args.live:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        if not os.getenv("GROQ_API_KEY"):
+            parser.error("--live needs GROQ_API_KEY")
+    else:
+        server = start_server(config_from_args(args))
+        os.environ["GROQ_API_KEY"] = os.environ.get("GROQ_API_KEY") or "benchmark"
+        os.environ["GROQ_BASE_URL"] = server.base_url
+        os.environ.setdefault("BOB_DEFAULT_RPM", "100000")
+        os.environ.setdefault("BOB_DEFAULT_TPM", "100000000")
+    # Every run must reach the API, or repeated topics would be served from the cache
+    os.environ["BOB_CACHE_PATH"] = ""
+    os.environ["BOB_CACHE_VARIANTS"] = "1000000"
+    os.environ["BOB_ARCHIVE_PATH"] = ""
+    os.environ.setdefault("BOB_SPAN_LOG", "")
+
+    from bob_core.engine import ComedyEngine
+
+    engine = ComedyEngine(api_key=os.environ["GROQ_API_KEY"], prewarm=False)
+    results = []
+    for mode in modes:
+        runs = run_mode(engine, mode, topics, args.repeat, args.style, args.intensity, args.temperature)
+        results.append(summarize(mode, runs))
+        print_table(results[-1:])
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "live": args.live,
+            "topics": topics,
+            "repeat": args.repeat,
+            "style": args.style,
+            "intensity": args.intensity,
+            "temperature": args.temperature,
+            "server": None if args.live else {
+                "median_latency": args.median_latency,
+                "tokens_per_second": args.tokens_per_second,
+                "reply_tokens": args.reply_tokens,
+                "model_latency": args.model_latency
+            }
+        },
+        "results": results
+    }
+    print()
+    print_table(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults and sample jokes written to {args.output}")
+    if server is not None:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+"""Helpers behind the Bob Buster Streamlit app.
+
+Everything in this package is importable without starting Streamlit so it
+survives script reruns and can be shared by other entry points.
+"""
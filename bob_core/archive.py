@@ -0,0 +1,424 @@
+"""Persistent archive of everything generated, served back for similar topics.
+
+Every joke, roast and meme spec is stored in SQLite with its topic, style,
+intensity, model, session and timestamp; a reply of several jokes is stored
+joke by joke. Topics are normalized ("Mondays!" and "monday" share a key)
+and indexed twice in memory: an exact map from normalized topic, and MinHash
+signatures of their character trigrams banded into an LSH table. The few
+topics the LSH table turns up are scored by their exact trigram Jaccard
+similarity, so a topic like "monday mornings" (0.46 alike) finds "monday"
+without scanning anything. A topic can be tied to a subject, a roast's
+name: then only topics with exactly the same subject match, and similarity
+is judged on the rest. Items are looked up through one SQLite index per
+(topic, mode, style, intensity).
+
+An item is unique per mode by a fingerprint of its normalized text, so an
+exact duplicate is never stored or served twice. A lookup only serves once
+enough unserved items exist for the matched topic, never returns a caller's
+own items, and retires an item after it has been served `max_serves` times,
+so popular topics keep getting fresh generations mixed in. Generated
+replies are passed through a RepeatFilter before they are shown, so a joke
+the archive already holds doesn't reach the user a second time.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+# 32 bands of 2 rows: topics 40% alike almost always share a band, unrelated ones seldom do
+SIGNATURE_SIZE = 64
+BAND_ROWS = 2
+# Candidates from the LSH buckets that get their similarity computed
+MAX_CANDIDATES = 32
+
+
+def _masks(n):
+    return tuple(
+        int.from_bytes(hashlib.blake2b(f"minhash-{i}".encode(), digest_size=8).digest(), "big")
+        for i in range(n)
+    )
+
+
+# Each signature slot orders shingle hashes XORed with its own fixed mask
+_MASKS = _masks(SIGNATURE_SIZE)
+_WORD = re.compile(r"[a-z0-9]+")
+# Start of a numbered joke: "1.", "2)", "**3.**", "Joke 4:"
+JOKE_START = re.compile(r"^[ \t]*(?:\*\*)?(?:joke[ \t]*)?\d+[.):](?:\*\*)?[ \t]*", re.IGNORECASE | re.MULTILINE)
+
+
+def split_jokes(text):
+    """The numbered jokes of a reply, without intro, outro or duplicates; [] if it isn't a numbered list"""
+    starts = list(JOKE_START.finditer(text or ""))
+    if len(starts) < 2:
+        return []
+    jokes = []
+    for start, end in zip(starts, starts[1:] + [None]):
+        jokes.append(text[start.end():end.start() if end else len(text)].strip())
+    if all("\n\n" not in joke for joke in jokes[:-1]):
+        # Single-paragraph jokes: a paragraph after the last one is an outro
+        jokes[-1] = jokes[-1].split("\n\n", 1)[0].strip()
+    unique = []
+    seen = set()
+    for joke in jokes:
+        key = fingerprint(joke)
+        if joke and key not in seen:
+            seen.add(key)
+            unique.append(joke)
+    return unique
+
+
+def complete_jokes(text):
+    """How many numbered jokes of a reply still being written are finished.
+
+    A joke is finished once the next one starts; the last one once a blank
+    line follows it, when the jokes before it were single paragraphs (the
+    same rule split_jokes uses to tell the last joke from an outro).
+    """
+    starts = list(JOKE_START.finditer(text or ""))
+    if not starts:
+        return 0
+    finished = len(starts) - 1
+    single = all("\n\n" not in text[start.end():end.start()].strip() for start, end in zip(starts, starts[1:]))
+    if single and "\n\n" in text[starts[-1].end():].lstrip():
+        finished += 1
+    return finished
+
+
+def format_jokes(jokes):
+    return "\n\n".join(f"{i}. {joke}" for i, joke in enumerate(jokes, 1))
+
+
+def normalize_topic(topic):
+    """Lowercase words without punctuation, with a plural "s" dropped"""
+    words = _WORD.findall(str(topic or "").lower())
+    return " ".join(word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word for word in words)
+
+
+def topic_key(topic, subject=None):
+    """Archive key of a topic; with a subject (a roast's name) it only ever matches topics about the same subject"""
+    key = normalize_topic(topic)
+    return key if subject is None else f"{normalize_topic(subject)}|{key}"
+
+
+def _key_parts(key):
+    """(subject, topic) of a key, subject None if it has none"""
+    if "|" in key:
+        subject, topic = key.split("|", 1)
+        return subject, topic
+    return None, key
+
+
+def fingerprint(text):
+    """Identity of a piece of content that ignores case, spacing and punctuation"""
+    normalized = " ".join(_WORD.findall(str(text).lower()))
+    return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+
+@lru_cache(maxsize=4096)
+def shingles(topic):
+    """Character trigrams of a normalized topic, padded so word starts and ends count"""
+    padded = f" {topic} "
+    return frozenset(padded[i:i + 3] for i in range(max(1, len(padded) - 2)))
+
+
+@lru_cache(maxsize=4096)
+def minhash(key):
+    """MinHash signature of the trigrams of a key's topic (its subject is matched exactly instead)"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+        for s in shingles(_key_parts(key)[1])
+    ]
+    return tuple(min([x ^ mask for x in hashes]) for mask in _MASKS)
+
+
+def similarity(left, right):
+    """Jaccard similarity of two normalized topics' trigrams"""
+    left, right = shingles(left), shingles(right)
+    return len(left & right) / len(left | right)
+
+
+def _bands(signature, subject=None):
+    # The subject is part of every bucket, so topics about someone else are never candidates
+    return [(subject, i) + signature[i:i + BAND_ROWS] for i in range(0, len(signature), BAND_ROWS)]
+
+
+class JokeArchive:
+    """SQLite store of generated items with an in-memory topic index.
+
+    Items are JSON-serializable content (joke text, a meme spec dict). Only
+    the topic index lives in memory; items stay on disk behind an index, so
+    lookups cost the same at millions of items. Topics another process adds
+    are picked up when the archive is next opened.
+    """
+
+    def __init__(self, path, similarity=0.5, min_items=5, max_serves=1):
+        self.similarity = similarity
+        self.min_items = min_items
+        self.max_serves = max_serves
+        self._lock = threading.Lock()
+        # Service workers share the file; wait out each other's write locks instead of failing
+        self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS topics (
+                id INTEGER PRIMARY KEY,
+                topic_key TEXT NOT NULL UNIQUE,
+                signature TEXT NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY,
+                topic_id INTEGER NOT NULL,
+                mode TEXT NOT NULL,
+                style TEXT NOT NULL,
+                intensity INTEGER NOT NULL,
+                topic TEXT NOT NULL,
+                model TEXT,
+                session TEXT,
+                created REAL NOT NULL,
+                fingerprint TEXT NOT NULL,
+                content TEXT NOT NULL,
+                served INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (mode, fingerprint)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS items_lookup ON items (topic_id, mode, style, intensity, served)")
+        self._conn.commit()
+        self._topic_ids = {}
+        self._keys = {}
+        self._buckets = {}
+        for topic_id, topic_key, signature in self._conn.execute("SELECT id, topic_key, signature FROM topics"):
+            self._index_topic(topic_id, topic_key, tuple(int(v) for v in signature.split()))
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.added = 0
+        self.duplicates = 0
+
+    def _index_topic(self, topic_id, key, signature):
+        self._topic_ids[key] = topic_id
+        self._keys[topic_id] = key
+        for band in _bands(signature, _key_parts(key)[0]):
+            self._buckets.setdefault(band, []).append(topic_id)
+
+    def _topic_id(self, key):
+        topic_id = self._topic_ids.get(key)
+        if topic_id is None:
+            signature = minhash(key)
+            # Another process may have added the topic since this one loaded the index
+            self._conn.execute(
+                "INSERT OR IGNORE INTO topics (topic_key, signature) VALUES (?, ?)",
+                (key, " ".join(map(str, signature)))
+            )
+            topic_id = self._conn.execute("SELECT id FROM topics WHERE topic_key = ?", (key,)).fetchone()[0]
+            self._index_topic(topic_id, key, signature)
+        return topic_id
+
+    def similar_topics(self, key, limit=3):
+        """Ids of other archived topics with the same subject at least `similarity` alike, closest first"""
+        subject, topic = _key_parts(key)
+        signature = minhash(key)
+        # Topics sharing the most bands are the likeliest matches; only those are scored
+        shared = Counter()
+        for band in _bands(signature, subject):
+            shared.update(self._buckets.get(band, ()))
+        shared.pop(self._topic_ids.get(key), None)
+        matches = []
+        for topic_id, _ in shared.most_common(MAX_CANDIDATES):
+            score = similarity(topic, _key_parts(self._keys[topic_id])[1])
+            if score >= self.similarity:
+                matches.append((score, topic_id))
+        matches.sort(reverse=True)
+        return [topic_id for _, topic_id in matches[:limit]]
+
+    def add(self, mode, topic, style, intensity, content, model=None, session=None, identity=None, subject=None):
+        """Store one item; returns False if an exact duplicate is already archived.
+
+        `identity` is the text duplicates are judged by, `content` itself by default.
+        `subject` ties the item to exactly that subject (see topic_key).
+        """
+        with self._lock:
+            try:
+                self._conn.execute(
+                    """INSERT INTO items (topic_id, mode, style, intensity, topic, model, session, created, fingerprint, content)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (
+                        self._topic_id(topic_key(topic, subject)), mode, style, int(intensity),
+                        topic if subject is None else f"{subject} {topic}".strip(), model, session,
+                        time.time(), fingerprint(identity if identity is not None else content),
+                        json.dumps(content)
+                    )
+                )
+            except sqlite3.IntegrityError:
+                self.duplicates += 1
+                return False
+            finally:
+                self._conn.commit()
+            self.added += 1
+            return True
+
+    def find(self, mode, topic, style, intensity, count=1, session=None, subject=None):
+        """`count` archived items for a topic close enough to this one, or None.
+
+        Serves only when the best matching topic holds at least `min_items`
+        (and `count`) items that are neither worn out nor the caller's own.
+        """
+        wanted = max(self.min_items, count)
+        key = topic_key(topic, subject)
+        with self._lock:
+            exact = self._topic_ids.get(key)
+            if exact is not None:
+                items = self._take(exact, mode, style, intensity, count, wanted, session)
+                if items is not None:
+                    self.hits += 1
+                    return items
+            # Only look for similar topics when the exact one can't serve
+            for topic_id in self.similar_topics(key):
+                items = self._take(topic_id, mode, style, intensity, count, wanted, session)
+                if items is not None:
+                    self.similar_hits += 1
+                    return items
+            self.misses += 1
+            return None
+
+    def _take(self, topic_id, mode, style, intensity, count, wanted, session):
+        rows = self._conn.execute(
+            """SELECT id, content FROM items
+            WHERE topic_id = ? AND mode = ? AND style = ? AND intensity = ? AND served < ?
+            AND (session IS NULL OR session IS NOT ?)
+            ORDER BY served, id LIMIT ?""",
+            (topic_id, mode, style, int(intensity), self.max_serves, session, wanted)
+        ).fetchall()
+        if len(rows) < wanted:
+            return None
+        rows = rows[:count]
+        self._conn.executemany("UPDATE items SET served = served + 1 WHERE id = ?", [(row[0],) for row in rows])
+        self._conn.commit()
+        return [json.loads(row[1]) for row in rows]
+
+    def served(self, mode, text, before=None):
+        """How often the item with this text was served in `mode`; None if it isn't archived, or was added after item `before`"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, served FROM items WHERE mode = ? AND fingerprint = ?", (mode, fingerprint(text))
+            ).fetchone()
+        if row is None or (before is not None and row[0] > before):
+            return None
+        return row[1]
+
+    def count(self):
+        # Items are never deleted, so the last id is the count without a table scan
+        return self._conn.execute("SELECT MAX(id) FROM items").fetchone()[0] or 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                "items": self.count(),
+                "topics": len(self._topic_ids),
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.similar_hits) / lookups if lookups else 0.0,
+                "added": self.added,
+                "duplicates": self.duplicates
+            }
+
+    def close(self):
+        self._conn.close()
+
+
+def _renumber(start, number):
+    return re.sub(r"\d+", str(number), start, count=1)
+
+
+class RepeatFilter:
+    """Drops the jokes of a reply that the archive held before the reply was requested.
+
+    A fresh reply loses every joke the archive already has; a repeated one
+    (a cached reply, whose jokes were archived the first time round) only
+    those the archive has served since. The jokes left are renumbered, and a
+    reply that would be left without any is shown as it is.
+    """
+
+    def __init__(self, archive, mode):
+        self.archive = archive
+        self.mode = mode
+        # Items archived from now on, this reply's own among them, are not repeats
+        with archive._lock:
+            self.before = archive.count()
+
+    def _served(self, joke):
+        try:
+            return self.archive.served(self.mode, joke, self.before)
+        except sqlite3.Error:
+            # Showing a joke twice beats failing the reply
+            return None
+
+    def _repeated(self, joke, repeat):
+        served = self._served(joke)
+        return served is not None and (served > 0 or not repeat)
+
+    def text(self, text):
+        """A whole reply without its repeated jokes"""
+        jokes = split_jokes(text)
+        repeat = bool(jokes) and all(self._served(joke) is not None for joke in jokes)
+        return "".join(self.chunks([text], repeat))
+
+    def chunks(self, chunks, repeat=False):
+        """Text chunks of a streamed reply without its repeated jokes.
+
+        The intro passes through line by line, a joke once the next one starts
+        and the last one (split from any outro like split_jokes does) at the end.
+        """
+        text = ""
+        shown = 0
+        decided = 0
+        kept = 0
+        seen = set()
+        starts = []
+
+        def joke(start, body):
+            nonlocal kept
+            key = fingerprint(body.strip())
+            if key in seen or self._repeated(body.strip(), repeat):
+                return ""
+            seen.add(key)
+            kept += 1
+            return _renumber(start.group(), kept) + body
+
+        for chunk in chunks:
+            text += chunk
+            starts = list(JOKE_START.finditer(text))
+            if not starts:
+                # The line being written may still turn out to start the first joke
+                end = text.rfind("\n") + 1
+            else:
+                end = starts[0].start()
+            out = text[shown:end] if end > shown else ""
+            shown = max(shown, end)
+            while decided < len(starts) - 1:
+                out += joke(starts[decided], text[starts[decided].end():starts[decided + 1].start()])
+                decided += 1
+                shown = starts[decided].start()
+            if out:
+                yield out
+        if len(starts) < 2:
+            out = text[shown:]
+        else:
+            tail = text[starts[-1].end():]
+            body = tail.lstrip()
+            single = all("\n\n" not in text[start.end():end.start()].strip() for start, end in zip(starts, starts[1:]))
+            cut = body.find("\n\n") if single else -1
+            cut = len(tail) if cut < 0 else len(tail) - len(body) + cut
+            out = joke(starts[-1], tail[:cut])
+            # Nothing left to show: the reply as it came
+            out = out + tail[cut:] if kept else text[starts[0].start():]
+        if out:
+            yield out
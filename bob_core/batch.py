@@ -0,0 +1,389 @@
+"""Bulk generation from a JSONL or CSV file of jobs.
+
+    python -m bob_core.batch jobs.jsonl --output results.jsonl --concurrency 8
+
+Each job has a `mode` (jokes, roast, show, meme or team) and, depending on
+the mode, a `topic` or `name`, plus optional `context`, `style`,
+`intensity`, `temperature`, `max_tokens`, `count` (memes), `team_mode`
+(staged, two_stage, fused or auto) and `id`. Jobs
+are read lazily and at most a fixed window of them is in flight, so memory
+stays flat however long the file is. Results are appended to the output
+JSONL as they complete. A checkpoint next to the output records which jobs
+are done; `--resume` continues an interrupted run without redoing them.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import config
+from .prompts import joke_messages, roast_messages, show_messages
+from .telemetry import collect_usage, labels
+
+MODES = ("jokes", "roast", "show", "meme", "team")
+TEXT_MODES = ("jokes", "roast", "show")
+
+DEFAULTS = config.DEFAULT_SETTINGS
+
+# Jobs may finish out of order; past this many jobs beyond the oldest unfinished one, stop submitting
+WINDOW_PER_WORKER = 32
+CHECKPOINT_INTERVAL = 2.0
+LATENCY_SAMPLES = 10000
+
+
+def read_jobs(path, file_format=None):
+    """Yield job dicts from a JSONL or CSV file, one at a time"""
+    file_format = file_format or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    with open(path, newline="", encoding="utf-8") as f:
+        if file_format == "csv":
+            for row in csv.DictReader(f):
+                yield {key: value for key, value in row.items() if key and value not in (None, "")}
+            return
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield {"_invalid": f"line {line_number}: {str(e)}"}
+
+
+def normalize_job(job, defaults):
+    """Job with defaults applied and numeric fields converted; raises ValueError if unusable"""
+    if "_invalid" in job:
+        raise ValueError(f"Invalid JSON on {job['_invalid']}")
+    job = {**defaults, **job}
+    mode = str(job.get("mode", "")).strip().lower()
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {job.get('mode')!r}; expected one of {', '.join(MODES)}")
+    job["mode"] = mode
+    job["intensity"] = int(job["intensity"])
+    job["temperature"] = float(job["temperature"])
+    job["max_tokens"] = int(job["max_tokens"])
+    job["count"] = int(job["count"])
+    subject = job.get("name") if mode == "roast" else job.get("topic")
+    if mode != "show" and not str(subject or "").strip():
+        raise ValueError(f"{mode} job needs a {'name' if mode == 'roast' else 'topic'}")
+    return job
+
+
+def job_messages(job):
+    """Chat messages for a jokes, roast or show job"""
+    style, intensity = job["style"], job["intensity"]
+    if job["mode"] == "jokes":
+        return joke_messages(job["topic"], style, intensity)
+    if job["mode"] == "roast":
+        return roast_messages(job["name"], job.get("context", ""), style, intensity)
+    return show_messages(style, intensity)
+
+
+def run_job(engine, job):
+    """Generate one job's content; returns (output, served model)"""
+    mode = job["mode"]
+    style, intensity, temperature = job["style"], job["intensity"], job["temperature"]
+    if mode in TEXT_MODES:
+        max_tokens = engine.output_budget(mode, job["max_tokens"])
+        completion = engine.record_output(engine.safe_completion_create(
+            messages=job_messages(job),
+            model=job.get("model") or config.DEFAULT_MODEL,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            top_p=0.9
+        ), mode, max_tokens)
+        return completion.choices[0].message.content, completion.model
+    if mode == "meme":
+        specs = engine.request_meme_specs(job["topic"], style, intensity, job["count"], temperature, job["max_tokens"])
+        return [spec for spec in specs if spec], config.DEFAULT_MODEL
+    result = engine.generate_team_comedy(job["topic"], style, intensity, temperature, mode=job.get("team_mode"))
+    if result["error"]:
+        raise RuntimeError(result["error"])
+    return {
+        "final_joke": result["final_joke"],
+        "development_stages": result["development_stages"],
+        "timings": result["timings"]
+    }, None
+
+
+def execute(engine, index, job_id, raw_job, defaults):
+    """Run one job and build its output record; never raises"""
+    started = time.perf_counter()
+    record = {"id": job_id, "index": index, "input": raw_job, "output": None, "model": None, "error": None}
+    with collect_usage() as usage:
+        try:
+            job = normalize_job(raw_job, defaults)
+            record["mode"] = job["mode"]
+            with labels(tab=f"batch:{job['mode']}"):
+                record["output"], record["model"] = run_job(engine, job)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {str(e)}"
+    record.update(
+        latency=time.perf_counter() - started,
+        calls=usage.calls,
+        prompt_tokens=usage.prompt_tokens,
+        completion_tokens=usage.completion_tokens,
+        cost=usage.cost
+    )
+    return record
+
+
+class Checkpoint:
+    """Which jobs are done: every index below `watermark`, plus `done` above it.
+
+    `output_offset` is the output size when the checkpoint was written;
+    results appended after it are recovered from the output on resume.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.watermark = 0
+        self.done = set()
+        self.output_offset = 0
+        self._written = 0.0
+
+    def load(self):
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.watermark = data["watermark"]
+        self.done = set(data["done"])
+        self.output_offset = data["output_offset"]
+
+    def mark(self, index):
+        self.done.add(index)
+        while self.watermark in self.done:
+            self.done.remove(self.watermark)
+            self.watermark += 1
+
+    def is_done(self, index):
+        return index < self.watermark or index in self.done
+
+    def save(self, output_offset, force=False):
+        now = time.monotonic()
+        if not force and now - self._written < CHECKPOINT_INTERVAL:
+            return
+        self._written = now
+        self.output_offset = output_offset
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "watermark": self.watermark,
+                "done": sorted(self.done),
+                "output_offset": output_offset
+            }, f)
+        os.replace(temp_path, self.path)
+
+
+def recover_output(output_path, checkpoint):
+    """Mark results written after the last checkpoint as done and drop a torn last line"""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, "r+b") as f:
+        f.seek(checkpoint.output_offset)
+        good_end = checkpoint.output_offset
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                checkpoint.mark(json.loads(line)["index"])
+            except (ValueError, KeyError):
+                break
+            good_end += len(line)
+        f.truncate(good_end)
+
+
+class BatchStats:
+    """Running totals with a bounded latency sample for percentiles"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.latencies = []
+        self._seen = 0
+        self._random = random.Random(0)
+
+    def add(self, record):
+        self.completed += 1
+        self.failed += int(record["error"] is not None)
+        self.calls += record["calls"]
+        self.prompt_tokens += record["prompt_tokens"]
+        self.completion_tokens += record["completion_tokens"]
+        self.cost += record["cost"]
+        # Reservoir sampling keeps the percentile estimate in constant memory
+        self._seen += 1
+        if len(self.latencies) < LATENCY_SAMPLES:
+            self.latencies.append(record["latency"])
+        else:
+            slot = self._random.randrange(self._seen)
+            if slot < LATENCY_SAMPLES:
+                self.latencies[slot] = record["latency"]
+
+    def summary(self):
+        wall = time.perf_counter() - self.started
+        ordered = sorted(self.latencies)
+
+        def percentile(fraction):
+            return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else None
+
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "wall_time": wall,
+            "jobs_per_second": self.completed / wall if wall else 0.0,
+            "p50_latency": percentile(0.5),
+            "p95_latency": percentile(0.95),
+            "p99_latency": percentile(0.99),
+            "upstream_calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "tokens_per_second": (self.prompt_tokens + self.completion_tokens) / wall if wall else 0.0,
+            "cost_usd": round(self.cost, 6)
+        }
+
+
+def run_batch(engine, jobs, output_path, concurrency=8, defaults=None, resume=False, progress=None):
+    """Run `jobs` (an iterable of dicts) and append one result per job to `output_path`.
+
+    Returns the summary dict. `progress(stats)` is called every few seconds.
+    """
+    defaults = {**DEFAULTS, **(defaults or {})}
+    checkpoint = Checkpoint(f"{output_path}.checkpoint")
+    if resume and os.path.exists(checkpoint.path):
+        checkpoint.load()
+        recover_output(output_path, checkpoint)
+    elif resume and os.path.exists(output_path):
+        raise ValueError(f"{output_path} exists but has no checkpoint to resume from")
+
+    stats = BatchStats()
+    window = max(concurrency * WINDOW_PER_WORKER, concurrency)
+    pending = {}
+    last_progress = time.monotonic()
+
+    with open(output_path, "ab" if resume else "wb") as out, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+
+        def drain(block):
+            nonlocal last_progress
+            if not pending:
+                return
+            done, _ = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                record = future.result()
+                out.write((json.dumps(record, default=str) + "\n").encode("utf-8"))
+                stats.add(record)
+                checkpoint.mark(index)
+            out.flush()
+            checkpoint.save(out.tell())
+            if progress and time.monotonic() - last_progress >= 5:
+                last_progress = time.monotonic()
+                progress(stats)
+
+        try:
+            for index, job in enumerate(jobs):
+                if checkpoint.is_done(index):
+                    stats.skipped += 1
+                    continue
+                # Bound both in-flight jobs and finished-out-of-order indexes held by the checkpoint
+                while len(pending) >= concurrency * 2 or (pending and index - checkpoint.watermark >= window):
+                    drain(block=True)
+                job_id = job.get("id", index) if isinstance(job, dict) else index
+                pending[pool.submit(execute, engine, index, job_id, job, defaults)] = index
+                drain(block=False)
+            while pending:
+                drain(block=True)
+        finally:
+            out.flush()
+            checkpoint.save(out.tell(), force=True)
+    return stats.summary()
+
+
+def print_summary(summary, file=sys.stderr):
+    def fmt(value):
+        return "-" if value is None else f"{value:.2f}s"
+
+    print(
+        f"\n{summary['completed']} jobs in {summary['wall_time']:.1f}s "
+        f"({summary['jobs_per_second']:.2f} jobs/s), {summary['failed']} failed, "
+        f"{summary['skipped']} skipped as already done",
+        file=file
+    )
+    print(
+        f"Latency p50 {fmt(summary['p50_latency'])} · p95 {fmt(summary['p95_latency'])} · "
+        f"p99 {fmt(summary['p99_latency'])}",
+        file=file
+    )
+    print(
+        f"Tokens {summary['prompt_tokens']} prompt + {summary['completion_tokens']} completion "
+        f"({summary['tokens_per_second']:.0f}/s) over {summary['upstream_calls']} upstream calls, "
+        f"est. ${summary['cost_usd']:.4f}",
+        file=file
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate jokes, roasts, shows, memes or team jokes for a file of jobs")
+    parser.add_argument("jobs", help="JSONL or CSV file with one job per line/row")
+    parser.add_argument("--output", "-o", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="Input format (default: from the file extension)")
+    parser.add_argument("--concurrency", "-c", type=int, default=8, help="Jobs run at the same time")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run from its checkpoint")
+    parser.add_argument("--style", default=DEFAULTS["style"], help="Default comedy style")
+    parser.add_argument("--intensity", type=int, default=DEFAULTS["intensity"], help="Default intensity (1-5)")
+    parser.add_argument("--temperature", type=float, default=DEFAULTS["temperature"], help="Default temperature")
+    parser.add_argument("--max-tokens", type=int, default=DEFAULTS["max_tokens"], help="Default response length")
+    parser.add_argument("--count", type=int, default=DEFAULTS["count"], help="Default memes per meme job")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    from .engine import ComedyEngine
+
+    load_dotenv()
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        parser.error("GROQ_API_KEY is not set")
+    if os.path.exists(args.output) and not args.resume:
+        parser.error(f"{args.output} already exists; pass --resume to continue it or choose another output")
+
+    defaults = {
+        "style": args.style,
+        "intensity": args.intensity,
+        "temperature": args.temperature,
+        "max_tokens": args.max_tokens,
+        "count": args.count
+    }
+
+    def progress(stats):
+        print(f"{stats.completed} done ({stats.failed} failed), {stats.completed / (time.perf_counter() - stats.started):.2f} jobs/s", file=sys.stderr)
+
+    engine = ComedyEngine(api_key=api_key, prewarm=False)
+    try:
+        summary = run_batch(
+            engine,
+            read_jobs(args.jobs, args.format),
+            args.output,
+            concurrency=args.concurrency,
+            defaults=defaults,
+            resume=args.resume,
+            progress=progress
+        )
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; rerun with --resume to continue from {args.output}.checkpoint", file=sys.stderr)
+        return 130
+    print_summary(summary)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""Per-mode output budgets learned from the replies each mode actually gets.
+
+The Response Length slider is an upper bound, not what a mode needs: three
+jokes or a roast rarely take more than a couple hundred tokens, and a
+larger max_tokens only lets the model ramble on and holds more of the
+rate-limit budget while the request runs. Completion tokens are recorded
+per mode (from `usage`, or estimated from the text of a stream that was
+stopped early); once a mode has enough samples, its max_tokens becomes a
+high percentile of them plus headroom, never more than the caller asked
+for. A reply that ran into its limit counts as having needed twice as
+much, so a budget that turns out too tight grows back quickly.
+
+Budgets are rounded up to a few fixed steps, so they rarely change and
+requests keep hitting the same response-cache keys.
+"""
+import math
+import threading
+from collections import deque
+
+BUDGET_STEPS = (64, 96, 128, 192, 256, 384, 512, 768, 1024, 1536, 2048)
+
+
+def _step(tokens):
+    for step in BUDGET_STEPS:
+        if tokens <= step:
+            return step
+    return int(math.ceil(tokens / 512.0)) * 512
+
+
+class _ModeStats:
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.replies = 0
+        self.tokens = 0
+        self.truncated = 0
+        self.stopped = 0
+        self.budget = None
+
+
+class OutputBudget:
+    """Learned max_tokens per mode; budgets are per item for modes that ask for several at once (memes)"""
+
+    def __init__(self, percentile=0.95, headroom=1.3, min_samples=5, window=200, floor=64):
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.floor = floor
+        self._window = window
+        self._lock = threading.Lock()
+        self._modes = {}
+
+    def _mode(self, mode):
+        stats = self._modes.get(mode)
+        if stats is None:
+            stats = self._modes[mode] = _ModeStats(self._window)
+        return stats
+
+    def _per_item(self, stats):
+        ordered = sorted(stats.samples)
+        return ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))] * self.headroom
+
+    def max_tokens(self, mode, requested, items=1):
+        """max_tokens to send for a request of `items` in `mode` that asked for `requested`"""
+        with self._lock:
+            stats = self._mode(mode)
+            if len(stats.samples) < self.min_samples:
+                return requested
+            stats.budget = min(int(requested), max(self.floor, _step(self._per_item(stats) * items)))
+            return stats.budget
+
+    def record(self, mode, tokens, truncated=False, stopped=False, items=1):
+        """Completion tokens of a reply of `items`; `truncated` if it hit max_tokens, `stopped` if it was cut early on purpose"""
+        with self._lock:
+            stats = self._mode(mode)
+            stats.replies += 1
+            stats.tokens += tokens
+            stats.truncated += int(truncated)
+            stats.stopped += int(stopped)
+            per_item = tokens / max(1, items)
+            stats.samples.append(per_item * 2 if truncated else per_item)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                mode: {
+                    "replies": stats.replies,
+                    "mean_tokens": round(stats.tokens / stats.replies, 1) if stats.replies else None,
+                    "p95_tokens_per_item": round(self._per_item(stats) / self.headroom, 1) if stats.samples else None,
+                    "budget": stats.budget,
+                    "truncated": stats.truncated,
+                    "stopped_early": stats.stopped
+                }
+                for mode, stats in sorted(self._modes.items())
+            }
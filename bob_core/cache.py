@@ -0,0 +1,226 @@
+"""Two-tier response cache for chat completions.
+
+A bounded in-process LRU (with TTL) sits in front of a SQLite table that
+survives restarts. Every key can hold up to K variants of a response; once a
+key is full, lookups rotate through the variants so high-temperature modes
+don't keep serving the same joke.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def _normalize_messages(messages):
+    normalized = []
+    for msg in messages:
+        content = msg.get("content")
+        if content is not None:
+            # Prompts are f-strings full of indentation; whitespace never changes meaning
+            content = " ".join(str(content).split())
+        normalized.append({"role": msg.get("role"), "content": content})
+    return normalized
+
+
+def make_cache_key(model, messages, temperature, max_tokens, **kwargs):
+    """Build a stable key for a completion request"""
+    payload = {
+        "model": model,
+        "messages": _normalize_messages(messages),
+        "temperature": round(float(temperature), 3),
+        "max_tokens": int(max_tokens),
+        "kwargs": kwargs,
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cache_variants_for(temperature, max_variants):
+    """Number of variants to keep for a request: 1 at temperature 0, up to max_variants at 1.0"""
+    return max(1, min(max_variants, round(max_variants * float(temperature))))
+
+
+class MemoryLRU:
+    """Bounded LRU of variant lists with a per-entry TTL"""
+
+    def __init__(self, maxsize=512, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> [expires_at, variants, cursor]
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key, variants, cursor=0):
+        self._entries[key] = [time.time() + self.ttl, variants, cursor]
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteTier:
+    """Persistent variant store; each row is one variant of one key"""
+
+    def __init__(self, path, ttl=86400):
+        self.ttl = ttl
+        # Service workers share the file; wait out each other's write locks instead of failing
+        self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT NOT NULL,
+                created REAL NOT NULL,
+                payload TEXT NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_key ON responses (key, created)")
+        self._conn.commit()
+
+    def get(self, key):
+        rows = self._conn.execute(
+            "SELECT payload FROM responses WHERE key = ? AND created >= ? ORDER BY created",
+            (key, time.time() - self.ttl),
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def add(self, key, payload, keep):
+        now = time.time()
+        self._conn.execute(
+            "INSERT INTO responses (key, created, payload) VALUES (?, ?, ?)",
+            (key, now, json.dumps(payload)),
+        )
+        # Keep only the newest `keep` variants and drop anything past the TTL
+        self._conn.execute(
+            """DELETE FROM responses WHERE key = ? AND rowid NOT IN (
+                SELECT rowid FROM responses WHERE key = ? ORDER BY created DESC LIMIT ?
+            )""",
+            (key, key, keep),
+        )
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        self._conn.commit()
+
+    def count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+class ResponseCache:
+    """Memory LRU + optional SQLite tier with hit/miss/eviction counters.
+
+    Payloads must be JSON-serializable. Pass path=None to run memory-only.
+    """
+
+    def __init__(self, path=None, maxsize=512, ttl=3600, disk_ttl=86400):
+        self._lock = threading.Lock()
+        self.memory = MemoryLRU(maxsize=maxsize, ttl=ttl)
+        self.disk = None
+        if path:
+            try:
+                self.disk = SQLiteTier(path, ttl=disk_ttl)
+            except sqlite3.Error:
+                # A broken or read-only cache file shouldn't take the app down
+                self.disk = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.disk_errors = 0
+
+    def _load(self, key, variants=1):
+        """The key's entry, from memory unless it was evicted or holds fewer than `variants` there.
+
+        The disk may hold more: an evicted key keeps its variants on disk, and
+        other processes sharing the file add theirs.
+        """
+        entry = self.memory.get(key)
+        if entry is not None and len(entry[1]) >= variants:
+            return entry, "memory"
+        memory = (entry, "memory") if entry is not None else (None, None)
+        if self.disk is None:
+            return memory
+        try:
+            stored = self.disk.get(key)
+        except sqlite3.Error:
+            self.disk_errors += 1
+            return memory
+        if len(stored) <= (len(entry[1]) if entry is not None else 0):
+            return memory
+        self.memory.set(key, stored, entry[2] if entry is not None else 0)
+        return self.memory.get(key), "disk"
+
+    def get(self, key, variants=1):
+        """Return a cached payload, or None when the caller should generate a new one.
+
+        A key counts as a miss until it holds `variants` payloads, so the cache
+        fills up with distinct responses before it starts rotating through them.
+        """
+        with self._lock:
+            entry, tier = self._load(key, variants)
+            if entry is None or len(entry[1]) < variants:
+                self.misses += 1
+                return None
+            stored = entry[1]
+            cursor = entry[2] % len(stored)
+            entry[2] = cursor + 1
+            if tier == "memory":
+                self.memory_hits += 1
+            else:
+                self.disk_hits += 1
+            return stored[cursor]
+
+    def put(self, key, payload, variants=1):
+        with self._lock:
+            # Appends to the variants already on disk if the key was evicted from memory
+            entry, _ = self._load(key)
+            stored = list(entry[1]) if entry is not None else []
+            cursor = entry[2] if entry is not None else 0
+            stored.append(payload)
+            stored = stored[-variants:]
+            self.memory.set(key, stored, cursor)
+            self.writes += 1
+            if self.disk is not None:
+                try:
+                    self.disk.add(key, payload, keep=variants)
+                except sqlite3.Error:
+                    self.disk_errors += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            disk_entries = None
+            if self.disk is not None:
+                try:
+                    disk_entries = self.disk.count()
+                except sqlite3.Error:
+                    self.disk_errors += 1
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.memory.evictions,
+                "expirations": self.memory.expirations,
+                "memory_entries": len(self.memory),
+                "memory_maxsize": self.memory.maxsize,
+                "disk_entries": disk_entries,
+                "disk_errors": self.disk_errors,
+            }
@@ -0,0 +1,40 @@
+"""Pooled AsyncGroq clients.
+
+An httpx connection pool belongs to the event loop it was created on, so
+clients are kept per loop: the engine's own loop thread and an ASGI
+server's loop each get theirs, and requests on a loop are spread
+round-robin over its clients.
+"""
+import asyncio
+import itertools
+import threading
+import weakref
+
+
+class AsyncClientPool:
+    """Round-robin AsyncGroq clients for the running event loop, created on first use"""
+
+    def __init__(self, api_key, size=1, **client_kwargs):
+        self.api_key = api_key
+        self.size = max(1, size)
+        self.client_kwargs = client_kwargs
+        self._lock = threading.Lock()
+        self._by_loop = weakref.WeakKeyDictionary()
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._by_loop.get(loop)
+            if entry is None:
+                from groq import AsyncGroq
+
+                clients = [AsyncGroq(api_key=self.api_key, **self.client_kwargs) for _ in range(self.size)]
+                entry = self._by_loop[loop] = (clients, itertools.cycle(clients))
+            return next(entry[1])
+
+    async def aclose(self):
+        """Close the clients of the running loop"""
+        with self._lock:
+            entry = self._by_loop.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await asyncio.gather(*(client.close() for client in entry[0]), return_exceptions=True)
@@ -0,0 +1,227 @@
+"""Single-flight request coalescing across sessions.
+
+Identical requests that arrive while one is already in flight attach to it
+instead of calling the API again. Plain calls share the leader's result;
+streams are fanned out so every session receives the same tokens, replaying
+whatever it missed. Followers give up on a stuck leader after a timeout.
+"""
+import threading
+import time
+
+from .streaming import StreamAbandoned, TokenStream
+
+_END = object()
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class StreamBroadcast:
+    """Fan one text stream out to any number of readers.
+
+    Readers pull from the source cooperatively: whoever needs the next chunk
+    and finds nobody else pulling advances the source, so the stream keeps
+    going even if the session that started it goes away. Once every reader
+    has gone, an unfinished source is closed.
+    """
+
+    def __init__(self, source, timeout):
+        self.source = source
+        self.timeout = timeout
+        self._iter = iter(source)
+        self._chunks = []
+        self._finished = False
+        self._error = None
+        self._pulling = False
+        self._cond = threading.Condition()
+        # Readers that haven't finished or given up yet
+        self.readers = 0
+
+    @property
+    def finished(self):
+        return self._finished or self._error is not None
+
+    def _chunk(self, index):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if index < len(self._chunks):
+                    return self._chunks[index]
+                if self._error is not None:
+                    raise self._error
+                if self._finished:
+                    return _END
+                if not self._pulling:
+                    self._pulling = True
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No tokens from the shared stream for {self.timeout:.0f}s")
+                self._cond.wait(remaining)
+        try:
+            chunk = next(self._iter)
+        except StopIteration:
+            with self._cond:
+                self._finished = True
+            return _END
+        except Exception as e:
+            with self._cond:
+                self._error = e
+            raise
+        else:
+            with self._cond:
+                self._chunks.append(chunk)
+            return chunk
+        finally:
+            with self._cond:
+                self._pulling = False
+                self._cond.notify_all()
+
+    def reader(self):
+        with self._cond:
+            self.readers += 1
+        return BroadcastReader(self)
+
+    def release(self):
+        """Drop one reader; returns True if it was the last one"""
+        with self._cond:
+            self.readers -= 1
+            return self.readers == 0
+
+    def close(self):
+        """Stop an unfinished source nobody reads any more, releasing its upstream response"""
+        with self._cond:
+            if self.finished:
+                return
+            self._error = StreamAbandoned("Every reader left the shared stream")
+            self._cond.notify_all()
+        try:
+            self._iter.close()
+        except (AttributeError, ValueError):
+            # Not a generator, or a pull is still running; it ends on its own
+            pass
+
+
+class BroadcastReader:
+    def __init__(self, broadcast):
+        self._broadcast = broadcast
+        self._released = False
+
+    def release(self):
+        """Stop reading; returns True if this was the broadcast's last reader"""
+        if self._released:
+            return False
+        self._released = True
+        return self._broadcast.release()
+
+    @property
+    def served_model(self):
+        return self._broadcast.source.model
+
+    def __iter__(self):
+        index = 0
+        while True:
+            chunk = self._broadcast._chunk(index)
+            if chunk is _END:
+                return
+            index += 1
+            yield chunk
+
+
+class SingleFlight:
+    """Process-wide registry of in-flight calls keyed by request"""
+
+    def __init__(self, timeout=60.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._streams = {}
+        self.leaders = 0
+        self.followers = 0
+        self.follower_timeouts = 0
+
+    def do(self, key, fn):
+        """Run `fn()` once for all concurrent callers with the same key.
+
+        A follower that waits longer than the timeout stops waiting and runs
+        `fn()` itself.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+                self.leaders += 1
+            else:
+                flight.waiters += 1
+                self.followers += 1
+
+        if not leader:
+            if flight.done.wait(self.timeout):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
+            with self._lock:
+                self.follower_timeouts += 1
+            return fn()
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+
+    def stream(self, key, open_stream):
+        """TokenStream of the shared stream for `key`, starting it with `open_stream()` if needed"""
+        with self._lock:
+            broadcast = self._streams.get(key)
+            if broadcast is not None and broadcast.finished:
+                broadcast = None
+            leader = broadcast is None
+            if leader:
+                source = open_stream()
+                broadcast = self._streams[key] = StreamBroadcast(source, self.timeout)
+                self.leaders += 1
+            else:
+                self.followers += 1
+            reader = broadcast.reader()
+
+        def forget(_token_stream, _error):
+            # Runs however the reader ends, so an abandoned stream doesn't stay registered or open
+            with self._lock:
+                last = reader.release()
+                if (last or broadcast.finished) and self._streams.get(key) is broadcast:
+                    del self._streams[key]
+            if last:
+                broadcast.close()
+
+        token_stream = TokenStream(lambda _model: reader, [broadcast.source.requested_model])
+        token_stream.add_listener(forget)
+        token_stream.source = broadcast.source
+        token_stream.coalesced = not leader
+        return token_stream
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "follower_timeouts": self.follower_timeouts,
+                "in_flight": {
+                    str(key): flight.waiters for key, flight in self._flights.items()
+                },
+                "streams_in_flight": {
+                    str(key): broadcast.readers for key, broadcast in self._streams.items()
+                }
+            }
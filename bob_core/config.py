@@ -0,0 +1,116 @@
+"""Models and tuning knobs, read once from BOB_* environment variables."""
+import json
+import os
+
+# Define fallback models if primary models are unavailable
+# Chains are followed hop by hop (e.g. mistral -> llama3-8b -> llama-3.1-8b)
+FALLBACK_MODELS = {
+    "mistral-saba-24b": "llama3-8b-8192",       # Fallback to Llama if Mistral is unavailable
+    "llama-3.3-70b-versatile": "llama3-8b-8192", # Fallback to smaller Llama if larger is unavailable
+    "llama3-70b-8192": "llama-3.3-70b-versatile", # Comedy Team refiner
+    "llama3-8b-8192": "llama-3.1-8b-instant"    # Last hop for every chain
+}
+
+# Updated primary model to use
+DEFAULT_MODEL = "mistral-saba-24b"  # New replacement for mixtral-8x7b-32768
+HIGH_QUALITY_MODEL = "llama-3.3-70b-versatile"
+FAST_MODEL = "llama3-8b-8192"
+
+# Define model assignments for each role
+TEAM_MODEL_ASSIGNMENTS = {
+    "writer": "llama3-8b-8192",      # Fast, creative setup generation
+    "roaster": DEFAULT_MODEL, # Strong reasoning for punchlines
+    "refiner": "llama3-70b-8192",    # High-quality output refinement
+    "fused": HIGH_QUALITY_MODEL      # Whole team in one JSON call (fused mode)
+}
+
+# Starting values of the sidebar settings (also the batch and API defaults)
+DEFAULT_SETTINGS = {
+    "style": "Savage Roast",
+    "intensity": 3,
+    "temperature": 0.9,
+    "max_tokens": 500,
+    "count": 2
+}
+
+# Response cache settings (set BOB_CACHE_PATH to an empty string for memory-only)
+CACHE_PATH = os.getenv("BOB_CACHE_PATH", ".bob_cache.sqlite3")
+CACHE_SIZE = int(os.getenv("BOB_CACHE_SIZE", "512"))
+CACHE_TTL = int(os.getenv("BOB_CACHE_TTL", "3600"))
+CACHE_DISK_TTL = int(os.getenv("BOB_CACHE_DISK_TTL", "86400"))
+CACHE_VARIANTS = int(os.getenv("BOB_CACHE_VARIANTS", "3"))
+
+# Circuit breaker settings for model routing
+ROUTER_WINDOW = int(os.getenv("BOB_ROUTER_WINDOW", "60"))
+ROUTER_FAILURE_THRESHOLD = float(os.getenv("BOB_ROUTER_FAILURE_THRESHOLD", "0.5"))
+ROUTER_MIN_REQUESTS = int(os.getenv("BOB_ROUTER_MIN_REQUESTS", "4"))
+ROUTER_COOLDOWN = int(os.getenv("BOB_ROUTER_COOLDOWN", "30"))
+
+# Per-model rate limits as JSON, e.g. {"llama3-8b-8192": [30, 30000]} (requests, tokens per minute)
+RATE_LIMITS = json.loads(os.getenv("BOB_RATE_LIMITS", "{}"))
+DEFAULT_RPM = int(os.getenv("BOB_DEFAULT_RPM", "30"))
+DEFAULT_TPM = int(os.getenv("BOB_DEFAULT_TPM", "30000"))
+MAX_QUEUE_SECONDS = float(os.getenv("BOB_MAX_QUEUE_SECONDS", "60"))
+# Fraction of the limits above this process may use; the HTTP service sets 1/workers
+RATE_LIMIT_SHARE = float(os.getenv("BOB_RATE_LIMIT_SHARE", "1"))
+
+# Hedged requests: if the primary is slower than its recent p95, race the fallback/fast model
+HEDGING = os.getenv("BOB_HEDGING", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("BOB_HEDGE_PERCENTILE", "0.95"))
+HEDGE_BUDGET = float(os.getenv("BOB_HEDGE_BUDGET", "0.05"))
+
+# AsyncGroq clients per event loop, used round-robin by async calls
+ASYNC_CLIENTS = int(os.getenv("BOB_ASYNC_CLIENTS", "2"))
+
+# Followers stop waiting on a stuck in-flight request after this many seconds
+COALESCE_TIMEOUT = float(os.getenv("BOB_COALESCE_TIMEOUT", "60"))
+
+# Prewarmed pool of ready-made jokes and memes for hot topics (spends tokens in the background)
+PREWARM = os.getenv("BOB_PREWARM", "0") == "1"
+PREWARM_TOPICS = [topic.strip() for topic in os.getenv("BOB_PREWARM_TOPICS", "").split(",") if topic.strip()]
+PREWARM_LOW = int(os.getenv("BOB_PREWARM_LOW", "2"))
+PREWARM_HIGH = int(os.getenv("BOB_PREWARM_HIGH", "4"))
+PREWARM_TOKENS_PER_MINUTE = int(os.getenv("BOB_PREWARM_TOKENS_PER_MINUTE", "20000"))
+PREWARM_MIN_REQUESTS = int(os.getenv("BOB_PREWARM_MIN_REQUESTS", "3"))
+PREWARM_IDLE = float(os.getenv("BOB_PREWARM_IDLE", "1800"))
+PREWARM_MAX_KEYS = int(os.getenv("BOB_PREWARM_MAX_KEYS", "32"))
+
+# Archive of every joke, roast and meme, served for similar topics (empty BOB_ARCHIVE_PATH turns it off)
+ARCHIVE_PATH = os.getenv("BOB_ARCHIVE_PATH", ".bob_archive.sqlite3")
+ARCHIVE_SERVE = os.getenv("BOB_ARCHIVE_SERVE", "1") == "1"
+ARCHIVE_SIMILARITY = float(os.getenv("BOB_ARCHIVE_SIMILARITY", "0.4"))
+ARCHIVE_MIN_ITEMS = int(os.getenv("BOB_ARCHIVE_MIN_ITEMS", "6"))
+ARCHIVE_MAX_SERVES = int(os.getenv("BOB_ARCHIVE_MAX_SERVES", "1"))
+
+# max_tokens per mode learned from the replies it gets, never above the Response Length slider
+OUTPUT_BUDGET = os.getenv("BOB_OUTPUT_BUDGET", "1") == "1"
+OUTPUT_BUDGET_MIN_SAMPLES = int(os.getenv("BOB_OUTPUT_BUDGET_MIN_SAMPLES", "5"))
+OUTPUT_BUDGET_HEADROOM = float(os.getenv("BOB_OUTPUT_BUDGET_HEADROOM", "1.3"))
+# End streams once the reply is structurally complete (every joke written, the meme JSON closed)
+EARLY_STOP = os.getenv("BOB_EARLY_STOP", "1") == "1"
+
+# Per-call spans go to a rotating JSONL file (empty BOB_SPAN_LOG keeps them in memory only)
+SPAN_LOG = os.getenv("BOB_SPAN_LOG", ".bob_spans.jsonl")
+SPAN_LOG_MAX_BYTES = int(os.getenv("BOB_SPAN_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+SPAN_RING_SIZE = int(os.getenv("BOB_SPAN_RING_SIZE", "2000"))
+
+# Memes are drawn locally from the bundled templates; "remote" keeps the old memegen.link URLs
+MEME_RENDERER = os.getenv("BOB_MEME_RENDERER", "local")
+MEME_FORMAT = os.getenv("BOB_MEME_FORMAT", "PNG")
+
+# Batched meme generation settings
+MEME_TOKENS_PER_ITEM = 150
+MEME_RENDER_WORKERS = int(os.getenv("BOB_MEME_RENDER_WORKERS", "5"))
+
+# Segmented comedy show: segments planned in one call, then written in parallel
+SHOW_SEGMENTED = os.getenv("BOB_SHOW_SEGMENTED", "0") == "1"
+SHOW_SEGMENTS = int(os.getenv("BOB_SHOW_SEGMENTS", "5"))
+SHOW_OUTLINE_TOKENS_PER_SEGMENT = 60
+SHOW_TRANSITION_TOKENS = 80
+
+# Max in-flight calls per team stage when running many topics
+TEAM_STAGE_CONCURRENCY = int(os.getenv("BOB_TEAM_STAGE_CONCURRENCY", "4"))
+
+# Comedy Team execution: staged (3 calls), two_stage, fused (1 call) or auto (best that fits the budget)
+TEAM_MODE = os.getenv("BOB_TEAM_MODE", "staged")
+TEAM_LATENCY_BUDGET = float(os.getenv("BOB_TEAM_LATENCY_BUDGET", "6"))
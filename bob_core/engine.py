@@ -0,0 +1,1212 @@
+"""Headless core of Bob Buster: every completion, team and meme call.
+
+ComedyEngine owns the process-wide pieces (pooled Groq clients, response
+cache, router, scheduler, hedger, single-flight registry, tracer, meme
+renderer) and has no Streamlit dependency, so it can be driven from the
+app, a CLI, a service or tests. Heavy modules (groq, PIL) are
+imported on first use.
+
+Who is calling is carried in a contextvar set with `set_caller()`: the
+session used for fair queueing and a callback shown when a fallback model
+answers. Contextvars follow the call into hedge threads and async tasks.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from . import config
+from .budget import OutputBudget
+from .cache import ResponseCache, cache_variants_for, make_cache_key
+from .clients import AsyncClientPool
+from .coalesce import SingleFlight
+from .hedging import Hedger, LatencyHistogram
+from .jsonstream import repair_json
+from .prompts import (
+    JOKE_COUNT,
+    create_comedy_team_prompt,
+    create_system_prompt,
+    generate_meme_prompt,
+    joke_messages,
+    roast_messages,
+    show_messages,
+    show_outline_messages,
+    show_segment_messages,
+    show_transition_messages
+)
+from .routing import ModelRouter, async_call_with_routing, call_with_routing, is_model_failure
+from .scheduler import RateLimitScheduler, estimate_tokens, text_tokens
+from .streaming import AsyncTokenStream, PrimedStream, StreamMetricsLog, TokenStream
+from .team import MODE_PREFERENCE, STAGE_MAX_TOKENS, TEAM_MODES, run_team_pipeline
+from .telemetry import Tracer, current_span, labels
+
+log = logging.getLogger(__name__)
+
+_caller = contextvars.ContextVar("bob_caller", default={})
+
+FALLBACK_MEME = {
+    "top_text": "When the meme",
+    "bottom_text": "Doesn't generate properly",
+    "meme_template": "drake",
+    "description": "Fallback meme"
+}
+
+
+def set_caller(session=None, on_fallback=None):
+    """Identify the caller for this context: its session and an `on_fallback(model, fallback_model)` hook"""
+    _caller.set({"session": session, "on_fallback": on_fallback})
+
+
+def current_session_id():
+    return _caller.get().get("session")
+
+
+def notify_fallback(model, fallback_model):
+    on_fallback = _caller.get().get("on_fallback")
+    if on_fallback is not None:
+        on_fallback(model, fallback_model)
+    else:
+        log.warning("Primary model %s unavailable. Using fallback model %s.", model, fallback_model)
+
+
+def in_context(fn):
+    """Run fn in a worker thread with the caller's contextvars (span, labels, caller)"""
+    context = contextvars.copy_context()
+
+    def run():
+        return context.copy().run(fn)
+
+    return run
+
+
+# Helper function to validate API messages
+def validate_messages(messages):
+    """Ensure all message content fields are strings to prevent Groq API errors"""
+    for msg in messages:
+        if 'content' in msg and msg['content'] is not None and not isinstance(msg['content'], str):
+            msg['content'] = str(msg['content'])
+    return messages
+
+
+def record_attempt(reservation):
+    span = current_span()
+    if span is not None:
+        span.attempt(reservation.queue_time)
+
+
+def finish_stream_span(span, token_stream, error):
+    """Close a streaming span from the TokenStream the user read"""
+    # Coalesced readers wrap the leader's stream, which holds the upstream details
+    source = token_stream.source or token_stream
+    span.set(
+        model=token_stream.model,
+        cached=token_stream.cached,
+        coalesced=token_stream.coalesced,
+        time_to_first_token=token_stream.time_to_first_token
+    )
+    if not token_stream.cached and not token_stream.coalesced:
+        span.set(attempts=source.attempts, queue_time=source.queue_time)
+        span.set_usage(source.usage)
+    span.finish(error=error, latency=token_stream.total_time)
+
+
+def meme_request(topic, style, intensity, count, temperature, max_tokens, stream=False):
+    """Completion arguments for a request of `count` memes: JSON mode, or a plain stream the prompt asks to be JSON"""
+    request = {
+        "messages": [
+            {"role": "system", "content": create_system_prompt(style, intensity)},
+            {"role": "user", "content": generate_meme_prompt(topic, style, intensity, count)}
+        ],
+        "model": config.DEFAULT_MODEL,
+        "temperature": temperature,
+        "max_tokens": max(max_tokens, config.MEME_TOKENS_PER_ITEM * count)
+    }
+    if stream:
+        request["stream"] = True
+    else:
+        request["response_format"] = {"type": "json_object"}
+    return request
+
+
+def completion_json(chat_completion):
+    """Parsed JSON of a JSON-mode completion, repaired if it was cut off or slightly malformed; None if there is none"""
+    content = chat_completion.choices[0].message.content
+    try:
+        return json.loads(content)
+    except (TypeError, json.JSONDecodeError):
+        return repair_json(content)
+
+
+def keep_meme_retry(specs, index, retry):
+    # A retry that repeats an existing meme is no better than the fallback
+    if retry and all(retry["top_text"] != other["top_text"] for other in specs if other):
+        specs[index] = retry
+
+
+def streamed_completion(cache_key, token_stream):
+    """Chat completion payload for the cache from a finished stream"""
+    usage = token_stream.usage
+    return {
+        "id": f"stream-{cache_key[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": token_stream.model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": token_stream.text}
+        }],
+        "usage": usage.model_dump(mode="json") if usage is not None else None
+    }
+
+
+def estimated_usage(messages, text):
+    """Usage of a stream that was stopped early, which never gets Groq's usage chunk"""
+    from groq.types import CompletionUsage
+
+    prompt_tokens = estimate_tokens(messages, 0)
+    completion_tokens = text_tokens(text)
+    return CompletionUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens)
+
+
+def reply_tokens(usage, text):
+    """Completion tokens of a reply, estimated from its text when usage is missing"""
+    return getattr(usage, "completion_tokens", None) or text_tokens(text)
+
+
+def text_completion(text, model):
+    """Chat completion for text that didn't come from an API call (e.g. an archive hit)"""
+    from groq.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate({
+        "id": f"archive-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+        "usage": None
+    })
+
+
+def mark_reused(completion):
+    """Flag a completion served without a fresh upstream call (a cache hit or a coalesced follower)"""
+    # Set outside the pydantic fields so it never reaches model_dump() or the cache
+    object.__setattr__(completion, "reused", True)
+    return completion
+
+
+class _Relay:
+    """Chunk source that shows another TokenStream's text through `transform(chunks)`"""
+
+    def __init__(self, token_stream, transform):
+        self._token_stream = token_stream
+        self._inner = iter(token_stream)
+        self._chunks = transform(self._inner)
+
+    @property
+    def served_model(self):
+        return self._token_stream.model
+
+    def __iter__(self):
+        return self._chunks
+
+    def close(self):
+        self._chunks.close()
+        # Abandoning the shown stream abandons the one it reads
+        self._inner.close()
+
+
+class _StreamAttempts:
+    """Router slots and scheduler reservations of one streamed request, shared by the sync and async streams"""
+
+    def __init__(self, engine, messages, model, cache_key, variants):
+        self.router = engine.router
+        self.scheduler = engine.scheduler
+        self.cache = engine.cache
+        self.messages = messages
+        self.model = model
+        self.cache_key = cache_key
+        self.variants = variants
+        self.models = self.router.chain(model)
+        self.attempted = []
+        self.acquired = set()
+        self.reservations = {}
+        self.raced = []
+
+    def claim(self, stream_model):
+        # The last model is tried even with an open circuit if nothing else was
+        if self.attempted or stream_model != self.models[-1]:
+            self.router.acquire(stream_model)
+            self.acquired.add(stream_model)
+        self.attempted.append(stream_model)
+
+    def sent(self, stream_model, reservation):
+        # The scheduler settles failed sends; from here the stream owns the reservation
+        self.reservations[stream_model] = reservation
+
+    def refund(self, stream_model):
+        reservation = self.reservations.pop(stream_model, None)
+        if reservation is not None:
+            self.scheduler.refund(reservation)
+
+    def record(self, stream_model, elapsed, error):
+        if error is None:
+            self.router.record_success(stream_model, elapsed, requested_model=self.model)
+            return
+        if is_model_failure(error):
+            self.router.record_failure(stream_model, elapsed, error)
+        elif stream_model in self.acquired:
+            # A client error says nothing about the model; give back the slot it claimed
+            self.router.release(stream_model)
+        # A stream that failed before its first token used none of its tokens
+        self.refund(stream_model)
+
+    def on_attempt(self, stream_model, elapsed, error):
+        if self.raced:
+            # Both legs of the hedged race already recorded their outcomes
+            self.raced.clear()
+            return
+        self.record(stream_model, elapsed, error)
+
+    def on_loser(self, primed):
+        primed.close()
+        self.refund(primed.served_model)
+
+    def on_complete(self, token_stream):
+        if token_stream.usage is None and token_stream.stopped:
+            token_stream.usage = estimated_usage(self.messages, token_stream.text)
+        reservation = self.reservations.pop(token_stream.model, None)
+        if reservation is not None:
+            self.scheduler.settle(reservation, token_stream.usage)
+        if self.cache_key is not None:
+            self.cache.put(self.cache_key, streamed_completion(self.cache_key, token_stream), self.variants)
+
+    def on_end(self, token_stream, error):
+        if token_stream.finished_at is not None:
+            return
+        # Abandoned or failed after its first token: charge the prompt, since the usage chunk never came
+        reservation = self.reservations.pop(token_stream.model, None)
+        if reservation is not None:
+            self.scheduler.settle(reservation, token_stream.usage or estimated_usage(self.messages, ""))
+
+
+class ComedyEngine:
+    """Process-wide clients and shared state behind every completion call"""
+
+    def __init__(self, api_key, hedging=config.HEDGING, meme_renderer=config.MEME_RENDERER, prewarm=config.PREWARM):
+        self.api_key = api_key
+        self.hedging = hedging
+        self.meme_renderer_mode = meme_renderer
+        self.cache = ResponseCache(
+            path=config.CACHE_PATH or None,
+            maxsize=config.CACHE_SIZE,
+            ttl=config.CACHE_TTL,
+            disk_ttl=config.CACHE_DISK_TTL
+        )
+        self.router = ModelRouter(
+            config.FALLBACK_MODELS,
+            window_seconds=config.ROUTER_WINDOW,
+            failure_threshold=config.ROUTER_FAILURE_THRESHOLD,
+            min_requests=config.ROUTER_MIN_REQUESTS,
+            cooldown_seconds=config.ROUTER_COOLDOWN
+        )
+        self.scheduler = RateLimitScheduler(
+            limits={model: tuple(limit) for model, limit in config.RATE_LIMITS.items()},
+            default_rpm=config.DEFAULT_RPM,
+            default_tpm=config.DEFAULT_TPM,
+            max_queue_seconds=config.MAX_QUEUE_SECONDS,
+            share=config.RATE_LIMIT_SHARE
+        )
+        self.hedger = Hedger(percentile=config.HEDGE_PERCENTILE, budget_ratio=config.HEDGE_BUDGET)
+        self.single_flight = SingleFlight(timeout=config.COALESCE_TIMEOUT)
+        self.tracer = Tracer(
+            path=config.SPAN_LOG or None,
+            ring_size=config.SPAN_RING_SIZE,
+            max_bytes=config.SPAN_LOG_MAX_BYTES
+        )
+        self.stream_metrics = StreamMetricsLog()
+        self._lock = threading.Lock()
+        self._client = None
+        self.async_clients = AsyncClientPool(api_key, size=config.ASYNC_CLIENTS, max_retries=0)
+        self._loop = None
+        self._meme_renderer = None
+        self._meme_pool = None
+        self.prewarm = self._build_prewarm_pool() if prewarm else None
+        self.archive = self._open_archive()
+        self.budget = OutputBudget(
+            headroom=config.OUTPUT_BUDGET_HEADROOM,
+            min_samples=config.OUTPUT_BUDGET_MIN_SAMPLES
+        ) if config.OUTPUT_BUDGET else None
+        self._team_latency = {mode: LatencyHistogram(maxlen=64) for mode in TEAM_MODES}
+
+    # Pooled clients and lazily built resources
+
+    @property
+    def client(self):
+        """Groq client shared by every call (retries on 429 are left to the rate-limit scheduler)"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from groq import Groq
+                    self._client = Groq(api_key=self.api_key, max_retries=0)
+        return self._client
+
+    def _event_loop(self):
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="bob-engine-loop", daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def run_async(self, coro_fn):
+        """Run `coro_fn()` on the engine's event loop, in the caller's context, and wait for it"""
+        loop = self._event_loop()
+        done = concurrent.futures.Future()
+
+        def finish(task):
+            if task.cancelled():
+                done.cancel()
+            elif task.exception() is not None:
+                done.set_exception(task.exception())
+            else:
+                done.set_result(task.result())
+
+        def start():
+            loop.create_task(coro_fn()).add_done_callback(finish)
+
+        loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+        return done.result()
+
+    @property
+    def meme_renderer(self):
+        """Meme renderer with its template and output caches"""
+        if self._meme_renderer is None:
+            with self._lock:
+                if self._meme_renderer is None:
+                    from .memes import MemeRenderer
+                    self._meme_renderer = MemeRenderer(image_format=config.MEME_FORMAT)
+        return self._meme_renderer
+
+    @property
+    def meme_pool(self):
+        """Thread pool that renders meme images in parallel"""
+        if self._meme_pool is None:
+            with self._lock:
+                if self._meme_pool is None:
+                    self._meme_pool = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=config.MEME_RENDER_WORKERS, thread_name_prefix="meme"
+                    )
+        return self._meme_pool
+
+    def hedge_model_for(self, model):
+        hedge_model = config.FALLBACK_MODELS.get(model) or config.FAST_MODEL
+        return hedge_model if hedge_model != model else None
+
+    # Completions
+
+    def create_with_fallback(self, messages, model, temperature, max_tokens, **kwargs):
+        """Try to create a completion, routing around models whose circuit is open"""
+        scheduler = self.scheduler
+        tokens = estimate_tokens(messages, max_tokens)
+        session = current_session_id()
+
+        def call(candidate):
+            def send(reservation):
+                record_attempt(reservation)
+                raw = self.client.chat.completions.with_raw_response.create(
+                    messages=validate_messages(messages),
+                    model=candidate,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    **kwargs
+                )
+                scheduler.observe_headers(candidate, raw.headers)
+                return raw.parse()
+
+            return scheduler.call(candidate, tokens, send, session)
+
+        router = self.router
+        hedge_model = self.hedge_model_for(model)
+        if self.hedging and hedge_model:
+            return self.hedger.run(
+                (model, "complete"),
+                in_context(lambda: call_with_routing(router, model, call, on_fallback=notify_fallback)),
+                in_context(lambda: call_with_routing(router, hedge_model, call))
+            )
+        return call_with_routing(router, model, call, on_fallback=notify_fallback)
+
+    def safe_completion_create(self, messages, model, temperature, max_tokens, stream=False, **kwargs):
+        """Serve identical requests from the response cache, otherwise call Groq with fallback.
+
+        With stream=True a TokenStream of text deltas is returned instead of a completion.
+        Every call is recorded as a span.
+        """
+        if stream:
+            span = self.tracer.start(model, kind="stream")
+            try:
+                token_stream = self.open_completion_stream(messages, model, temperature, max_tokens, **kwargs)
+            except Exception as e:
+                span.finish(error=e)
+                raise
+            token_stream.add_listener(lambda finished, error: finish_stream_span(span, finished, error))
+            return token_stream
+
+        from groq.types.chat import ChatCompletion
+
+        with self.tracer.span(model) as span:
+            key = make_cache_key(model, messages, temperature, max_tokens, **kwargs)
+            variants = cache_variants_for(temperature, config.CACHE_VARIANTS)
+            cached = self.cache.get(key, variants)
+            if cached is not None:
+                completion = mark_reused(ChatCompletion.model_validate(cached))
+                span.set(model=completion.model, cached=True)
+                return completion
+
+            def create():
+                completion = self.create_with_fallback(messages, model, temperature, max_tokens, **kwargs)
+                self.cache.put(key, completion.model_dump(mode="json"), variants)
+                return completion
+
+            completion = self.single_flight.do(f"completion:{key}", create)
+            span.set(model=completion.model)
+            if span.record["attempts"]:
+                span.set_usage(completion.usage)
+            else:
+                # Another session's call produced this result and already counted its tokens
+                span.set(coalesced=True)
+                completion = mark_reused(completion.model_copy())
+            return completion
+
+    def open_completion_stream(self, messages, model, temperature, max_tokens, **kwargs):
+        """TokenStream for a request: replayed from the cache, joined to an identical stream, or new"""
+        key = make_cache_key(model, messages, temperature, max_tokens, **kwargs)
+        variants = cache_variants_for(temperature, config.CACHE_VARIANTS)
+        cached = self.cache.get(key, variants)
+        if cached is not None:
+            from groq.types.chat import ChatCompletion
+
+            completion = ChatCompletion.model_validate(cached)
+            token_stream = TokenStream.from_text(completion.choices[0].message.content, completion.model)
+            token_stream.cached = True
+            return token_stream
+
+        return self.single_flight.stream(
+            f"stream:{key}",
+            lambda: self.stream_with_fallback(messages, model, temperature, max_tokens, cache_key=key, variants=variants, **kwargs)
+        )
+
+    async def async_safe_completion_create(self, messages, model, temperature, max_tokens, **kwargs):
+        """Async counterpart of safe_completion_create; runs on the engine's event loop"""
+        with self.tracer.span(model) as span:
+            completion = await self._async_completion(messages, model, temperature, max_tokens, **kwargs)
+            span.set(model=completion.model, cached=span.record["attempts"] == 0)
+            if span.record["attempts"]:
+                span.set_usage(completion.usage)
+            return completion
+
+    async def _async_completion(self, messages, model, temperature, max_tokens, **kwargs):
+        from groq.types.chat import ChatCompletion
+
+        key = make_cache_key(model, messages, temperature, max_tokens, **kwargs)
+        variants = cache_variants_for(temperature, config.CACHE_VARIANTS)
+        cached = self.cache.get(key, variants)
+        if cached is not None:
+            return mark_reused(ChatCompletion.model_validate(cached))
+
+        scheduler = self.scheduler
+        async_client = self.async_clients.get()
+        tokens = estimate_tokens(messages, max_tokens)
+        session = current_session_id()
+
+        async def call(candidate):
+            async def send(reservation):
+                record_attempt(reservation)
+                raw = await async_client.chat.completions.with_raw_response.create(
+                    messages=validate_messages(messages),
+                    model=candidate,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    **kwargs
+                )
+                scheduler.observe_headers(candidate, raw.headers)
+                return await raw.parse()
+
+            return await scheduler.async_call(candidate, tokens, send, session)
+
+        router = self.router
+        hedge_model = self.hedge_model_for(model)
+        if self.hedging and hedge_model:
+            completion = await self.hedger.async_run(
+                (model, "complete"),
+                lambda: async_call_with_routing(router, model, call, on_fallback=notify_fallback),
+                lambda: async_call_with_routing(router, hedge_model, call)
+            )
+        else:
+            completion = await async_call_with_routing(router, model, call, on_fallback=notify_fallback)
+        self.cache.put(key, completion.model_dump(mode="json"), variants)
+        return completion
+
+    def stream_with_fallback(self, messages, model, temperature, max_tokens, cache_key=None, variants=1, **kwargs):
+        """Stream a completion, switching to the fallback model if the primary fails before its first token"""
+        scheduler = self.scheduler
+        tokens = estimate_tokens(messages, max_tokens)
+        session = current_session_id()
+        attempts = _StreamAttempts(self, messages, model, cache_key, variants)
+
+        def open_single(stream_model):
+            attempts.claim(stream_model)
+
+            def send(reservation):
+                token_stream.queue_time += reservation.queue_time
+                raw = self.client.chat.completions.with_raw_response.create(
+                    messages=validate_messages(messages),
+                    model=stream_model,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    **kwargs
+                )
+                attempts.sent(stream_model, reservation)
+                scheduler.observe_headers(stream_model, raw.headers)
+                return raw.parse()
+
+            return scheduler.call(stream_model, tokens, send, session)
+
+        def race_leg(leg_model):
+            # The stream only hears about the winner, so each leg records its own outcome
+            started = time.perf_counter()
+            try:
+                primed = PrimedStream(open_single(leg_model), leg_model)
+            except Exception as e:
+                attempts.record(leg_model, time.perf_counter() - started, e)
+                raise
+            attempts.record(leg_model, time.perf_counter() - started, None)
+            return primed
+
+        def open_stream(stream_model):
+            hedge_model = self.hedge_model_for(stream_model)
+            if self.hedging and stream_model == model and hedge_model:
+                # Race on time-to-first-token; the losing stream is closed when it answers
+                attempts.raced.append(stream_model)
+                return self.hedger.run(
+                    (model, "first_token"),
+                    in_context(lambda: race_leg(stream_model)),
+                    in_context(lambda: race_leg(hedge_model)),
+                    on_loser=attempts.on_loser
+                )
+            return open_single(stream_model)
+
+        token_stream = TokenStream(
+            open_stream, attempts.models, on_fallback=notify_fallback,
+            on_complete=attempts.on_complete, on_attempt=attempts.on_attempt
+        )
+        token_stream.add_listener(attempts.on_end)
+        return token_stream
+
+    def async_stream_completion(self, messages, model, temperature, max_tokens, **kwargs):
+        """AsyncTokenStream for a request, served from the cache when possible; recorded as a span"""
+        span = self.tracer.start(model, kind="stream")
+        key = make_cache_key(model, messages, temperature, max_tokens, **kwargs)
+        variants = cache_variants_for(temperature, config.CACHE_VARIANTS)
+        cached = self.cache.get(key, variants)
+        if cached is not None:
+            from groq.types.chat import ChatCompletion
+
+            completion = ChatCompletion.model_validate(cached)
+            token_stream = AsyncTokenStream.from_text(completion.choices[0].message.content, completion.model)
+            token_stream.cached = True
+        else:
+            token_stream = self.async_stream_with_fallback(
+                messages, model, temperature, max_tokens, cache_key=key, variants=variants, **kwargs
+            )
+        token_stream.add_listener(lambda finished, error: finish_stream_span(span, finished, error))
+        return token_stream
+
+    def async_stream_with_fallback(self, messages, model, temperature, max_tokens, cache_key=None, variants=1, **kwargs):
+        """Async counterpart of stream_with_fallback (without hedging)"""
+        scheduler = self.scheduler
+        tokens = estimate_tokens(messages, max_tokens)
+        session = current_session_id()
+        attempts = _StreamAttempts(self, messages, model, cache_key, variants)
+
+        async def open_stream(stream_model):
+            attempts.claim(stream_model)
+            async_client = self.async_clients.get()
+
+            async def send(reservation):
+                token_stream.queue_time += reservation.queue_time
+                raw = await async_client.chat.completions.with_raw_response.create(
+                    messages=validate_messages(messages),
+                    model=stream_model,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    **kwargs
+                )
+                attempts.sent(stream_model, reservation)
+                scheduler.observe_headers(stream_model, raw.headers)
+                return await raw.parse()
+
+            return await scheduler.async_call(stream_model, tokens, send, session)
+
+        token_stream = AsyncTokenStream(
+            open_stream, attempts.models, on_fallback=notify_fallback,
+            on_complete=attempts.on_complete, on_attempt=attempts.on_attempt
+        )
+        token_stream.add_listener(attempts.on_end)
+        return token_stream
+
+    # Prewarmed pool
+
+    def _build_prewarm_pool(self):
+        from .prewarm import PrewarmPool, pool_key
+
+        settings = config.DEFAULT_SETTINGS
+        hot_keys = []
+        for topic in config.PREWARM_TOPICS:
+            for mode, count in (("jokes", None), ("meme", settings["count"])):
+                key = pool_key(mode, topic, settings["style"], settings["intensity"], settings["temperature"], settings["max_tokens"], count)
+                hot_keys.append((key, topic))
+        return PrewarmPool(
+            self._prewarm_produce,
+            self._prewarm_estimate,
+            hot_keys=hot_keys,
+            low=config.PREWARM_LOW,
+            high=config.PREWARM_HIGH,
+            tokens_per_minute=config.PREWARM_TOKENS_PER_MINUTE,
+            min_requests=config.PREWARM_MIN_REQUESTS,
+            idle=config.PREWARM_IDLE,
+            max_keys=config.PREWARM_MAX_KEYS,
+            max_age=config.CACHE_TTL
+        )
+
+    def _prewarm_request(self, key, topic):
+        if key.mode == "jokes":
+            return {
+                "messages": joke_messages(topic, key.style, key.intensity),
+                "model": config.DEFAULT_MODEL,
+                "temperature": key.temperature,
+                "max_tokens": self.output_budget("jokes", key.max_tokens),
+                "top_p": 0.9
+            }
+        return self._meme_request(topic, key.style, key.intensity, key.count, key.temperature, key.max_tokens)
+
+    def _prewarm_estimate(self, key, topic):
+        request = self._prewarm_request(key, topic)
+        return estimate_tokens(request["messages"], request["max_tokens"])
+
+    def _prewarm_produce(self, key, topic):
+        """One new pooled result; bypasses the response cache so every pooled result differs"""
+        from .memes import parse_meme_batch
+
+        set_caller(session="prewarm")
+        request = self._prewarm_request(key, topic)
+        with labels(tab=f"prewarm:{key.mode}"), self.tracer.span(request["model"]) as span:
+            completion = self.create_with_fallback(**request)
+            span.set(model=completion.model)
+            span.set_usage(completion.usage)
+        self.record_output(completion, key.mode, request["max_tokens"], items=key.count or 1)
+        used = completion.usage.total_tokens if completion.usage else self._prewarm_estimate(key, topic)
+        if key.mode == "jokes":
+            return completion, used
+        specs = parse_meme_batch(completion_json(completion), key.count)
+        if not all(specs):
+            raise ValueError("Prewarmed meme batch came back malformed")
+        return specs, used
+
+    def generate_jokes(self, topic, style, intensity, temperature, max_tokens, stream=False):
+        """Jokes about a topic: from the prewarmed pool or the archive when they have some, else from safe_completion_create"""
+        repeats = self._repeat_filter("jokes")
+        if self.prewarm is not None:
+            from .prewarm import pool_key
+
+            completion = self.prewarm.take(pool_key("jokes", topic, style, intensity, temperature, max_tokens), topic)
+            if completion is not None:
+                self._archive_text("jokes", topic, style, intensity, completion.choices[0].message.content, completion.model)
+                return self._serve_pooled(self._without_repeats(repeats, completion), stream)
+        from .archive import complete_jokes, format_jokes
+
+        jokes = self._from_archive("jokes", topic, style, intensity, JOKE_COUNT)
+        if jokes is not None:
+            return self._serve_pooled(text_completion(format_jokes(jokes), config.DEFAULT_MODEL), stream, source="archived")
+        budget = self.output_budget("jokes", max_tokens)
+        result = self.safe_completion_create(
+            messages=joke_messages(topic, style, intensity),
+            model=config.DEFAULT_MODEL,
+            temperature=temperature,
+            max_tokens=budget,
+            top_p=0.9,
+            stream=stream
+        )
+        if stream:
+            # Whatever follows the last joke is an outro the archive and the user skip anyway
+            self._stop_early(result, lambda text: complete_jokes(text) >= JOKE_COUNT)
+        result = self._archiving(self.record_output(result, "jokes", budget), "jokes", topic, style, intensity)
+        return self._without_repeats(repeats, result)
+
+    def generate_roast(self, name, context, style, intensity, temperature, max_tokens, stream=False):
+        """A roast from the archive when it has enough for this name and context, else from safe_completion_create"""
+        # Only roasts of exactly this name are ever served for it; the context may be worded differently
+        roasts = self._from_archive("roast", context, style, intensity, subject=name)
+        if roasts is not None:
+            return self._serve_pooled(text_completion(roasts[0], config.DEFAULT_MODEL), stream, source="archived")
+        budget = self.output_budget("roast", max_tokens)
+        return self._archiving(self.record_output(self.safe_completion_create(
+            messages=roast_messages(name, context, style, intensity),
+            model=config.DEFAULT_MODEL,
+            temperature=temperature,
+            max_tokens=budget,
+            top_p=0.9,
+            stream=stream
+        ), "roast", budget), "roast", context, style, intensity, subject=name)
+
+    def _serve_pooled(self, completion, stream, source="pooled"):
+        if not stream:
+            with self.tracer.span(completion.model) as span:
+                span.set(model=completion.model, cached=True, **{source: True})
+            return completion
+        span = self.tracer.start(completion.model, kind="stream")
+        span.set(**{source: True})
+        token_stream = TokenStream.from_text(completion.choices[0].message.content, completion.model)
+        token_stream.cached = True
+        token_stream.add_listener(lambda finished, error: finish_stream_span(span, finished, error))
+        return token_stream
+
+    # Output budgets
+
+    def output_budget(self, mode, max_tokens, items=1):
+        """max_tokens to send for `mode`: its learned budget, never above what the caller asked for"""
+        if self.budget is None:
+            return max_tokens
+        return self.budget.max_tokens(mode, max_tokens, items)
+
+    def record_output(self, result, mode, max_tokens, items=1):
+        """Record a completion's length now, or a TokenStream's once it has been read to the end.
+
+        Only fresh upstream calls are sampled: a cache hit or a coalesced
+        reply was already recorded by the call that produced it.
+        """
+        if self.budget is None:
+            return result
+        if isinstance(result, TokenStream):
+            if result.cached or result.coalesced:
+                return result
+
+            def learn(token_stream, error):
+                # An abandoned stream's text says nothing about how long the reply would have been
+                if error is None and token_stream.finished_at is not None:
+                    source = token_stream.source or token_stream
+                    tokens = reply_tokens(source.usage, token_stream.text)
+                    truncated = not source.stopped and tokens >= max_tokens
+                    self.budget.record(mode, tokens, truncated=truncated, stopped=source.stopped, items=items)
+
+            result.add_listener(learn)
+        elif not getattr(result, "reused", False):
+            choice = result.choices[0]
+            self.budget.record(
+                mode, reply_tokens(result.usage, choice.message.content),
+                truncated=choice.finish_reason == "length", items=items
+            )
+        return result
+
+    def _stop_early(self, token_stream, predicate):
+        """End the upstream stream once `predicate(text so far)` says the reply is complete"""
+        if config.EARLY_STOP and not token_stream.cached:
+            # Coalesced readers share the leader's stream, and with it where it stops
+            (token_stream.source or token_stream).stop_when(predicate)
+        return token_stream
+
+    # Archive
+
+    def _open_archive(self):
+        if not config.ARCHIVE_PATH:
+            return None
+        from .archive import JokeArchive
+
+        try:
+            return JokeArchive(
+                config.ARCHIVE_PATH,
+                similarity=config.ARCHIVE_SIMILARITY,
+                min_items=config.ARCHIVE_MIN_ITEMS,
+                max_serves=config.ARCHIVE_MAX_SERVES
+            )
+        except sqlite3.Error:
+            # Like the response cache, a broken archive file shouldn't take the app down
+            log.exception("Could not open the archive at %s", config.ARCHIVE_PATH)
+            return None
+
+    def _from_archive(self, mode, topic, style, intensity, count=1, subject=None):
+        """`count` archived items for a similar topic, or None to generate new ones"""
+        if self.archive is None or not config.ARCHIVE_SERVE:
+            return None
+        try:
+            return self.archive.find(mode, topic, style, intensity, count, session=current_session_id(), subject=subject)
+        except sqlite3.Error:
+            log.exception("Archive lookup failed")
+            return None
+
+    def _archive_items(self, mode, topic, style, intensity, items, model, subject=None):
+        """Store (content, identity) pairs; archiving never fails the request"""
+        if self.archive is None:
+            return
+        session = current_session_id()
+        try:
+            for content, identity in items:
+                self.archive.add(
+                    mode, topic, style, intensity, content, model=model, session=session, identity=identity, subject=subject
+                )
+        except sqlite3.Error:
+            log.exception("Archiving a %s reply failed", mode)
+
+    def _archive_text(self, mode, topic, style, intensity, text, model, subject=None):
+        from .archive import split_jokes
+
+        pieces = split_jokes(text) if mode == "jokes" else [text.strip()] if text and text.strip() else []
+        self._archive_items(mode, topic, style, intensity, [(piece, None) for piece in pieces], model, subject)
+
+    def _archiving(self, result, mode, topic, style, intensity, subject=None):
+        """Archive a completion now, or a TokenStream once it has been read to the end"""
+        if self.archive is None:
+            return result
+        if isinstance(result, TokenStream):
+            def archive_stream(token_stream, error):
+                if error is None and token_stream.finished_at is not None:
+                    self._archive_text(mode, topic, style, intensity, token_stream.text, token_stream.model, subject)
+
+            result.add_listener(archive_stream)
+        else:
+            self._archive_text(mode, topic, style, intensity, result.choices[0].message.content, result.model, subject)
+        return result
+
+    def _repeat_filter(self, mode):
+        """RepeatFilter for a reply about to be requested, None without an archive"""
+        if self.archive is None:
+            return None
+        from .archive import RepeatFilter
+
+        try:
+            return RepeatFilter(self.archive, mode)
+        except sqlite3.Error:
+            log.exception("Archive lookup failed")
+            return None
+
+    def _without_repeats(self, repeats, result):
+        """A completion or TokenStream without the jokes `repeats` has seen archived"""
+        if repeats is None:
+            return result
+        if not isinstance(result, TokenStream):
+            content = result.choices[0].message.content
+            shown = repeats.text(content)
+            if shown == content:
+                return result
+            completion = result.model_copy(deep=True)
+            completion.choices[0].message.content = shown
+            return completion
+        token_stream = result
+
+        def copy_usage(shown):
+            shown.usage = token_stream.usage
+
+        shown = TokenStream(
+            lambda _model: _Relay(token_stream, lambda chunks: repeats.chunks(chunks, token_stream.cached)),
+            [token_stream.requested_model],
+            on_complete=copy_usage
+        )
+        shown.cached = token_stream.cached
+        shown.coalesced = token_stream.coalesced
+        shown.source = token_stream.source or token_stream
+        return shown
+
+    def _archive_memes(self, topic, style, intensity, specs, model):
+        self._archive_items("meme", topic, style, intensity, [
+            (spec, f"{spec['top_text']} / {spec['bottom_text']}") for spec in specs if spec
+        ], model)
+
+    # Comedy show
+
+    def generate_show(self, style, intensity, temperature, max_tokens, stream=False):
+        """A comedy show written in one completion"""
+        budget = self.output_budget("show", max_tokens)
+        return self.record_output(self.safe_completion_create(
+            messages=show_messages(style, intensity),
+            model=config.DEFAULT_MODEL,
+            temperature=temperature,
+            max_tokens=budget,
+            top_p=0.9,
+            stream=stream
+        ), "show", budget)
+
+    def segmented_show(self, style, intensity, temperature, max_tokens, segments=config.SHOW_SEGMENTS):
+        """Events of a comedy show planned in one call and written segment by segment in parallel.
+
+        See show.run_segmented_show for the events; every segment may use up to
+        `max_tokens`, so the whole show is no longer capped by one response.
+        """
+        from .show import MIN_SEGMENTS, parse_show_outline, run_segmented_show
+
+        segments = max(MIN_SEGMENTS, segments)
+
+        def plan():
+            completion = self.safe_completion_create(
+                messages=show_outline_messages(style, intensity, segments),
+                model=config.DEFAULT_MODEL,
+                temperature=temperature,
+                max_tokens=config.SHOW_OUTLINE_TOKENS_PER_SEGMENT * segments,
+                response_format={"type": "json_object"}
+            )
+            return parse_show_outline(completion_json(completion), segments)
+
+        def open_segment(outline, index):
+            budget = self.output_budget("show_segment", max_tokens)
+            return self.record_output(self.safe_completion_create(
+                messages=show_segment_messages(style, intensity, outline, index),
+                model=config.DEFAULT_MODEL,
+                temperature=temperature,
+                max_tokens=budget,
+                top_p=0.9,
+                stream=True
+            ), "show_segment", budget)
+
+        def write_transition(outline, index, before, after):
+            completion = self.safe_completion_create(
+                messages=show_transition_messages(style, intensity, before, after, outline[index + 1]["title"]),
+                model=config.DEFAULT_MODEL,
+                temperature=temperature,
+                max_tokens=config.SHOW_TRANSITION_TOKENS
+            )
+            return completion.choices[0].message.content.strip()
+
+        return run_segmented_show(plan, open_segment, write_transition)
+
+    # Comedy team
+
+    def choose_team_mode(self, mode=None, latency_budget=None):
+        """Team mode to run: `mode` (default BOB_TEAM_MODE) unless it is "auto".
+
+        "auto" takes the best-quality mode whose median latency so far fits the
+        budget; a mode not measured yet is assumed to fit, and fused is used if
+        none does.
+        """
+        mode = mode or config.TEAM_MODE
+        if mode != "auto":
+            if mode not in TEAM_MODES:
+                raise ValueError(f"Unknown team mode {mode!r}; expected auto or one of {', '.join(TEAM_MODES)}")
+            return mode
+        budget = latency_budget if latency_budget is not None else config.TEAM_LATENCY_BUDGET
+        with self._lock:
+            for candidate in MODE_PREFERENCE:
+                histogram = self._team_latency[candidate]
+                if len(histogram.samples) < 3 or histogram.percentile(0.5) <= budget:
+                    return candidate
+        return MODE_PREFERENCE[-1]
+
+    def team_latency(self):
+        """Median and p95 seconds per team run for each mode, from recent runs"""
+        with self._lock:
+            return {
+                mode: {
+                    "runs": len(histogram.samples),
+                    "p50_latency": histogram.percentile(0.5),
+                    "p95_latency": histogram.percentile(0.95)
+                }
+                for mode, histogram in self._team_latency.items()
+            }
+
+    def generate_team_comedy_batch(self, topics, style, intensity, temperature, stage_concurrency=None, mode=None):
+        """Run the comedy team over a list of topics with pipelined stages, results in input order"""
+        return self.run_async(lambda: self.async_generate_team_comedy_batch(
+            topics, style, intensity, temperature, stage_concurrency=stage_concurrency, mode=mode
+        ))
+
+    async def async_generate_team_comedy_batch(self, topics, style, intensity, temperature, stage_concurrency=None, mode=None):
+        """Coroutine form of generate_team_comedy_batch for callers already on an event loop"""
+        mode = self.choose_team_mode(mode)
+        if stage_concurrency is None:
+            stage_concurrency = {step: config.TEAM_STAGE_CONCURRENCY for step in STAGE_MAX_TOKENS}
+        team_prompts = create_comedy_team_prompt(style, intensity)
+
+        async def complete(messages, model, temperature, max_tokens, **kwargs):
+            return await self.async_safe_completion_create(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **kwargs
+            )
+
+        results = await run_team_pipeline(
+            complete,
+            topics,
+            team_prompts,
+            config.TEAM_MODEL_ASSIGNMENTS,
+            temperature,
+            stage_concurrency=stage_concurrency,
+            mode=mode
+        )
+        with self._lock:
+            for result in results:
+                if not result["error"]:
+                    self._team_latency[result["mode"]].add(result["timings"]["total"])
+        return results
+
+    def generate_team_comedy(self, topic, style, intensity, temperature, mode=None, latency_budget=None):
+        """One team run; the result has an "error" entry instead of raising"""
+        mode = self.choose_team_mode(mode, latency_budget)
+        # Sessions asking for the same topic and settings at the same time share one pipeline run
+        flight_key = "team:" + make_cache_key(
+            "team",
+            [{"role": "user", "content": topic.strip().lower()}],
+            temperature,
+            0,
+            style=style,
+            intensity=intensity,
+            mode=mode
+        )
+        return self.single_flight.do(
+            flight_key,
+            lambda: self.generate_team_comedy_batch([topic], style, intensity, temperature, mode=mode)[0]
+        )
+
+    # Memes
+
+    def _meme_request(self, topic, style, intensity, count, temperature, max_tokens, stream=False):
+        """meme_request with max_tokens cut to the learned per-meme budget"""
+        request = meme_request(topic, style, intensity, count, temperature, max_tokens, stream)
+        request["max_tokens"] = self.output_budget("meme", request["max_tokens"], items=count)
+        return request
+
+    def _request_memes(self, topic, style, intensity, count, temperature, max_tokens):
+        request = self._meme_request(topic, style, intensity, count, temperature, max_tokens)
+        return self.record_output(self.safe_completion_create(**request), "meme", request["max_tokens"], items=count)
+
+    def _ready_memes(self, topic, style, intensity, count, temperature, max_tokens):
+        """A finished batch of memes from the prewarmed pool or the archive, or None"""
+        specs = None
+        source = "pooled"
+        if self.prewarm is not None:
+            from .prewarm import pool_key
+
+            specs = self.prewarm.take(pool_key("meme", topic, style, intensity, temperature, max_tokens, count), topic)
+            if specs is not None:
+                self._archive_memes(topic, style, intensity, specs, config.DEFAULT_MODEL)
+        if specs is None:
+            specs = self._from_archive("meme", topic, style, intensity, count)
+            source = "archived"
+        if specs is None:
+            return None
+        with self.tracer.span(config.DEFAULT_MODEL) as span:
+            span.set(model=config.DEFAULT_MODEL, cached=True, **{source: True})
+        return [dict(spec) for spec in specs]
+
+    def generate_meme_specs(self, topic, style, intensity, count, temperature, max_tokens):
+        """Meme specs for a topic, from the prewarmed pool or the archive when they have a batch, else from request_meme_specs"""
+        specs = self._ready_memes(topic, style, intensity, count, temperature, max_tokens)
+        if specs is not None:
+            return specs
+        specs = self.request_meme_specs(topic, style, intensity, count, temperature, max_tokens)
+        self._archive_memes(topic, style, intensity, specs, config.DEFAULT_MODEL)
+        return specs
+
+    def stream_meme_specs(self, topic, style, intensity, count, temperature, max_tokens):
+        """Yield meme events while the reply streams, so rendering can start before it finishes.
+
+        Events are MemeStreamParser's ("spec", index, spec) and ("description",
+        index, text), plus ("failed", index, None) for a meme that stayed
+        missing after its retry. A reply that is cut off or breaks mid-stream
+        is repaired from what arrived; only the memes still missing are
+        requested again, one at a time in JSON mode. A prewarmed or archived
+        batch is served whole.
+        """
+        from .memes import MemeStreamParser, parse_meme_batch
+
+        specs = self._ready_memes(topic, style, intensity, count, temperature, max_tokens)
+        if specs is not None:
+            for index, spec in enumerate(specs):
+                yield "spec", index, spec
+            return
+
+        parser = MemeStreamParser(count)
+        request = self._meme_request(topic, style, intensity, count, temperature, max_tokens, stream=True)
+        token_stream = self.record_output(self.safe_completion_create(**request), "meme", request["max_tokens"], items=count)
+        # Text after the JSON closes (a code fence, a sign-off) is never parsed
+        self._stop_early(token_stream, lambda _text: parser.complete)
+        try:
+            for text in token_stream:
+                yield from parser.feed(text)
+        except Exception:
+            log.warning("Meme stream broke off; keeping the memes parsed so far", exc_info=True)
+        yield from parser.close()
+        if parser.repaired:
+            log.info("Repaired a truncated meme reply for %r", topic)
+
+        for index, spec in enumerate(parser.specs):
+            if spec is None:
+                chat_completion = self._request_memes(topic, style, intensity, 1, temperature, max_tokens)
+                keep_meme_retry(parser.specs, index, parse_meme_batch(completion_json(chat_completion), 1)[0])
+                if parser.specs[index] is None:
+                    yield "failed", index, None
+                else:
+                    yield "spec", index, parser.specs[index]
+        self._archive_memes(topic, style, intensity, parser.specs, token_stream.model or config.DEFAULT_MODEL)
+
+    def request_meme_specs(self, topic, style, intensity, count, temperature, max_tokens):
+        """Ask for `count` memes in one JSON-mode call and regenerate only the entries that come back malformed"""
+        from .memes import parse_meme_batch
+
+        def request(n):
+            return completion_json(self._request_memes(topic, style, intensity, n, temperature, max_tokens))
+
+        specs = parse_meme_batch(request(count), count)
+        for i, spec in enumerate(specs):
+            if spec is None:
+                keep_meme_retry(specs, i, parse_meme_batch(request(1), 1)[0])
+        return specs
+
+    async def async_request_meme_specs(self, topic, style, intensity, count, temperature, max_tokens):
+        """Async counterpart of request_meme_specs"""
+        from .memes import parse_meme_batch
+
+        async def request(n):
+            meme_args = self._meme_request(topic, style, intensity, n, temperature, max_tokens)
+            chat_completion = await self.async_safe_completion_create(**meme_args)
+            return completion_json(self.record_output(chat_completion, "meme", meme_args["max_tokens"], items=n))
+
+        specs = parse_meme_batch(await request(count), count)
+        for i, spec in enumerate(specs):
+            if spec is None:
+                keep_meme_retry(specs, i, parse_meme_batch(await request(1), 1)[0])
+        return specs
+
+    def get_meme_image(self, template_name, top_text, bottom_text):
+        """Rendered meme bytes from the local renderer, or a memegen.link URL in "remote" mode"""
+        from .memes import get_remote_meme_url
+
+        if self.meme_renderer_mode == "remote":
+            return get_remote_meme_url(template_name, top_text, bottom_text)
+        try:
+            return self.meme_renderer.render(template_name, top_text, bottom_text)
+        except Exception:
+            log.exception("Error generating meme")
+            return self.meme_renderer.render("drake", "Error", "generating meme")
+
+    def produce_meme_image(self, spec):
+        """Rendered bytes for one meme spec (the memegen.link URL in remote mode), or None if that failed"""
+        from .memes import get_remote_meme_url
+
+        try:
+            if self.meme_renderer_mode == "remote":
+                # The browser loads it, so memegen.link's latency never holds up the server
+                return get_remote_meme_url(spec["meme_template"], spec["top_text"], spec["bottom_text"])
+            return self.meme_renderer.render(spec["meme_template"], spec["top_text"], spec["bottom_text"])
+        except Exception:
+            return None
+
+    def produce_meme_images(self, specs):
+        """Render every meme concurrently (memegen.link URLs in remote mode)"""
+        return list(self.meme_pool.map(self.produce_meme_image, specs))
@@ -0,0 +1,201 @@
+"""Hedged (speculative) requests to cut tail latency.
+
+If the primary call hasn't answered (or produced its first streamed token)
+within a delay taken from a high percentile of its recent latencies, the
+same request is sent to a hedge model. The first result wins and the loser
+is cancelled (async) or discarded and closed (threads). A budget caps
+hedges to a fixed fraction of primary requests.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+
+
+class LatencyHistogram:
+    """Recent latency samples for one key, used to pick the hedge delay"""
+
+    def __init__(self, maxlen=512):
+        self.samples = deque(maxlen=maxlen)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class HedgeBudget:
+    """Each primary request earns `ratio` credits; a hedge costs one credit"""
+
+    def __init__(self, ratio=0.05, burst=5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.credits = min(1.0, burst)
+
+    def earn(self):
+        self.credits = min(self.burst, self.credits + self.ratio)
+
+    def spend(self):
+        if self.credits < 1.0:
+            return False
+        self.credits -= 1.0
+        return True
+
+
+class Hedger:
+    """Adaptive-delay request hedging with a bounded extra-call budget"""
+
+    def __init__(self, percentile=0.95, initial_delay=2.0, min_delay=0.2, max_delay=10.0,
+                 min_samples=20, budget_ratio=0.05, budget_burst=5.0, max_workers=32):
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.budget = HedgeBudget(budget_ratio, budget_burst)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.skipped_for_budget = 0
+
+    def _histogram(self, key):
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = LatencyHistogram()
+        return histogram
+
+    def observe(self, key, seconds):
+        with self._lock:
+            self._histogram(key).add(seconds)
+
+    def delay(self, key):
+        """Seconds to wait for the primary before hedging"""
+        with self._lock:
+            histogram = self._histogram(key)
+            if len(histogram.samples) < self.min_samples:
+                return self.initial_delay
+            return min(self.max_delay, max(self.min_delay, histogram.percentile(self.percentile)))
+
+    def _start(self):
+        with self._lock:
+            self.requests += 1
+            self.budget.earn()
+
+    def _allow_hedge(self):
+        with self._lock:
+            if self.budget.spend():
+                self.hedges += 1
+                return True
+            self.skipped_for_budget += 1
+            return False
+
+    def _won(self, label):
+        if label == "hedge":
+            with self._lock:
+                self.hedge_wins += 1
+
+    def run(self, key, primary, hedge, on_loser=None):
+        """Call `primary()`, hedging with `hedge()` if it is slow; returns the first result.
+
+        `key` is a (model, kind) pair naming the latency histogram for the delay.
+
+        Threads can't be interrupted, so a losing call runs to completion in the
+        background and `on_loser(result)` is called on its result (e.g. to close
+        a stream).
+        """
+        self._start()
+        started = time.perf_counter()
+        delay = self.delay(key)
+        primary_future = self._pool.submit(primary)
+
+        def record(future):
+            if not future.cancelled() and future.exception() is None:
+                self.observe(key, time.perf_counter() - started)
+
+        primary_future.add_done_callback(record)
+        try:
+            return primary_future.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        if not self._allow_hedge():
+            return primary_future.result()
+
+        pending = {primary_future: "primary", self._pool.submit(hedge): "hedge"}
+        errors = {}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                label = pending.pop(future)
+                if future.exception() is not None:
+                    errors[label] = future.exception()
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                    if on_loser:
+                        loser.add_done_callback(
+                            lambda f: on_loser(f.result()) if not f.cancelled() and f.exception() is None else None
+                        )
+                self._won(label)
+                return future.result()
+        raise errors.get("primary") or errors["hedge"]
+
+    async def async_run(self, key, primary, hedge):
+        """Async counterpart of run; the losing task is cancelled"""
+        self._start()
+        started = time.perf_counter()
+        delay = self.delay(key)
+        primary_task = asyncio.ensure_future(primary())
+        done, _ = await asyncio.wait({primary_task}, timeout=delay)
+        if done or not self._allow_hedge():
+            result = await primary_task
+            self.observe(key, time.perf_counter() - started)
+            return result
+
+        hedge_task = asyncio.ensure_future(hedge())
+        pending = {primary_task: "primary", hedge_task: "hedge"}
+        errors = {}
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    label = pending.pop(task)
+                    if task.exception() is not None:
+                        errors[label] = task.exception()
+                        continue
+                    if label == "primary":
+                        self.observe(key, time.perf_counter() - started)
+                    self._won(label)
+                    return task.result()
+            raise errors.get("primary") or errors["hedge"]
+        finally:
+            for task, label in pending.items():
+                task.cancel()
+                if label == "primary":
+                    # A cancelled primary was at least this slow; keep the tail in the histogram
+                    self.observe(key, time.perf_counter() - started)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_rate": self.hedges / self.requests if self.requests else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "skipped_for_budget": self.skipped_for_budget,
+                "budget_credits": round(self.budget.credits, 2),
+                "delays": {
+                    f"{model} ({kind})": (
+                        round(min(self.max_delay, max(self.min_delay, histogram.percentile(self.percentile))), 3)
+                        if len(histogram.samples) >= self.min_samples else self.initial_delay
+                    )
+                    for (model, kind), histogram in sorted(self._histograms.items())
+                }
+            }
@@ -0,0 +1,197 @@
+"""Incremental, tolerant JSON parsing for streamed completions.
+
+Text is pushed in as it arrives and every value is reported as soon as it is
+complete, with its path from the root, so a caller can act on the first
+fields of a reply while the rest is still being generated. The parser skips
+prose or code fences around the document and accepts the usual model slips:
+single quotes, missing or trailing commas, unquoted words, raw newlines in
+strings and Python-style literals. `close()` repairs a reply that was cut
+off by closing whatever string, array and object is still open.
+"""
+from collections import namedtuple
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+_LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+_BARE_END = frozenset(",:]} \t\r\n")
+
+# `path` is None for a container that had no key to go under; nothing inside it is reported
+_Frame = namedtuple("_Frame", "container path")
+
+
+def _scalar(token):
+    if token in _LITERALS:
+        return _LITERALS[token]
+    for cast in (int, float):
+        try:
+            return cast(token)
+        except ValueError:
+            pass
+    return token
+
+
+def _join(chars):
+    text = "".join(chars)
+    try:
+        # Escaped surrogate pairs (emoji) arrive as two halves
+        return text.encode("utf-16", "surrogatepass").decode("utf-16")
+    except UnicodeError:
+        return text
+
+
+class IncrementalJSONParser:
+    """Push parser: `feed(text)` returns the `(path, value)` pairs completed by that text.
+
+    A path is a tuple of object keys and array indexes, () for the root. A
+    container is reported when it closes, after everything in it; `value`
+    always holds the document parsed so far.
+    """
+
+    def __init__(self):
+        self.value = None
+        # Path of a string value cut short by close(), if any
+        self.cut = None
+        self.repaired = False
+        # True once the document closed on its own, i.e. the rest of the reply can be skipped
+        self.complete = False
+        self._stack = []
+        self._keys = []
+        self._done = False
+        self._string = None
+        self._quote = None
+        self._is_key = False
+        self._escape = None
+        self._bare = None
+        self._events = []
+
+    def feed(self, text):
+        for ch in text:
+            self._step(ch)
+        events, self._events = self._events, []
+        return events
+
+    def close(self):
+        """Finish the document, repairing a truncated one; returns the values this completes"""
+        if self._stack:
+            self.repaired = True
+            self._escape = None
+            if self._string is not None:
+                chars, self._string = self._string, None
+                if not self._is_key:
+                    self.cut = self._set(_join(chars))
+            if self._bare is not None:
+                self._end_bare()
+            while self._stack:
+                self._close()
+        self._done = True
+        events, self._events = self._events, []
+        return events
+
+    def _step(self, ch):
+        if self._done:
+            return
+        if self._string is not None:
+            self._string_char(ch)
+            return
+        if self._bare is not None:
+            if ch not in _BARE_END:
+                self._bare.append(ch)
+                return
+            self._end_bare()
+        if not self._stack:
+            # Anything before the document (prose, a code fence) is skipped
+            if ch in "{[":
+                self._open(ch)
+            return
+        if ch in "{[":
+            self._open(ch)
+        elif ch in "}]":
+            self._close()
+        elif ch in "\"'":
+            self._string = []
+            self._quote = ch
+            self._is_key = isinstance(self._stack[-1].container, dict) and self._keys[-1] is None
+        elif ch == ",":
+            # A key with no value before the comma is dropped
+            self._keys[-1] = None
+        elif ch != ":" and not ch.isspace():
+            self._bare = [ch]
+
+    def _string_char(self, ch):
+        if self._escape is not None:
+            if not self._escape and ch != "u":
+                self._string.append(_ESCAPES.get(ch, ch))
+                self._escape = None
+                return
+            self._escape += ch
+            if len(self._escape) == 5:
+                try:
+                    self._string.append(chr(int(self._escape[1:], 16)))
+                except ValueError:
+                    self._string.append(self._escape)
+                self._escape = None
+        elif ch == "\\":
+            self._escape = ""
+        elif ch == self._quote:
+            text = _join(self._string)
+            self._string = None
+            if self._is_key:
+                self._keys[-1] = text
+            else:
+                self._set(text)
+        else:
+            self._string.append(ch)
+
+    def _end_bare(self):
+        token = "".join(self._bare)
+        self._bare = None
+        if isinstance(self._stack[-1].container, dict) and self._keys[-1] is None:
+            self._keys[-1] = token
+        else:
+            self._set(_scalar(token))
+
+    def _attach(self, value):
+        """Put `value` into the open container and return its path (None if it has nowhere to go)"""
+        frame = self._stack[-1]
+        if isinstance(frame.container, list):
+            index = len(frame.container)
+            frame.container.append(value)
+            return None if frame.path is None else frame.path + (index,)
+        key = self._keys[-1]
+        if key is None:
+            return None
+        frame.container[key] = value
+        self._keys[-1] = None
+        return None if frame.path is None else frame.path + (key,)
+
+    def _set(self, value):
+        path = self._attach(value)
+        if path is not None:
+            self._events.append((path, value))
+        return path
+
+    def _open(self, ch):
+        container = {} if ch == "{" else []
+        if self._stack:
+            path = self._attach(container)
+        else:
+            self.value = container
+            path = ()
+        self._stack.append(_Frame(container, path))
+        self._keys.append(None)
+
+    def _close(self):
+        frame = self._stack.pop()
+        self._keys.pop()
+        if frame.path is not None:
+            self._events.append((frame.path, frame.container))
+        if not self._stack:
+            self._done = True
+            self.complete = not self.repaired
+
+
+def repair_json(text):
+    """Best-effort parse of a possibly truncated or slightly malformed JSON reply; None if it holds no document"""
+    parser = IncrementalJSONParser()
+    parser.feed(text or "")
+    parser.close()
+    return parser.value
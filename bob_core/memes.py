@@ -0,0 +1,359 @@
+"""Local meme renderer.
+
+Base images for the eight templates are read from TEMPLATE_DIR (one
+`<template>.png`/`.jpg` per template) and decoded once. A template without a
+bundled image falls back to a generated panel layout so rendering never
+needs the network. Top/bottom text is fitted, wrapped and drawn with PIL,
+and encoded outputs are kept in a small LRU so repeats are not re-encoded.
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+TEMPLATE_DIR = os.getenv(
+    "BOB_MEME_TEMPLATE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "meme_templates")
+)
+FONT_PATH = os.getenv("BOB_MEME_FONT", "")
+FONT_CANDIDATES = ["impact.ttf", "Impact.ttf", "DejaVuSans-Bold.ttf", "Arial Bold.ttf", "arialbd.ttf"]
+
+# Size and horizontal colour bands used when a template has no bundled image
+TEMPLATE_LAYOUTS = {
+    "drake": ((600, 600), ["#f4a742", "#fbd38d"]),
+    "distracted": ((800, 533), ["#7fb3d5", "#a9cce3", "#d4e6f1"]),
+    "change_my_mind": ((800, 600), ["#6b8e23", "#c8b88a"]),
+    "two_buttons": ((600, 900), ["#d9534f", "#f0ad4e", "#5bc0de"]),
+    "expanding_brain": ((600, 800), ["#2c3e50", "#34495e", "#5d6d7e", "#aab7b8"]),
+    "this_is_fine": ((800, 400), ["#e67e22", "#f5b041"]),
+    "stonks": ((800, 600), ["#1b2631", "#1e8449"]),
+    "surprised_pikachu": ((600, 600), ["#f7dc6f", "#fcf3cf"]),
+}
+
+DEFAULT_TEMPLATE = "drake"
+
+
+def resolve_template(template_name):
+    name = (template_name or "").lower()
+    return name if name in TEMPLATE_LAYOUTS else DEFAULT_TEMPLATE
+
+
+def _generated_base(template):
+    (width, height), bands = TEMPLATE_LAYOUTS[template]
+    image = Image.new("RGB", (width, height), bands[0])
+    draw = ImageDraw.Draw(image)
+    band_height = height / len(bands)
+    for i, colour in enumerate(bands):
+        draw.rectangle([0, round(i * band_height), width, round((i + 1) * band_height)], fill=colour)
+    return image
+
+
+@lru_cache(maxsize=None)
+def load_template(template):
+    """Decoded base image for a template, loaded once per process"""
+    for extension in ("png", "jpg", "jpeg", "webp"):
+        path = os.path.join(TEMPLATE_DIR, f"{template}.{extension}")
+        if os.path.exists(path):
+            with Image.open(path) as image:
+                return image.convert("RGB")
+    return _generated_base(template)
+
+
+@lru_cache(maxsize=64)
+def load_font(size):
+    candidates = [FONT_PATH] if FONT_PATH else []
+    for candidate in candidates + FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def _wrap(draw, text, font, max_width):
+    lines = []
+    current = ""
+    for word in text.split():
+        candidate = f"{current} {word}".strip()
+        if not current or draw.textlength(candidate, font=font) <= max_width:
+            current = candidate
+        else:
+            lines.append(current)
+            current = word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def fit_text(draw, text, max_width, max_height, max_size=72, min_size=14):
+    """Largest font size (and wrapped lines) for which `text` fits the box"""
+    size = max_size
+    while True:
+        font = load_font(size)
+        lines = _wrap(draw, text, font, max_width)
+        line_height = size * 1.15
+        widest = max((draw.textlength(line, font=font) for line in lines), default=0)
+        if size <= min_size or (len(lines) * line_height <= max_height and widest <= max_width):
+            return font, lines, line_height
+        size -= 4 if size > 30 else 2
+
+
+def _draw_block(draw, text, width, box_top, box_height, anchor_bottom):
+    if not text:
+        return
+    margin = width * 0.05
+    font, lines, line_height = fit_text(draw, text, width - 2 * margin, box_height)
+    block_height = len(lines) * line_height
+    y = box_top + box_height - block_height if anchor_bottom else box_top
+    stroke = max(1, int(font.size / 15))
+    for line in lines:
+        line_width = draw.textlength(line, font=font)
+        draw.text(((width - line_width) / 2, y), line, font=font, fill="white", stroke_width=stroke, stroke_fill="black")
+        y += line_height
+
+
+def clean_text(text):
+    return " ".join(str(text or "").split()).upper()[:120]
+
+
+class MemeRenderer:
+    """Renders memes to encoded bytes with an LRU of recent outputs"""
+
+    def __init__(self, image_format="PNG", max_width=600, cache_size=128):
+        self.image_format = image_format.upper()
+        self.max_width = max_width
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, template_name, top_text, bottom_text, width=None):
+        template = resolve_template(template_name)
+        top = clean_text(top_text)
+        bottom = clean_text(bottom_text)
+        width = width or self.max_width
+        key = (template, top, bottom, width, self.image_format)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        data = self._encode(self._draw(template, top, bottom, width))
+        with self._lock:
+            self._cache[key] = data
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return data
+
+    def _draw(self, template, top, bottom, width):
+        base = load_template(template)
+        if base.width > width:
+            image = base.resize((width, round(base.height * width / base.width)), Image.LANCZOS)
+        else:
+            image = base.copy()
+        draw = ImageDraw.Draw(image)
+        box_height = image.height * 0.3
+        margin = image.height * 0.03
+        _draw_block(draw, top, image.width, margin, box_height, anchor_bottom=False)
+        _draw_block(draw, bottom, image.width, image.height - margin - box_height, box_height, anchor_bottom=True)
+        return image
+
+    def _encode(self, image):
+        buffer = io.BytesIO()
+        if self.image_format == "WEBP":
+            image.save(buffer, format="WEBP", quality=80, method=4)
+        else:
+            image.save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._cache),
+                "templates_loaded": load_template.cache_info().currsize
+            }
+
+
+MEME_TEXT_LIMIT = 50
+
+
+def validate_meme_spec(entry):
+    """Cleaned meme spec, or None if the entry is unusable"""
+    if not isinstance(entry, dict):
+        return None
+    top = " ".join(str(entry.get("top_text") or "").split())
+    bottom = " ".join(str(entry.get("bottom_text") or "").split())
+    if not top and not bottom:
+        return None
+    return {
+        "top_text": top[:MEME_TEXT_LIMIT],
+        "bottom_text": bottom[:MEME_TEXT_LIMIT],
+        "meme_template": resolve_template(entry.get("meme_template")),
+        "description": " ".join(str(entry.get("description") or "").split())
+    }
+
+
+def parse_meme_batch(data, count):
+    """Validate up to `count` memes from a parsed JSON response.
+
+    Accepts {"memes": [...]}, a bare list or a single meme object. Returns a
+    list of length `count` where malformed, missing or duplicate entries are
+    None so only those need to be regenerated.
+    """
+    if isinstance(data, dict) and isinstance(data.get("memes"), list):
+        entries = data["memes"]
+    elif isinstance(data, list):
+        entries = data
+    else:
+        entries = [data]
+
+    specs = []
+    seen = set()
+    for entry in entries[:count]:
+        spec = validate_meme_spec(entry)
+        if spec is not None:
+            identity = (spec["top_text"].lower(), spec["bottom_text"].lower())
+            if identity in seen:
+                spec = None
+            else:
+                seen.add(identity)
+        specs.append(spec)
+    return specs + [None] * (count - len(specs))
+
+
+MEME_READY_FIELDS = ("top_text", "bottom_text", "meme_template")
+
+
+class MemeStreamParser:
+    """Meme specs pulled out of a streamed JSON reply as soon as they are usable.
+
+    `feed(text)` and `close()` return events:
+
+        ("spec", index, spec)          texts and template are complete; render now
+        ("description", index, text)   the caption of a spec already returned
+
+    A meme whose object closes (or is cut off) before all three ready fields
+    arrive is still returned if validate_meme_spec accepts what it has; a cut
+    off text other than the description is never used. `specs` ends up like
+    parse_meme_batch's result, None where a meme is missing or a duplicate.
+    """
+
+    def __init__(self, count):
+        from .jsonstream import IncrementalJSONParser
+
+        self.count = count
+        self.specs = [None] * count
+        self._parser = IncrementalJSONParser()
+        self._fields = [{} for _ in range(count)]
+        self._closed = set()
+        self._seen = set()
+
+    @property
+    def repaired(self):
+        return self._parser.repaired
+
+    @property
+    def complete(self):
+        """The reply's JSON has closed; anything the model adds after it is ignored anyway"""
+        return self._parser.complete
+
+    def feed(self, text):
+        return self._handle(self._parser.feed(text))
+
+    def close(self):
+        events = self._parser.close()
+        cut = self._parser.cut
+        if cut is not None and cut[-1] != "description":
+            events = [(path, value) for path, value in events if path != cut]
+        events = self._handle(events)
+        for index in range(self.count):
+            if index not in self._closed:
+                events.extend(self._ready(index))
+                self._closed.add(index)
+        return events
+
+    def _index(self, path):
+        """Meme index of an object path: the root, or an array entry at any depth"""
+        if not path:
+            return 0
+        if isinstance(path[-1], int) and 0 <= path[-1] < self.count:
+            return path[-1]
+        return None
+
+    def _handle(self, parsed):
+        events = []
+        for path, value in parsed:
+            if path and isinstance(path[-1], str) and isinstance(value, str):
+                index = self._index(path[:-1])
+                if index is None or index in self._closed:
+                    continue
+                self._fields[index][path[-1]] = value
+                if path[-1] == "description" and self.specs[index] is not None:
+                    self.specs[index]["description"] = " ".join(value.split())
+                    events.append(("description", index, self.specs[index]["description"]))
+                elif all(field in self._fields[index] for field in MEME_READY_FIELDS):
+                    events.extend(self._ready(index))
+            elif isinstance(value, dict):
+                index = self._index(path)
+                if index is not None and index not in self._closed:
+                    events.extend(self._ready(index))
+                    self._closed.add(index)
+        return events
+
+    def _ready(self, index):
+        if self.specs[index] is not None:
+            return []
+        spec = validate_meme_spec(self._fields[index])
+        if spec is None:
+            return []
+        identity = (spec["top_text"].lower(), spec["bottom_text"].lower())
+        if identity in self._seen:
+            # A repeat stays missing so it gets regenerated
+            self._closed.add(index)
+            return []
+        self._seen.add(identity)
+        self.specs[index] = spec
+        return [("spec", index, spec)]
+
+
+# memegen.link URL per template, used when BOB_MEME_RENDERER is "remote"
+MEMEGEN_TEMPLATES = {
+    "drake": "https://api.memegen.link/images/drake/{top}/{bottom}",
+    "distracted": "https://api.memegen.link/images/distracted/{top}/{bottom}",
+    "change_my_mind": "https://api.memegen.link/images/changemy/{top}/{bottom}",
+    "two_buttons": "https://api.memegen.link/images/buttons/{top}/{bottom}",
+    "expanding_brain": "https://api.memegen.link/images/brain/{top}/{bottom}",
+    "this_is_fine": "https://api.memegen.link/images/fine/{top}/{bottom}",
+    "stonks": "https://api.memegen.link/images/stonks/{top}/{bottom}",
+    "surprised_pikachu": "https://api.memegen.link/images/pikachu/{top}/{bottom}"
+}
+
+
+def get_meme_templates():
+    return MEMEGEN_TEMPLATES
+
+
+def sanitize_text(text):
+    # More thorough text sanitization
+    text = text.replace("'", "").replace('"', "")  # Remove quotes
+    text = text.replace("\n", " ").replace("\r", " ")  # Remove newlines
+    text = " ".join(text.split())  # Remove extra spaces
+    return text.replace(" ", "-").replace("?", "~q").replace("/", "~s").replace("#", "~h").replace("&", "~a")
+
+
+def get_remote_meme_url(template_name, top_text, bottom_text):
+    template = (template_name or "").lower()
+    url_template = MEMEGEN_TEMPLATES.get(template, MEMEGEN_TEMPLATES[DEFAULT_TEMPLATE])
+    # Sanitize and truncate text
+    top = sanitize_text(str(top_text or ""))[:50]
+    bottom = sanitize_text(str(bottom_text or ""))[:50]
+    return url_template.format(top=top, bottom=bottom)
@@ -0,0 +1,215 @@
+"""Prewarmed pool of ready-made jokes and memes for popular topics.
+
+Requests are counted per key (mode, topic, style, intensity, temperature,
+max_tokens, meme count). Keys built from the hot-topic list, and keys asked
+for often enough recently, get a small pool of finished results that a
+background thread keeps between a low and a high watermark. A request for a
+pooled key takes one result without waiting on the API; every result is
+served once. Keys nobody asked for within the idle time are evicted, and
+refills spend from their own token bucket so prewarming stays on budget.
+"""
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+from .scheduler import TokenBucket
+
+PoolKey = namedtuple("PoolKey", "mode topic style intensity temperature max_tokens count")
+
+# Keys whose request history is kept, including ones not (yet) popular enough to pool
+MAX_TRACKED_KEYS = 1024
+# After a failed refill a key is left alone for this long
+RETRY_SECONDS = 30.0
+
+
+def pool_key(mode, topic, style, intensity, temperature, max_tokens, count=None):
+    return PoolKey(mode, topic.strip().lower(), style, int(intensity), float(temperature), int(max_tokens), count)
+
+
+class PoolEntry:
+    def __init__(self, topic, pinned=False):
+        self.topic = topic
+        self.pinned = pinned
+        self.items = deque()  # (created, result)
+        self.requests = deque()
+        self.last_request = 0.0
+        self.filling = False
+        self.retry_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+
+class PrewarmPool:
+    """Ready-made results per key, refilled in the background.
+
+    `produce(key, topic)` generates one result and returns it with the tokens
+    it used; `estimate(key, topic)` is its expected token cost, reserved from
+    the budget before the call.
+    """
+
+    def __init__(self, produce, estimate, hot_keys=(), low=2, high=4, tokens_per_minute=20000,
+                 min_requests=3, window=600.0, idle=1800.0, max_keys=32, max_age=3600.0):
+        self.produce = produce
+        self.estimate = estimate
+        self.low = low
+        self.high = max(high, low)
+        self.min_requests = min_requests
+        self.window = window
+        self.idle = idle
+        self.max_keys = max_keys
+        self.max_age = max_age
+        self.budget = TokenBucket(tokens_per_minute)
+        self._entries = OrderedDict()
+        for key, topic in hot_keys:
+            self._entries[key] = PoolEntry(topic, pinned=True)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopped = False
+        self.produced = 0
+        self.failed = 0
+        self.tokens_used = 0
+        self.evicted = 0
+        if self._entries:
+            self._start()
+
+    def take(self, key, topic):
+        """A ready result for `key`, or None; counts the request either way"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = PoolEntry(topic)
+                while len(self._entries) > MAX_TRACKED_KEYS:
+                    self._drop_oldest_unpinned()
+            self._entries.move_to_end(key)
+            entry.requests.append(now)
+            entry.last_request = now
+            self._expire(entry, now)
+            result = entry.items.popleft()[1] if entry.items else None
+            if result is None:
+                entry.misses += 1
+            else:
+                entry.hits += 1
+        self._start()
+        self._wake.set()
+        return result
+
+    def _drop_oldest_unpinned(self):
+        for key, entry in self._entries.items():
+            if not entry.pinned:
+                del self._entries[key]
+                return
+        self._entries.popitem(last=False)
+
+    def _expire(self, entry, now):
+        while entry.requests and entry.requests[0] < now - self.window:
+            entry.requests.popleft()
+        while entry.items and entry.items[0][0] < now - self.max_age:
+            entry.items.popleft()
+
+    def _active_keys(self, now):
+        """Keys worth keeping a pool for, most requested first; evicts the rest"""
+        candidates = []
+        for key, entry in list(self._entries.items()):
+            self._expire(entry, now)
+            if not entry.pinned and entry.last_request < now - self.idle:
+                self.evicted += len(entry.items)
+                del self._entries[key]
+                continue
+            if entry.pinned or len(entry.requests) >= self.min_requests:
+                candidates.append((entry.pinned, len(entry.requests), entry.last_request, key))
+        candidates.sort(reverse=True)
+        active = [key for *_, key in candidates[:self.max_keys]]
+        # Cold keys keep their history but give up their pooled results
+        for *_, key in candidates[self.max_keys:]:
+            entry = self._entries[key]
+            self.evicted += len(entry.items)
+            entry.items.clear()
+            entry.filling = False
+        return active
+
+    def _next_refill(self, now):
+        with self._lock:
+            for key in self._active_keys(now):
+                entry = self._entries[key]
+                if len(entry.items) < self.low:
+                    entry.filling = True
+                elif len(entry.items) >= self.high:
+                    entry.filling = False
+                if entry.filling and entry.retry_at <= now:
+                    return key, entry.topic
+        return None, None
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None and not self._stopped:
+                    self._thread = threading.Thread(target=self._run, name="bob-prewarm", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            key, topic = self._next_refill(time.time())
+            if key is None:
+                self._wake.wait(5.0)
+                self._wake.clear()
+                continue
+            cost = self.estimate(key, topic)
+            with self._lock:
+                wait = self.budget.wait_time(cost, time.monotonic())
+                if not wait:
+                    self.budget.take(cost, time.monotonic())
+            if wait:
+                self._wake.wait(wait)
+                self._wake.clear()
+                continue
+            try:
+                result, used = self.produce(key, topic)
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        entry.retry_at = time.time() + RETRY_SECONDS
+                    self.budget.adjust(cost, time.monotonic())
+                continue
+            with self._lock:
+                self.budget.adjust(cost - used, time.monotonic())
+                self.tokens_used += used
+                self.produced += 1
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.items.append((time.time(), result))
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            active = set(self._active_keys(now))
+            keys = [
+                {
+                    "mode": key.mode,
+                    "topic": entry.topic,
+                    "style": key.style,
+                    "intensity": key.intensity,
+                    "ready": len(entry.items),
+                    "recent_requests": len(entry.requests),
+                    "hits": entry.hits,
+                    "misses": entry.misses,
+                    "pinned": entry.pinned
+                }
+                for key, entry in self._entries.items() if key in active
+            ]
+            return {
+                "keys": keys,
+                "tracked_keys": len(self._entries),
+                "produced": self.produced,
+                "failed": self.failed,
+                "evicted": self.evicted,
+                "tokens_used": self.tokens_used,
+                "budget_left": round(max(0.0, self.budget.level), 1)
+            }
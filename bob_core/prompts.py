@@ -0,0 +1,186 @@
+"""Prompt builders for every tab.
+
+System prompts depend only on the style and intensity sliders, so they are
+built and sized once per combination and reused across reruns and sessions.
+"""
+from functools import lru_cache
+
+from .scheduler import text_tokens
+
+
+@lru_cache(maxsize=64)
+def create_system_prompt(style, intensity):
+    # Built without the source indentation, which was sent (and billed) with every request
+    return f"""You are Bob Buster, Hollywood's most ruthless comedy agent. Your style is {style} with an intensity of {intensity}/5.
+You are known for:
+- Sharp, witty comebacks
+- Brutally honest observations
+- Dark humor that pushes boundaries
+- Quick improvisation skills
+- Cultural awareness and topical references
+- Visual humor and meme creation
+
+Guidelines:
+1. Keep jokes concise and impactful
+2. Use appropriate language based on intensity
+3. Include relevant cultural references
+4. Maintain character consistency
+5. Adapt tone based on context
+6. For visual comedy, describe memes and visual elements vividly"""
+
+
+@lru_cache(maxsize=64)
+def system_prompt_tokens(style, intensity):
+    """Estimated tokens of the system prompt for a style and intensity, counted once per combination"""
+    return text_tokens(create_system_prompt(style, intensity))
+
+
+# Jokes per reply in the jokes tab
+JOKE_COUNT = 3
+
+
+def joke_messages(topic, style, intensity):
+    return [
+        {"role": "system", "content": create_system_prompt(style, intensity)},
+        {"role": "user", "content": f"Generate {JOKE_COUNT} jokes about {topic}. Make them sharp, witty, and slightly savage."}
+    ]
+
+
+def roast_messages(name, context, style, intensity):
+    return [
+        {"role": "system", "content": create_system_prompt(style, intensity)},
+        {"role": "user", "content": f"Create a savage roast for {name}. Context: {context}"}
+    ]
+
+
+def show_messages(style, intensity):
+    return [
+        {"role": "system", "content": create_system_prompt(style, intensity)},
+        {"role": "user", "content": "Create a 5-minute comedy show with a mix of jokes, roasts, and improv. Include transitions and audience interactions."}
+    ]
+
+
+MEME_JSON_FORMAT = """{
+        "top_text": "short text for top of meme (max 50 chars)",
+        "bottom_text": "short text for bottom of meme (max 50 chars)",
+        "meme_template": "one of: drake, distracted, change_my_mind, two_buttons, expanding_brain, this_is_fine, stonks, surprised_pikachu",
+        "description": "brief description of the meme"
+    }"""
+
+
+def generate_meme_prompt(topic, style, intensity, count=1):
+    if count == 1:
+        return f"""Create a funny meme about {topic}.
+    Style: {style}
+    Intensity: {intensity}/5
+    
+    Respond with a JSON object containing:
+    {MEME_JSON_FORMAT}
+    
+    Keep texts short and punchy. No hashtags or special characters."""
+
+    return f"""Create {count} different funny memes about {topic}.
+    Style: {style}
+    Intensity: {intensity}/5
+    
+    Respond with a JSON object containing a "memes" array of exactly {count} objects, each with:
+    {MEME_JSON_FORMAT}
+    
+    Every meme must have a different joke. Keep texts short and punchy. No hashtags or special characters."""
+
+
+@lru_cache(maxsize=64)
+def create_comedy_team_prompt(style, intensity):
+    """System message per team step (see team.TEAM_MODES); the returned dict is shared, don't mutate it"""
+    return {
+        "writer": {
+            "role": "system",
+            "content": f"""You are a professional comedy writer with {style} style.
+            Your role is to create the initial joke structure and setup.
+            Intensity: {intensity}/5
+            Focus on crafting clever setups and unexpected twists.
+            Keep responses concise and impactful."""
+        },
+        "roaster": {
+            "role": "system",
+            "content": f"""You are a savage roast master with {style} style.
+            Your role is to add brutal but funny punchlines.
+            Intensity: {intensity}/5
+            Focus on clever observations and witty comebacks.
+            Keep responses concise and sharp."""
+        },
+        "refiner": {
+            "role": "system",
+            "content": f"""You are a comedy refiner with {style} style.
+            Your role is to polish jokes and make them sharper.
+            Intensity: {intensity}/5
+            Focus on timing, word choice, and delivery.
+            Keep responses concise and polished."""
+        },
+        "draft": {
+            "role": "system",
+            "content": f"""You are a comedy writer and savage roast master with {style} style.
+            Your role is to craft the joke setup and add a brutal but funny punchline.
+            Intensity: {intensity}/5
+            Focus on clever setups, unexpected twists and witty comebacks.
+            Keep responses concise and sharp."""
+        },
+        "fused": {
+            "role": "system",
+            "content": f"""You are a whole comedy team with {style} style: writer, roast master and refiner.
+            Your role is to craft the setup, add a brutal but funny punchline, then polish the joke.
+            Intensity: {intensity}/5
+            Focus on clever setups, witty comebacks, timing and word choice.
+            Keep responses concise and polished."""
+        }
+    }
+
+
+SHOW_OUTLINE_FORMAT = """{
+        "kind": "one of: opener, bit, crowd_work, closer",
+        "title": "short title of the segment",
+        "premise": "one sentence on what the segment is about"
+    }"""
+
+
+def show_outline_messages(style, intensity, segments):
+    return [
+        {"role": "system", "content": create_system_prompt(style, intensity)},
+        {"role": "user", "content": f"""Plan a 5-minute comedy show in {segments} segments: an opener, {segments - 3} bits, a crowd work segment and a closer.
+    
+    Respond with a JSON object containing a "segments" array of exactly {segments} objects in running order, each with:
+    {SHOW_OUTLINE_FORMAT}
+    
+    Give every bit a different premise and have the closer call back to the opener."""}
+    ]
+
+
+def show_segment_messages(style, intensity, outline, index):
+    plan = "\n".join(
+        f"    {i + 1}. {segment['title']} ({segment['kind'].replace('_', ' ')}): {segment['premise']}"
+        for i, segment in enumerate(outline)
+    )
+    segment = outline[index]
+    return [
+        {"role": "system", "content": create_system_prompt(style, intensity)},
+        {"role": "user", "content": f"""You are performing this comedy show:
+{plan}
+    
+    Write segment {index + 1} only: {segment['title']} - {segment['premise']}
+    Write it as spoken material with audience reactions in brackets. Go straight into the material and stop at the end of the segment; transitions between segments are written separately."""}
+    ]
+
+
+def show_transition_messages(style, intensity, before, after, next_title):
+    return [
+        {"role": "system", "content": create_system_prompt(style, intensity)},
+        {"role": "user", "content": f"""Write the one or two sentences you say to move from one segment of your comedy show to the next.
+    
+    End of the previous segment:
+    {before[-400:]}
+    
+    Start of the next segment ({next_title}):
+    {after[:400]}
+    
+    Reply with the transition only."""}
+    ]
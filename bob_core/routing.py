@@ -0,0 +1,265 @@
+"""Health-aware model routing with per-model circuit breakers.
+
+Every model keeps a sliding window of recent call outcomes; only timeouts,
+connection errors and 5xx replies count against it. When its error rate
+crosses the threshold the circuit opens and the model is skipped for a
+cooldown period, so requests go straight to the next model in its fallback
+chain instead of waiting for another failure. After the cooldown a limited
+number of half-open probe requests decide whether the circuit closes again.
+"""
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a model is skipped because its circuit is open"""
+
+
+def is_model_failure(error):
+    """Whether an error says the model is unhealthy: a 5xx, a timeout or a lost connection.
+
+    Client errors (a bad request, auth, a 429 the scheduler gave up on) and
+    local ones such as a rate-limit queue timeout say nothing about the model.
+    """
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status >= 500
+    # Groq's APITimeoutError is an APIConnectionError; matched by name so groq stays a lazy import
+    return isinstance(error, ConnectionError) or any(cls.__name__ == "APIConnectionError" for cls in type(error).__mro__)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ModelHealth:
+    """Sliding-window outcomes and circuit state for one model"""
+
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+        self.outcomes = deque()  # (timestamp, ok, latency)
+        self.state = CLOSED
+        self.opened_at = None
+        self.probes_in_flight = 0
+        self.last_error = None
+        self.times_opened = 0
+
+    def prune(self, now):
+        while self.outcomes and self.outcomes[0][0] < now - self.window_seconds:
+            self.outcomes.popleft()
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for _, ok, _ in self.outcomes if not ok) / len(self.outcomes)
+
+
+class ModelRouter:
+    """Routes requests along fallback chains, skipping models whose circuit is open.
+
+    `fallback_models` maps a model to its next fallback; chains are followed
+    hop by hop until a model without a fallback (cycles are cut).
+    """
+
+    def __init__(self, fallback_models, window_seconds=60, failure_threshold=0.5,
+                 min_requests=4, cooldown_seconds=30, half_open_probes=1, slow_call_seconds=None):
+        self.fallback_models = dict(fallback_models)
+        self.window_seconds = window_seconds
+        self.failure_threshold = failure_threshold
+        self.min_requests = min_requests
+        self.cooldown_seconds = cooldown_seconds
+        self.half_open_probes = half_open_probes
+        self.slow_call_seconds = slow_call_seconds
+        self._lock = threading.Lock()
+        self._health = {}
+        self._serving = {}
+
+    def _get(self, model):
+        health = self._health.get(model)
+        if health is None:
+            health = self._health[model] = ModelHealth(self.window_seconds)
+        return health
+
+    def chain(self, model):
+        """The model followed by every fallback hop"""
+        chain = [model]
+        while self.fallback_models.get(chain[-1]) and self.fallback_models[chain[-1]] not in chain:
+            chain.append(self.fallback_models[chain[-1]])
+        return chain
+
+    def acquire(self, model):
+        """Claim permission to call `model`; raises CircuitOpenError if it must be skipped"""
+        with self._lock:
+            health = self._get(model)
+            if health.state == OPEN:
+                if time.time() - health.opened_at < self.cooldown_seconds:
+                    raise CircuitOpenError(f"circuit open since {time.strftime('%H:%M:%S', time.localtime(health.opened_at))}")
+                health.state = HALF_OPEN
+                health.probes_in_flight = 0
+            if health.state == HALF_OPEN:
+                if health.probes_in_flight >= self.half_open_probes:
+                    raise CircuitOpenError("circuit half-open, probe already in flight")
+                health.probes_in_flight += 1
+
+    def release(self, model):
+        """Give back a claimed probe slot for a call that was never made"""
+        with self._lock:
+            health = self._get(model)
+            if health.state == HALF_OPEN and health.probes_in_flight:
+                health.probes_in_flight -= 1
+
+    def record_success(self, model, latency, requested_model=None):
+        with self._lock:
+            health = self._get(model)
+            now = time.time()
+            ok = self.slow_call_seconds is None or latency <= self.slow_call_seconds
+            if health.state == HALF_OPEN:
+                # A healthy probe closes the circuit with a clean window
+                health.outcomes.clear()
+                health.state = CLOSED
+                health.probes_in_flight = 0
+            health.outcomes.append((now, ok, latency))
+            health.prune(now)
+            self._serving[requested_model or model] = model
+            self._maybe_open(health, now)
+
+    def record_failure(self, model, latency, error=None):
+        with self._lock:
+            health = self._get(model)
+            now = time.time()
+            health.last_error = str(error) if error is not None else None
+            health.outcomes.append((now, False, latency))
+            health.prune(now)
+            if health.state == HALF_OPEN:
+                self._open(health, now)
+            else:
+                self._maybe_open(health, now)
+
+    def _maybe_open(self, health, now):
+        if health.state != CLOSED or len(health.outcomes) < self.min_requests:
+            return
+        if health.error_rate() >= self.failure_threshold:
+            self._open(health, now)
+
+    def _open(self, health, now):
+        health.state = OPEN
+        health.opened_at = now
+        health.probes_in_flight = 0
+        health.times_opened += 1
+
+    def snapshot(self):
+        """Per-model circuit state and window stats, plus which model serves each request model"""
+        with self._lock:
+            now = time.time()
+            models = {}
+            for model, health in sorted(self._health.items()):
+                health.prune(now)
+                latencies = [latency for _, _, latency in health.outcomes]
+                models[model] = {
+                    "state": health.state,
+                    "requests_in_window": len(health.outcomes),
+                    "error_rate": round(health.error_rate(), 3),
+                    "p50_latency": _percentile(latencies, 0.5),
+                    "p95_latency": _percentile(latencies, 0.95),
+                    "times_opened": health.times_opened,
+                    "cooldown_remaining": (
+                        max(0.0, self.cooldown_seconds - (now - health.opened_at))
+                        if health.state == OPEN else 0.0
+                    ),
+                    "last_error": health.last_error
+                }
+            return {"models": models, "serving": dict(self._serving)}
+
+
+class _RoutedAttempts:
+    """Bookkeeping of one routed call, shared by the sync and async loops"""
+
+    def __init__(self, router, model, on_fallback):
+        self.router = router
+        self.model = model
+        self.on_fallback = on_fallback
+        self.errors = []
+        self.claimed = False
+
+    def candidates(self):
+        """Models to call in order, each with its router slot claimed"""
+        attempted = False
+        for candidate in self.router.chain(self.model):
+            try:
+                self.router.acquire(candidate)
+            except CircuitOpenError as e:
+                self.errors.append(f"{candidate}: {str(e)}")
+                continue
+            attempted = self.claimed = True
+            yield candidate
+        if not attempted:
+            # Every circuit is open: try the requested model anyway rather than failing outright
+            self.claimed = False
+            yield self.model
+
+    def failed(self, candidate, started, error):
+        if is_model_failure(error):
+            self.router.record_failure(candidate, time.perf_counter() - started, error)
+        elif self.claimed:
+            self.router.release(candidate)
+        self.errors.append(f"{candidate}: {str(error)}")
+
+    def interrupted(self, candidate):
+        # Cancelled or interrupted: the outcome says nothing about the model's health
+        if self.claimed:
+            self.router.release(candidate)
+
+    def succeeded(self, candidate, started, result):
+        self.router.record_success(candidate, time.perf_counter() - started, requested_model=self.model)
+        if candidate != self.model and self.on_fallback:
+            self.on_fallback(self.model, candidate)
+        return result
+
+    def error(self):
+        return Exception("All models failed. " + " | ".join(self.errors))
+
+
+def call_with_routing(router, model, call, on_fallback=None):
+    """Call `call(candidate)` along the routed chain for `model` and return its result.
+
+    Models with open circuits are skipped. If every model in the chain is
+    skipped, the requested model is tried anyway rather than failing outright.
+    """
+    attempts = _RoutedAttempts(router, model, on_fallback)
+    for candidate in attempts.candidates():
+        started = time.perf_counter()
+        try:
+            result = call(candidate)
+        except Exception as e:
+            attempts.failed(candidate, started, e)
+            continue
+        except BaseException:
+            attempts.interrupted(candidate)
+            raise
+        return attempts.succeeded(candidate, started, result)
+    raise attempts.error()
+
+
+async def async_call_with_routing(router, model, call, on_fallback=None):
+    """Async counterpart of call_with_routing for a coroutine `call(candidate)`"""
+    attempts = _RoutedAttempts(router, model, on_fallback)
+    for candidate in attempts.candidates():
+        started = time.perf_counter()
+        try:
+            result = await call(candidate)
+        except Exception as e:
+            attempts.failed(candidate, started, e)
+            continue
+        except BaseException:
+            attempts.interrupted(candidate)
+            raise
+        return attempts.succeeded(candidate, started, result)
+    raise attempts.error()
@@ -0,0 +1,363 @@
+"""Rate-limit-aware request scheduler.
+
+Every completion reserves capacity from per-model token buckets (requests
+per minute and tokens per minute) before it is sent. Token cost is estimated
+from the prompt size plus max_tokens and corrected from the response usage.
+Rate-limit response headers keep the buckets in line with what the API
+reports. A failed attempt gives back the tokens it reserved; a 429 also
+blocks the model until its Retry-After, and the call is retried with
+jittered exponential backoff. Waiting requests are granted round-robin across
+sessions so one busy session can't starve the rest; async callers wait in
+the same queues on their event loop without holding a thread.
+"""
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+DEFAULT_RPM = 30
+DEFAULT_TPM = 30000
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_duration(value):
+    """Seconds from a rate-limit reset value like 7.66s, 2m59.56s or 120ms"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+
+def text_tokens(text):
+    """Rough token count of a text: ~4 characters per token"""
+    return len(str(text or "")) // 4
+
+
+def estimate_tokens(messages, max_tokens):
+    """Rough token cost of a request: ~4 characters per prompt token plus the completion budget"""
+    prompt_chars = sum(len(str(msg.get("content") or "")) for msg in messages)
+    return prompt_chars // 4 + len(messages) * 4 + int(max_tokens)
+
+
+def is_rate_limit_error(error):
+    return getattr(error, "status_code", None) == 429
+
+
+def _error_headers(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "headers", None) or {}
+
+
+class TokenBucket:
+    """Continuously refilling bucket; the level may go negative after a usage correction"""
+
+    def __init__(self, capacity, per_seconds=60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / per_seconds
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, delta, now):
+        self._refill(now)
+        self.level = min(self.capacity, self.level + delta)
+
+
+class ModelBudget:
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0
+        self.queue = OrderedDict()  # session -> deque of tickets, served round-robin
+        self.rate_limited = 0
+        self.granted = 0
+        self.total_queue_time = 0.0
+
+
+class _AsyncTicket:
+    """Queue ticket of an async waiter, woken on its own event loop when budgets change"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.wake = asyncio.Event()
+
+
+class Reservation:
+    def __init__(self, model, tokens, queue_time):
+        self.model = model
+        self.tokens = tokens
+        self.queue_time = queue_time
+
+
+class RateLimitScheduler:
+    """Per-model request/token budgets with fair queueing, header sync and 429 retries.
+
+    `limits` maps a model to (requests_per_minute, tokens_per_minute); other
+    models use the defaults. `share` is the fraction of every limit this
+    process may use, e.g. 1/4 when four worker processes share one API key.
+    """
+
+    def __init__(self, limits=None, default_rpm=DEFAULT_RPM, default_tpm=DEFAULT_TPM,
+                 max_retries=4, base_backoff=0.5, max_backoff=20.0, max_queue_seconds=60.0, share=1.0):
+        self.limits = dict(limits or {})
+        self.share = share
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_queue_seconds = max_queue_seconds
+        self._cond = threading.Condition()
+        self._budgets = {}
+        self._async_tickets = set()
+
+    def _budget(self, model):
+        budget = self._budgets.get(model)
+        if budget is None:
+            rpm, tpm = self.limits.get(model, (self.default_rpm, self.default_tpm))
+            budget = self._budgets[model] = ModelBudget(rpm * self.share, tpm * self.share)
+        return budget
+
+    def _notify(self):
+        """Wake every waiter, threads and async tickets alike; call with the lock held"""
+        self._cond.notify_all()
+        for ticket in self._async_tickets:
+            try:
+                ticket.loop.call_soon_threadsafe(ticket.wake.set)
+            except RuntimeError:
+                # Its loop has closed; the ticket is dropped when its acquire unwinds
+                pass
+
+    def _enqueue(self, model, session, ticket):
+        budget = self._budget(model)
+        budget.queue.setdefault(session, deque()).append(ticket)
+        return budget
+
+    def _try_take(self, budget, ticket, tokens, now):
+        """Seconds until `ticket` can be granted, None while it isn't at the head; takes the budget at 0"""
+        head_session = next(iter(budget.queue))
+        if budget.queue[head_session][0] is not ticket:
+            return None
+        wait = max(
+            budget.blocked_until - now,
+            budget.requests.wait_time(1, now),
+            budget.tokens.wait_time(tokens, now)
+        )
+        if wait <= 0:
+            budget.requests.take(1, now)
+            budget.tokens.take(tokens, now)
+            return 0.0
+        return wait
+
+    def _dequeue(self, budget, session, ticket):
+        queue = budget.queue.get(session)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            # Rotate the session to the back so other sessions get the next grant
+            if queue:
+                budget.queue.move_to_end(session)
+            else:
+                del budget.queue[session]
+        self._notify()
+
+    def _granted(self, model, budget, tokens, started):
+        queue_time = time.monotonic() - started
+        budget.granted += 1
+        budget.total_queue_time += queue_time
+        return Reservation(model, tokens, queue_time)
+
+    def _timed_out(self, model):
+        return TimeoutError(f"Timed out after {self.max_queue_seconds:.0f}s waiting for {model} rate limit")
+
+    def acquire(self, model, tokens, session=None):
+        """Block until `model` has budget for one request of `tokens`, in fair order.
+
+        Raises TimeoutError after max_queue_seconds so a request never hangs forever.
+        """
+        ticket = object()
+        session = session or "default"
+        started = time.monotonic()
+        with self._cond:
+            budget = self._enqueue(model, session, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._try_take(budget, ticket, tokens, now)
+                    if wait is not None and wait <= 0:
+                        break
+                    remaining = self.max_queue_seconds - (now - started)
+                    if remaining <= 0:
+                        raise self._timed_out(model)
+                    self._cond.wait(min(remaining, wait) if wait is not None else remaining)
+            finally:
+                self._dequeue(budget, session, ticket)
+            return self._granted(model, budget, tokens, started)
+
+    async def async_acquire(self, model, tokens, session=None):
+        """Async counterpart of acquire: waits in the same fair queue without blocking a thread"""
+        ticket = _AsyncTicket(asyncio.get_running_loop())
+        session = session or "default"
+        started = time.monotonic()
+        with self._cond:
+            budget = self._enqueue(model, session, ticket)
+            self._async_tickets.add(ticket)
+        try:
+            while True:
+                with self._cond:
+                    # Cleared before checking, so a change made after the check still wakes the wait below
+                    ticket.wake.clear()
+                    now = time.monotonic()
+                    wait = self._try_take(budget, ticket, tokens, now)
+                    if wait is not None and wait <= 0:
+                        break
+                remaining = self.max_queue_seconds - (now - started)
+                if remaining <= 0:
+                    raise self._timed_out(model)
+                try:
+                    await asyncio.wait_for(ticket.wake.wait(), min(remaining, wait) if wait is not None else remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self._async_tickets.discard(ticket)
+                self._dequeue(budget, session, ticket)
+        with self._cond:
+            return self._granted(model, budget, tokens, started)
+
+    def settle(self, reservation, usage=None):
+        """Correct the token bucket from the actual usage of a finished request"""
+        total = getattr(usage, "total_tokens", None)
+        if total is not None:
+            self._correct(reservation, total)
+
+    def refund(self, reservation):
+        """Give back the tokens of a request that used none of them (failed, cancelled or discarded)"""
+        self._correct(reservation, 0)
+
+    def _correct(self, reservation, used):
+        with self._cond:
+            self._budget(reservation.model).tokens.adjust(reservation.tokens - used, time.monotonic())
+            self._notify()
+
+    def observe_headers(self, model, headers):
+        """Sync budgets with Groq's x-ratelimit-* / retry-after response headers"""
+        if not headers:
+            return
+        with self._cond:
+            budget = self._budget(model)
+            now = time.monotonic()
+            limit_tokens = headers.get("x-ratelimit-limit-tokens")
+            if limit_tokens and limit_tokens.isdigit() and int(limit_tokens) > 0:
+                budget.tokens.capacity = float(limit_tokens) * self.share
+                budget.tokens.rate = budget.tokens.capacity / 60.0
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            if remaining_tokens and remaining_tokens.isdigit():
+                budget.tokens._refill(now)
+                budget.tokens.level = min(budget.tokens.level, float(remaining_tokens) * self.share)
+            # Groq reports requests per day here; only an exhausted quota matters per minute
+            if headers.get("x-ratelimit-remaining-requests") == "0":
+                reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+                if reset:
+                    budget.blocked_until = max(budget.blocked_until, now + reset)
+            retry_after = parse_duration(headers.get("retry-after"))
+            if retry_after:
+                budget.blocked_until = max(budget.blocked_until, now + retry_after)
+            self._notify()
+
+    def _on_rate_limited(self, reservation, error, attempt):
+        """Block the model after a 429 and return how long this caller should back off"""
+        model = reservation.model
+        headers = _error_headers(error)
+        self.observe_headers(model, headers)
+        with self._cond:
+            budget = self._budget(model)
+            budget.rate_limited += 1
+        retry_after = parse_duration(headers.get("retry-after")) if headers else None
+        backoff = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        # Full jitter keeps retrying sessions from stampeding together
+        delay = random.uniform(0, backoff)
+        return max(delay, retry_after or 0.0)
+
+    def call(self, model, tokens, fn, session=None):
+        """Run `fn(reservation)` within the model's budget, retrying 429s with backoff.
+
+        Results carrying `usage` settle the reservation automatically; streams
+        should call settle() themselves once usage is known.
+        """
+        attempt = 0
+        while True:
+            reservation = self.acquire(model, tokens, session)
+            try:
+                result = fn(reservation)
+            except BaseException as e:
+                # A failed attempt (a 429, a 5xx, a timeout) used none of the tokens it reserved
+                self.refund(reservation)
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                time.sleep(self._on_rate_limited(reservation, e, attempt))
+                attempt += 1
+                continue
+            self.settle(reservation, getattr(result, "usage", None))
+            return result
+
+    async def async_call(self, model, tokens, fn, session=None):
+        """Async counterpart of call for a coroutine function `fn(reservation)`"""
+        attempt = 0
+        while True:
+            reservation = await self.async_acquire(model, tokens, session)
+            try:
+                result = await fn(reservation)
+            except BaseException as e:
+                # Failed, or cancelled as the loser of a hedged race: either way no tokens were used
+                self.refund(reservation)
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self._on_rate_limited(reservation, e, attempt))
+                attempt += 1
+                continue
+            self.settle(reservation, getattr(result, "usage", None))
+            return result
+
+    def snapshot(self):
+        with self._cond:
+            now = time.monotonic()
+            models = {}
+            for model, budget in sorted(self._budgets.items()):
+                budget.requests._refill(now)
+                budget.tokens._refill(now)
+                models[model] = {
+                    "requests_available": round(budget.requests.level, 1),
+                    "tokens_available": round(budget.tokens.level),
+                    "tokens_per_minute": round(budget.tokens.capacity),
+                    "blocked_for": round(max(0.0, budget.blocked_until - now), 2),
+                    "waiting": sum(len(q) for q in budget.queue.values()),
+                    "granted": budget.granted,
+                    "rate_limited": budget.rate_limited,
+                    "avg_queue_time": budget.total_queue_time / budget.granted if budget.granted else 0.0
+                }
+            return models
@@ -0,0 +1,218 @@
+"""HTTP API for the comedy modes, for frontends other than the Streamlit app.
+
+    python -m bob_core.service --workers 4 --port 8000
+
+Endpoints (JSON bodies take the same fields as batch jobs):
+
+    POST /v1/jokes   {"topic": ...}
+    POST /v1/roast   {"name": ..., "context": ...}
+    POST /v1/show    {}
+    POST /v1/memes   {"topic": ..., "count": 2}
+    POST /v1/team    {"topic": ..., "team_mode": "auto", "latency_budget": 4}
+    GET  /health
+
+Jokes, roast and show stream as Server-Sent Events: `token` events carrying
+`{"text": ...}` deltas, then one `done` event with the served model, time to
+first token and token usage, or an `error` event. Send `"stream": false` to
+get a single JSON response instead. Each worker process builds its own
+ComedyEngine and keeps no per-user state, so any number of workers can run
+behind one port; send `X-Session-Id` to get fair queueing per end user.
+Workers share the API key's rate limits, so each one budgets for an equal
+share of them (BOB_RATE_LIMIT_SHARE, 1/workers unless set).
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from . import config
+from .batch import DEFAULTS, TEXT_MODES, job_messages, normalize_job
+from .engine import set_caller
+from .telemetry import labels
+
+IMAGE_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def read_job(request, mode):
+    """Request body as a normalized job; raises ValueError if unusable"""
+    try:
+        body = await request.json() if await request.body() else {}
+    except ValueError:
+        raise ValueError("Request body must be JSON")
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object")
+    return normalize_job({**body, "mode": mode}, DEFAULTS)
+
+
+def flag(job, name):
+    """Boolean request option that defaults to on"""
+    return job.get(name, True) is not False
+
+
+def identify(request):
+    client = request.client.host if request.client else None
+    set_caller(session=request.headers.get("x-session-id") or client)
+
+
+async def text_endpoint(request):
+    mode = request.url.path.rsplit("/", 1)[-1]
+    identify(request)
+    try:
+        job = await read_job(request, mode)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    engine = request.app.state.engine
+    request_args = {
+        "messages": job_messages(job),
+        "model": job.get("model") or config.DEFAULT_MODEL,
+        "temperature": job["temperature"],
+        "max_tokens": engine.output_budget(mode, job["max_tokens"]),
+        "top_p": 0.9
+    }
+
+    with labels(tab=f"api:{mode}"):
+        if not flag(job, "stream"):
+            try:
+                completion = engine.record_output(
+                    await engine.async_safe_completion_create(**request_args), mode, request_args["max_tokens"]
+                )
+            except Exception as e:
+                return JSONResponse({"error": str(e)}, status_code=502)
+            return JSONResponse({
+                "text": completion.choices[0].message.content,
+                "model": completion.model,
+                "usage": completion.usage.model_dump(mode="json") if completion.usage else None
+            })
+        token_stream = engine.record_output(engine.async_stream_completion(**request_args), mode, request_args["max_tokens"])
+
+    async def events():
+        try:
+            async for text in token_stream:
+                yield sse_event("token", {"text": text})
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+        usage = token_stream.usage
+        yield sse_event("done", {
+            "model": token_stream.model,
+            "cached": token_stream.cached,
+            "time_to_first_token": token_stream.time_to_first_token,
+            "usage": usage.model_dump(mode="json") if usage is not None else None
+        })
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+async def memes(request):
+    identify(request)
+    try:
+        job = await read_job(request, "meme")
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    engine = request.app.state.engine
+    with labels(tab="api:meme"):
+        try:
+            specs = await engine.async_request_meme_specs(
+                job["topic"], job["style"], job["intensity"], job["count"], job["temperature"], job["max_tokens"]
+            )
+        except Exception as e:
+            return JSONResponse({"error": str(e)}, status_code=502)
+    specs = [spec for spec in specs if spec]
+    if flag(job, "render"):
+        images = await run_in_threadpool(engine.produce_meme_images, specs)
+        image_type = IMAGE_TYPES.get(config.MEME_FORMAT.upper(), "application/octet-stream")
+        for spec, image in zip(specs, images):
+            if isinstance(image, bytes):
+                spec["image"] = f"data:{image_type};base64,{base64.b64encode(image).decode('ascii')}"
+            else:
+                spec["image"] = image
+    return JSONResponse({"memes": specs})
+
+
+async def team(request):
+    identify(request)
+    try:
+        job = await read_job(request, "team")
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    engine = request.app.state.engine
+    try:
+        budget = job.get("latency_budget")
+        mode = engine.choose_team_mode(job.get("team_mode"), float(budget) if budget is not None else None)
+    except (TypeError, ValueError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    with labels(tab="api:team"):
+        result = (await engine.async_generate_team_comedy_batch(
+            [job["topic"]], job["style"], job["intensity"], job["temperature"], mode=mode
+        ))[0]
+    return JSONResponse(result, status_code=502 if result["error"] else 200)
+
+
+async def health(request):
+    return JSONResponse({"status": "ok", "pid": os.getpid()})
+
+
+def create_app(api_key=None):
+    """ASGI app; the engine is built when the worker starts"""
+    @asynccontextmanager
+    async def lifespan(app):
+        from .engine import ComedyEngine
+
+        key = api_key or os.getenv("GROQ_API_KEY")
+        if not key:
+            raise RuntimeError("GROQ_API_KEY is not set")
+        app.state.engine = ComedyEngine(api_key=key, prewarm=False)
+        try:
+            yield
+        finally:
+            await app.state.engine.async_clients.aclose()
+            app.state.engine.tracer.close()
+
+    routes = [Route(f"/v1/{mode}", text_endpoint, methods=["POST"]) for mode in TEXT_MODES]
+    routes += [
+        Route("/v1/memes", memes, methods=["POST"]),
+        Route("/v1/team", team, methods=["POST"]),
+        Route("/health", health)
+    ]
+    return Starlette(routes=routes, lifespan=lifespan)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the comedy modes over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes sharing the port")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if not os.getenv("GROQ_API_KEY"):
+        parser.error("GROQ_API_KEY is not set")
+    # Worker processes inherit the environment and read it when they import config
+    os.environ.setdefault("BOB_RATE_LIMIT_SHARE", str(1 / max(1, args.workers)))
+    uvicorn.run(
+        "bob_core.service:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level="warning"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
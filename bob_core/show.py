@@ -0,0 +1,131 @@
+"""Segmented comedy show: outline first, then every segment at once.
+
+One short call plans the show (opener, bits, crowd work, closer). Every
+segment is then streamed concurrently from its own completion, and once two
+neighbouring segments are done a short call writes the transition between
+them. Events come back through one iterator in arrival order, so a caller
+can fill one placeholder per segment while they all stream; the show takes
+about as long as its slowest segment rather than the sum of them.
+"""
+import contextvars
+import logging
+import queue
+import threading
+
+from . import telemetry
+
+log = logging.getLogger(__name__)
+
+SEGMENT_KINDS = ("opener", "bit", "crowd_work", "closer")
+MIN_SEGMENTS = 3
+
+
+def default_outline(segments):
+    """Outline used when the planning call doesn't return a usable one"""
+    kinds = ["opener"] + ["bit"] * (segments - 3) + ["crowd_work", "closer"]
+    titles = {"opener": "Opening", "crowd_work": "Crowd Work", "closer": "Big Finish"}
+    return [
+        {
+            "kind": kind,
+            "title": titles.get(kind, f"Bit {i}"),
+            "premise": "whatever is on your mind tonight" if kind == "bit" else f"the {kind.replace('_', ' ')} of the show"
+        }
+        for i, kind in enumerate(kinds)
+    ]
+
+
+def parse_show_outline(data, segments):
+    """Exactly `segments` outline entries from the planning call's JSON, filling gaps from the default outline"""
+    fallback = default_outline(segments)
+    entries = data.get("segments") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return fallback
+    outline = []
+    for i in range(segments):
+        entry = entries[i] if i < len(entries) else None
+        if not isinstance(entry, dict) or not all(isinstance(entry.get(field), str) and entry[field].strip() for field in ("title", "premise")):
+            outline.append(fallback[i])
+            continue
+        kind = str(entry.get("kind", "")).strip().lower().replace(" ", "_")
+        outline.append({
+            "kind": kind if kind in SEGMENT_KINDS else fallback[i]["kind"],
+            "title": entry["title"].strip(),
+            "premise": entry["premise"].strip()
+        })
+    return outline
+
+
+def run_segmented_show(plan, open_segment, write_transition):
+    """Yield `(event, index, payload)` tuples as the show is produced.
+
+    `plan()` returns the outline, `open_segment(outline, index)` a TokenStream
+    for one segment and `write_transition(outline, index, before, after)` the
+    text that goes between segments index and index + 1. Events:
+
+        ("outline", None, outline)
+        ("token", index, text)        one streamed delta of a segment
+        ("segment", index, stream)    a segment finished; stream.text is all of it
+        ("transition", index, text)   goes after segment index ("" if it failed)
+        ("error", index, message)     a segment failed
+
+    Segment and transition calls run on worker threads with the caller's
+    context, so labels and the caller identity follow them.
+    """
+    with telemetry.labels(stage="outline"):
+        outline = plan()
+    yield "outline", None, outline
+
+    events = queue.Queue()
+    texts = [None] * len(outline)
+    failed = set()
+    # Boundary index -> None (waiting on a segment), False (being written), True (written or given up)
+    transitions = {index: None for index in range(len(outline) - 1)}
+
+    def spawn(fn, index):
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(fn, index), daemon=True).start()
+
+    def segment(index):
+        try:
+            with telemetry.labels(stage="segment"):
+                token_stream = open_segment(outline, index)
+                for text in token_stream:
+                    events.put(("token", index, text))
+            events.put(("segment", index, token_stream))
+        except Exception as e:
+            events.put(("error", index, str(e)))
+
+    def transition(index):
+        try:
+            with telemetry.labels(stage="transition"):
+                text = write_transition(outline, index, texts[index], texts[index + 1])
+        except Exception:
+            log.exception("Transition after segment %d failed", index + 1)
+            text = ""
+        events.put(("transition", index, text))
+
+    for index in range(len(outline)):
+        spawn(segment, index)
+
+    finished = 0
+    while finished < len(outline) or not all(transitions.values()):
+        event = events.get()
+        kind, index, payload = event
+        if kind == "segment":
+            finished += 1
+            texts[index] = payload.text
+        elif kind == "error":
+            finished += 1
+            failed.add(index)
+        elif kind == "transition":
+            transitions[index] = True
+        for left in (index - 1, index) if kind in ("segment", "error") else ():
+            if transitions.get(left, True) is not None:
+                continue
+            if left in failed or left + 1 in failed:
+                transitions[left] = True
+            elif texts[left] is not None and texts[left + 1] is not None:
+                # Both neighbours are finished: write the transition now
+                transitions[left] = False
+                spawn(transition, left)
+        yield event
@@ -0,0 +1,324 @@
+"""Token streaming with fallback before the first token and latency metrics."""
+import inspect
+import statistics
+import threading
+import time
+from collections import deque
+
+
+def _chunk_text(chunk):
+    if not chunk.choices:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+
+def _chunk_usage(chunk):
+    # Groq reports usage on the last chunk, either inline or under x_groq
+    usage = getattr(chunk, "usage", None)
+    if usage is None:
+        usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+    return usage
+
+
+class StreamAbandoned(Exception):
+    """Passed to listeners when the consumer stopped reading before the stream finished"""
+
+
+class TokenStream:
+    """Iterable of text deltas from a streamed chat completion.
+
+    `open_stream(model)` must return an iterator of completion chunks. Models
+    are tried in order until one produces its first token; once tokens have
+    been shown to the user a later failure is raised instead of switching.
+    `on_attempt(model, elapsed, error)` is called after each first-token
+    attempt, with error None on success.
+    """
+
+    def __init__(self, open_stream, models, on_fallback=None, on_complete=None, on_attempt=None):
+        self._open_stream = open_stream
+        self.models = list(models)
+        self.requested_model = self.models[0]
+        self._on_fallback = on_fallback
+        self._on_complete = on_complete
+        self._on_attempt = on_attempt
+        self.model = None
+        self.text = ""
+        self.usage = None
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+        # Bookkeeping for callers: rate-limit queue time, cache hits, coalesced readers
+        self.attempts = 0
+        self.queue_time = 0.0
+        self.cached = False
+        self.coalesced = False
+        self.source = None
+        # Set when stop_when() ended the stream before the model did
+        self.stopped = False
+        self._stop_when = None
+        self._source = None
+        self._listeners = []
+
+    @classmethod
+    def from_text(cls, text, model):
+        """Wrap an already generated response (e.g. a cache hit) as a stream"""
+        return cls(lambda _model: iter([text]), [model])
+
+    def add_listener(self, listener):
+        """Call `listener(token_stream, error)` when iteration ends, error None only if the stream finished.
+
+        A stream the consumer abandoned (a rerun, a closed connection) ends with StreamAbandoned.
+        """
+        self._listeners.append(listener)
+
+    def stop_when(self, predicate):
+        """End the stream as soon as `predicate(text so far)` is true, closing the upstream response.
+
+        The stream then finishes like one the model ended, with `stopped` set;
+        no usage chunk arrives for it, so `usage` is None unless `on_complete` fills in an estimate.
+        """
+        self._stop_when = predicate
+
+    def _should_stop(self, parts):
+        if self._stop_when is None or not self._stop_when("".join(parts)):
+            return False
+        self.stopped = True
+        return True
+
+    def _first_token(self):
+        errors = []
+        for model in self.models:
+            if errors and self._on_fallback:
+                self._on_fallback(self.models[len(errors) - 1], model)
+            attempt_started = time.perf_counter()
+            self.attempts += 1
+            try:
+                source = self._source = self._open_stream(model)
+                chunks = iter(source)
+                text = ""
+                for chunk in chunks:
+                    text = chunk if isinstance(chunk, str) else _chunk_text(chunk)
+                    if not isinstance(chunk, str):
+                        self.usage = _chunk_usage(chunk) or self.usage
+                    if text:
+                        break
+                # A stream that ends without content is a normal empty reply
+                self.model = getattr(source, "served_model", None) or model
+                if self._on_attempt:
+                    self._on_attempt(self.model, time.perf_counter() - attempt_started, None)
+                return text, chunks
+            except Exception as e:
+                if self._on_attempt:
+                    self._on_attempt(model, time.perf_counter() - attempt_started, e)
+                errors.append(f"{model}: {str(e)}")
+        raise Exception("All models failed before the first token. " + " | ".join(errors))
+
+    def __iter__(self):
+        error = None
+        try:
+            yield from self._iterate()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if self.finished_at is None:
+                # The consumer went away (or the stream failed): release the upstream response
+                self._close_source()
+                error = error or StreamAbandoned("Stream closed before it finished")
+            for listener in self._listeners:
+                listener(self, error)
+
+    def _close_source(self):
+        close = getattr(self._source, "close", None)
+        if close is not None:
+            close()
+
+    def _iterate(self):
+        self.started_at = time.perf_counter()
+        first, chunks = self._first_token()
+        self.first_token_at = time.perf_counter()
+        parts = [first]
+        if first:
+            yield first
+        if not (first and self._should_stop(parts)):
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    text = chunk
+                else:
+                    text = _chunk_text(chunk)
+                    self.usage = _chunk_usage(chunk) or self.usage
+                if text:
+                    parts.append(text)
+                    yield text
+                    if self._should_stop(parts):
+                        break
+        if self.stopped:
+            self._close_source()
+        self.finished_at = time.perf_counter()
+        self.text = "".join(parts)
+        if self._on_complete:
+            self._on_complete(self)
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def total_time(self):
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def metrics(self):
+        return {
+            "requested_model": self.requested_model,
+            "model": self.model,
+            "time_to_first_token": self.time_to_first_token,
+            "total_time": self.total_time,
+        }
+
+
+class AsyncTokenStream(TokenStream):
+    """Async counterpart of TokenStream; `open_stream(model)` is a coroutine returning an async iterator of chunks"""
+
+    async def _first_token(self):
+        errors = []
+        for model in self.models:
+            if errors and self._on_fallback:
+                self._on_fallback(self.models[len(errors) - 1], model)
+            attempt_started = time.perf_counter()
+            self.attempts += 1
+            try:
+                source = self._source = await self._open_stream(model)
+                chunks = source.__aiter__()
+                text = ""
+                async for chunk in chunks:
+                    text = chunk if isinstance(chunk, str) else _chunk_text(chunk)
+                    if not isinstance(chunk, str):
+                        self.usage = _chunk_usage(chunk) or self.usage
+                    if text:
+                        break
+                self.model = getattr(source, "served_model", None) or model
+                if self._on_attempt:
+                    self._on_attempt(self.model, time.perf_counter() - attempt_started, None)
+                return text, chunks
+            except Exception as e:
+                if self._on_attempt:
+                    self._on_attempt(model, time.perf_counter() - attempt_started, e)
+                errors.append(f"{model}: {str(e)}")
+        raise Exception("All models failed before the first token. " + " | ".join(errors))
+
+    def __iter__(self):
+        raise TypeError("AsyncTokenStream must be consumed with async for")
+
+    async def _close_source(self):
+        close = getattr(self._source, "close", None)
+        if close is not None:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+
+    async def __aiter__(self):
+        error = None
+        try:
+            self.started_at = time.perf_counter()
+            first, chunks = await self._first_token()
+            self.first_token_at = time.perf_counter()
+            parts = [first]
+            if first:
+                yield first
+            if not (first and self._should_stop(parts)):
+                async for chunk in chunks:
+                    if isinstance(chunk, str):
+                        text = chunk
+                    else:
+                        text = _chunk_text(chunk)
+                        self.usage = _chunk_usage(chunk) or self.usage
+                    if text:
+                        parts.append(text)
+                        yield text
+                        if self._should_stop(parts):
+                            break
+            if self.stopped:
+                await self._close_source()
+            self.finished_at = time.perf_counter()
+            self.text = "".join(parts)
+            if self._on_complete:
+                self._on_complete(self)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if self.finished_at is None:
+                # The consumer went away (or the stream failed): release the upstream response
+                await self._close_source()
+                error = error or StreamAbandoned("Stream closed before it finished")
+            for listener in self._listeners:
+                listener(self, error)
+
+    @classmethod
+    def from_text(cls, text, model):
+        async def replay(_model):
+            return _aiter_of([text])
+
+        return cls(replay, [model])
+
+
+async def _aiter_of(items):
+    for item in items:
+        yield item
+
+
+class PrimedStream:
+    """Chunk iterator that has already waited for its first content chunk.
+
+    Used to race streams on time-to-first-token; `served_model` tells a
+    TokenStream which model actually answered.
+    """
+
+    def __init__(self, chunks, served_model):
+        self.served_model = served_model
+        self._source = chunks
+        self._chunks = iter(chunks)
+        self._buffer = []
+        for chunk in self._chunks:
+            self._buffer.append(chunk)
+            if chunk if isinstance(chunk, str) else _chunk_text(chunk):
+                break
+
+    def __iter__(self):
+        yield from self._buffer
+        yield from self._chunks
+
+    def close(self):
+        close = getattr(self._source, "close", None)
+        if close:
+            close()
+
+
+class StreamMetricsLog:
+    """Bounded log of recent stream timings, summarized per label"""
+
+    def __init__(self, maxlen=500):
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=maxlen)
+
+    def record(self, label, stream):
+        with self._lock:
+            self._records.append((label, stream.time_to_first_token, stream.total_time))
+
+    def summary(self):
+        with self._lock:
+            records = list(self._records)
+        summary = {}
+        for label in sorted({r[0] for r in records}):
+            ttft = [r[1] for r in records if r[0] == label and r[1] is not None]
+            total = [r[2] for r in records if r[0] == label and r[2] is not None]
+            summary[label] = {
+                "count": len(total),
+                "median_time_to_first_token": statistics.median(ttft) if ttft else None,
+                "median_total_time": statistics.median(total) if total else None,
+            }
+        return summary
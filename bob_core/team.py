@@ -0,0 +1,157 @@
+"""Pipelined comedy team runs over many topics.
+
+Each topic moves through its steps in order, but steps of different topics
+overlap: topic B's writer call runs while topic A is with the roaster.
+Every step has its own concurrency limit so one slow model can't be flooded.
+
+Besides the classic three calls (writer -> roaster -> refiner) a run can be
+"two_stage" (one JSON call writes setup and punchline, the refiner polishes)
+or "fused" (one JSON call on one model returns all three). Every mode fills
+in the same setup / raw joke / final joke.
+"""
+import asyncio
+import json
+import time
+
+from . import telemetry
+
+STAGES = ("writer", "roaster", "refiner")
+
+# Steps of each mode: (step, role whose model runs it, JSON fields it returns or None for plain text)
+TEAM_MODES = {
+    "staged": (("writer", "writer", None), ("roaster", "roaster", None), ("refiner", "refiner", None)),
+    "two_stage": (("draft", "roaster", ("setup", "raw_joke")), ("refiner", "refiner", None)),
+    "fused": (("fused", "fused", ("setup", "raw_joke", "final_joke")),)
+}
+
+# Ordered from best quality to lowest latency
+MODE_PREFERENCE = ("staged", "two_stage", "fused")
+
+# Output each plain-text stage produces and the role credited with each output
+STAGE_OUTPUTS = {"writer": "setup", "roaster": "raw_joke", "refiner": "final_joke"}
+OUTPUT_ROLES = {output: stage for stage, output in STAGE_OUTPUTS.items()}
+
+STAGE_MAX_TOKENS = {
+    "writer": 100,
+    "roaster": 150,
+    "refiner": 200,
+    "draft": 250,
+    "fused": 450
+}
+
+DEFAULT_STAGE_CONCURRENCY = 4
+
+_JSON_FIELDS = {
+    "setup": "the setup, under 50 words",
+    "raw_joke": "the setup followed by a savage punchline",
+    "final_joke": "the joke polished to perfection, concise and impactful"
+}
+
+
+class MalformedTeamOutput(ValueError):
+    """A JSON step came back without the fields it was asked for"""
+
+
+def stage_request(stage, topic, previous):
+    """User message for a step, given the previous step's output"""
+    if stage == "writer":
+        return f"Create a clever setup for a joke about {topic}. Keep it under 50 words."
+    if stage == "roaster":
+        return f"Add a savage punchline to this setup:\n{previous}\nMake it sharp and memorable."
+    if stage == "refiner":
+        return f"Polish this joke to perfection:\n{previous}\nMake it concise and impactful."
+    fields = TEAM_MODES["two_stage" if stage == "draft" else "fused"][0][2]
+    steps = "create a clever setup, then add a savage punchline" if stage == "draft" else (
+        "create a clever setup, add a savage punchline, then polish the joke to perfection"
+    )
+    json_format = ",\n        ".join(f'"{field}": "{_JSON_FIELDS[field]}"' for field in fields)
+    return f"""Write a joke about {topic}: {steps}.
+    
+    Respond with a JSON object containing:
+    {{
+        {json_format}
+    }}"""
+
+
+def parse_step(text, fields):
+    """The requested fields of a JSON step's reply; raises MalformedTeamOutput"""
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        raise MalformedTeamOutput("reply is not JSON")
+    if not isinstance(data, dict):
+        raise MalformedTeamOutput("reply is not a JSON object")
+    missing = [field for field in fields if not isinstance(data.get(field), str) or not data[field].strip()]
+    if missing:
+        raise MalformedTeamOutput(f"reply is missing {', '.join(missing)}")
+    return {field: data[field].strip() for field in fields}
+
+
+async def run_team_pipeline(complete, topics, team_prompts, model_assignments, temperature, stage_concurrency=None, mode="staged"):
+    """Run the comedy team over `topics`; results come back in input order.
+
+    `complete(messages, model, temperature, max_tokens, **kwargs)` is an async
+    callable returning the chat completion. `model_assignments` maps a role
+    (writer, roaster, refiner, fused) to the model to ask, though a step is
+    reported with the model that answered it; `stage_concurrency` maps a
+    step name to its limit of in-flight calls. A topic whose JSON step comes
+    back malformed is redone staged; a failing topic gets an "error" entry
+    instead of aborting the whole batch.
+    """
+    stage_concurrency = stage_concurrency or {}
+    semaphores = {
+        step: asyncio.Semaphore(stage_concurrency.get(step, DEFAULT_STAGE_CONCURRENCY))
+        for step in STAGE_MAX_TOKENS
+    }
+
+    async def run_steps(topic, run_mode, timings):
+        outputs = {}
+        models_used = {}
+        for step, role, fields in TEAM_MODES[run_mode]:
+            model = model_assignments[role]
+            messages = [
+                team_prompts[step],
+                {"role": "user", "content": stage_request(step, topic, outputs.get("raw_joke") or outputs.get("setup"))}
+            ]
+            extra = {"response_format": {"type": "json_object"}} if fields else {}
+            async with semaphores[step]:
+                step_started = time.perf_counter()
+                with telemetry.labels(stage=step):
+                    completion = await complete(messages, model, temperature, STAGE_MAX_TOKENS[step], **extra)
+                timings[step] = time.perf_counter() - step_started
+            text = completion.choices[0].message.content
+            produced = parse_step(text, fields) if fields else {STAGE_OUTPUTS[step]: text}
+            outputs.update(produced)
+            # A fallback model may have answered instead of the assigned one
+            models_used.update({OUTPUT_ROLES[output]: completion.model for output in produced})
+        return outputs, models_used
+
+    async def run_topic(topic):
+        timings = {}
+        run_mode = mode
+        started = time.perf_counter()
+        try:
+            try:
+                outputs, models_used = await run_steps(topic, run_mode, timings)
+            except MalformedTeamOutput:
+                run_mode = "staged"
+                outputs, models_used = await run_steps(topic, run_mode, timings)
+        except Exception as e:
+            timings["total"] = time.perf_counter() - started
+            return {"topic": topic, "mode": run_mode, "error": str(e), "timings": timings}
+
+        timings["total"] = time.perf_counter() - started
+        return {
+            "topic": topic,
+            "mode": run_mode,
+            "final_joke": outputs["final_joke"],
+            "development_stages": {
+                "setup": outputs["setup"],
+                "raw_joke": outputs["raw_joke"]
+            },
+            "models_used": {stage: models_used[stage] for stage in STAGES},
+            "timings": timings,
+            "error": None
+        }
+
+    return await asyncio.gather(*(run_topic(topic) for topic in topics))
@@ -0,0 +1,233 @@
+"""Per-call spans: latency, token usage, cost, queue time, fallbacks and errors.
+
+A span covers one logical completion request. Finished spans go to an
+in-memory ring buffer (for the Ops panel) and, via a background logging
+thread, to a rotating JSONL file, so the request path only pays for a
+dict and a queue put.
+"""
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# USD per million (prompt, completion) tokens, from Groq's public price list
+MODEL_PRICES = {
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama3-70b-8192": (0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "llama3-8b-8192": (0.05, 0.08),
+    "mistral-saba-24b": (0.79, 0.79),
+    "gemma2-9b-it": (0.20, 0.20)
+}
+
+_labels = contextvars.ContextVar("bob_span_labels", default={})
+_current_span = contextvars.ContextVar("bob_current_span", default=None)
+_usage = contextvars.ContextVar("bob_usage", default=None)
+
+
+def set_labels(**labels):
+    """Label every span started from here on in this context (e.g. the current tab)"""
+    _labels.set({**_labels.get(), **labels})
+
+
+@contextmanager
+def labels(**labels):
+    token = _labels.set({**_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def current_span():
+    return _current_span.get()
+
+
+class UsageTotals:
+    """Tokens, cost and upstream calls of every span finished inside collect_usage()"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+    def add(self, record):
+        with self._lock:
+            self.calls += record["attempts"]
+            self.prompt_tokens += record["prompt_tokens"]
+            self.completion_tokens += record["completion_tokens"]
+            self.cost += record["cost"]
+
+
+@contextmanager
+def collect_usage():
+    """Total the usage of every call made in this block, including hedge threads and async tasks"""
+    totals = UsageTotals()
+    token = _usage.set(totals)
+    try:
+        yield totals
+    finally:
+        _usage.reset(token)
+
+
+class Span:
+    def __init__(self, tracer, requested_model, kind):
+        self._tracer = tracer
+        self._started = time.perf_counter()
+        self._finished = False
+        self._totals = _usage.get()
+        self.record = {
+            "ts": time.time(),
+            "kind": kind,
+            "tab": None,
+            "stage": None,
+            **_labels.get(),
+            "requested_model": requested_model,
+            "model": None,
+            "cached": False,
+            "coalesced": False,
+            "pooled": False,
+            "archived": False,
+            "attempts": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cost": 0.0,
+            "queue_time": 0.0,
+            "time_to_first_token": None,
+            "latency": None,
+            "error": None
+        }
+
+    def attempt(self, queue_time=0.0):
+        """Count one upstream call and the time it waited for rate-limit budget"""
+        self.record["attempts"] += 1
+        self.record["queue_time"] += queue_time
+
+    def set(self, **fields):
+        self.record.update(fields)
+
+    def set_usage(self, usage):
+        if usage is None:
+            return
+        self.record["prompt_tokens"] = getattr(usage, "prompt_tokens", 0) or 0
+        self.record["completion_tokens"] = getattr(usage, "completion_tokens", 0) or 0
+
+    def finish(self, error=None, latency=None):
+        if self._finished:
+            return
+        self._finished = True
+        self.record["latency"] = latency if latency is not None else time.perf_counter() - self._started
+        prompt_price, completion_price = self._tracer.prices.get(
+            self.record["model"] or self.record["requested_model"], (0.0, 0.0)
+        )
+        self.record["cost"] = (
+            self.record["prompt_tokens"] * prompt_price + self.record["completion_tokens"] * completion_price
+        ) / 1_000_000
+        if error is not None:
+            self.record["error"] = f"{type(error).__name__}: {str(error)}"[:500]
+        if self._totals is not None:
+            self._totals.add(self.record)
+        self._tracer.emit(self.record)
+
+
+class Tracer:
+    """Collects finished spans into a ring buffer and an optional rotating JSONL file"""
+
+    def __init__(self, path=None, ring_size=2000, max_bytes=10 * 1024 * 1024, backups=3, prices=None):
+        self.prices = MODEL_PRICES if prices is None else prices
+        self._lock = threading.Lock()
+        self.ring = deque(maxlen=ring_size)
+        self._queue = None
+        self._listener = None
+        if path:
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._queue = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(self._queue, handler)
+            self._listener.start()
+
+    def start(self, requested_model, kind="completion"):
+        return Span(self, requested_model, kind)
+
+    @contextmanager
+    def span(self, requested_model, kind="completion"):
+        """Span that is current for the block and records any exception as its error"""
+        span = self.start(requested_model, kind)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.finish(error=e)
+            raise
+        else:
+            span.finish()
+        finally:
+            _current_span.reset(token)
+
+    def emit(self, record):
+        with self._lock:
+            self.ring.append(record)
+        if self._queue is not None:
+            # Serialised on the listener thread, not on the request path
+            self._queue.put(logging.makeLogRecord({"msg": "%s", "args": (_JSONLine(record),)}))
+
+    def summary(self):
+        """p50/p95 latency, token and cost totals and error/fallback/cache counts per tab"""
+        with self._lock:
+            records = list(self.ring)
+        groups = {}
+        for record in records:
+            groups.setdefault(record.get("tab") or "other", []).append(record)
+        summary = {}
+        for tab, group in sorted(groups.items()):
+            latencies = sorted(r["latency"] for r in group if r["latency"] is not None and not r["error"])
+            ttfts = [r["time_to_first_token"] for r in group if r["time_to_first_token"] is not None]
+            summary[tab] = {
+                "calls": len(group),
+                "p50_latency": _percentile(latencies, 0.5),
+                "p95_latency": _percentile(latencies, 0.95),
+                "median_ttft": statistics.median(ttfts) if ttfts else None,
+                "prompt_tokens": sum(r["prompt_tokens"] for r in group),
+                "completion_tokens": sum(r["completion_tokens"] for r in group),
+                "cost_usd": round(sum(r["cost"] for r in group), 6),
+                "avg_queue_time": statistics.mean(r["queue_time"] for r in group),
+                "errors": sum(1 for r in group if r["error"]),
+                "fallbacks": sum(1 for r in group if r["model"] and r["model"] != r["requested_model"]),
+                "cache_hits": sum(1 for r in group if r["cached"]),
+                "coalesced": sum(1 for r in group if r["coalesced"]),
+                "pool_hits": sum(1 for r in group if r.get("pooled")),
+                "archive_hits": sum(1 for r in group if r.get("archived"))
+            }
+        return summary
+
+    def recent(self, limit=50):
+        with self._lock:
+            return list(self.ring)[-limit:][::-1]
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.stop()
+
+
+class _JSONLine:
+    """Defers json.dumps until the log record is formatted"""
+
+    def __init__(self, record):
+        self.record = record
+
+    def __str__(self):
+        return json.dumps(self.record, default=str)
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
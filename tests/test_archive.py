@@ -0,0 +1,60 @@
+import pytest
+
+from bob_core.archive import JokeArchive, RepeatFilter, normalize_topic, similarity, split_jokes
+
+STYLE = "Savage Roast"
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = JokeArchive(str(tmp_path / "archive.sqlite3"), similarity=0.4, min_items=1)
+    yield archive
+    archive.close()
+
+
+def test_similar_topics_are_served(archive):
+    assert similarity(normalize_topic("monday mornings"), normalize_topic("monday")) >= 0.4
+    archive.add("jokes", "Monday", STYLE, 3, "Mondays are a scam")
+    assert archive.find("jokes", "monday mornings", STYLE, 3) == ["Mondays are a scam"]
+
+
+def test_unrelated_topics_are_not_served(archive):
+    archive.add("jokes", "airline food", STYLE, 3, "The chicken had a layover")
+    assert archive.find("jokes", "quantum physics", STYLE, 3) is None
+
+
+def test_roasts_are_only_served_for_the_same_name(archive):
+    archive.add("roast", "my coworker", STYLE, 3, "John's roast", subject="John Smith")
+    archive.add("roast", "my coworker", STYLE, 3, "Sarah's roast", subject="Sarah")
+    assert archive.find("roast", "my coworker", STYLE, 3, subject="Jon Smith") is None
+    assert archive.find("roast", "my coworker", STYLE, 3, subject="Sara") is None
+    assert archive.find("roast", "my coworkers", STYLE, 3, subject="john smith") == ["John's roast"]
+
+
+def test_repeat_filter_drops_archived_jokes(archive):
+    archive.add("jokes", "cats", STYLE, 3, "Cats own you")
+    repeats = RepeatFilter(archive, "jokes")
+    reply = "Here you go:\n\n1. Dogs drool\n\n2. Cats own you\n\n3. Fish judge\n\nEnjoy!"
+    expected = "Here you go:\n\n1. Dogs drool\n\n2. Fish judge\n\nEnjoy!"
+    assert repeats.text(reply) == expected
+    # Streamed in small pieces, the shown text is the same
+    assert "".join(repeats.chunks(reply[i:i + 4] for i in range(0, len(reply), 4))) == expected
+
+
+def test_repeat_filter_ignores_jokes_archived_after_it(archive):
+    repeats = RepeatFilter(archive, "jokes")
+    reply = "1. Dogs drool\n\n2. Fish judge"
+    for joke in split_jokes(reply):
+        archive.add("jokes", "pets", STYLE, 3, joke)
+    assert repeats.text(reply) == reply
+
+
+def test_repeated_reply_only_loses_served_jokes(archive):
+    reply = "1. Dogs drool\n\n2. Fish judge\n\n3. Cats own you"
+    for joke in split_jokes(reply):
+        archive.add("jokes", "pets", STYLE, 3, joke)
+    assert archive.find("jokes", "pets", STYLE, 3) == ["Dogs drool"]
+    assert RepeatFilter(archive, "jokes").text(reply) == "1. Fish judge\n\n2. Cats own you"
+    # With every joke served, the reply is shown as it is rather than empty
+    archive.find("jokes", "pets", STYLE, 3, count=2)
+    assert RepeatFilter(archive, "jokes").text(reply) == reply
@@ -0,0 +1,73 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from bob_core.batch import run_batch
+
+JOBS = [{"mode": "jokes", "topic": f"topic {i:02d}", "id": f"job-{i}"} for i in range(20)]
+
+
+class StubEngine:
+    """Answers text jobs with the topic's name; raises KeyboardInterrupt on `interrupt_at` like a Ctrl-C"""
+
+    def __init__(self, interrupt_at=None):
+        self.interrupt_at = interrupt_at
+        self.topics = []
+
+    def output_budget(self, mode, max_tokens, items=1):
+        return max_tokens
+
+    def record_output(self, result, mode, max_tokens, items=1):
+        return result
+
+    def safe_completion_create(self, messages, model, temperature, max_tokens, **kwargs):
+        topic = next(topic for topic in (job["topic"] for job in JOBS) if topic in messages[-1]["content"])
+        if topic == self.interrupt_at:
+            raise KeyboardInterrupt
+        self.topics.append(topic)
+        message = SimpleNamespace(content=f"jokes about {topic}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], model=model)
+
+
+def read_output(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_resume_skips_finished_jobs(tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    with pytest.raises(KeyboardInterrupt):
+        run_batch(StubEngine(interrupt_at="topic 12"), iter(JOBS), output, concurrency=1)
+    first_run = {record["index"] for record in read_output(output)}
+    assert first_run and len(first_run) < len(JOBS)
+
+    engine = StubEngine()
+    summary = run_batch(engine, iter(JOBS), output, concurrency=4, resume=True)
+    assert sorted(engine.topics) == sorted(JOBS[i]["topic"] for i in range(len(JOBS)) if i not in first_run)
+    assert summary["skipped"] == len(first_run)
+    records = read_output(output)
+    assert sorted(record["index"] for record in records) == list(range(len(JOBS)))
+    assert all(record["error"] is None and record["id"] == f"job-{record['index']}" for record in records)
+
+
+def test_resume_recovers_results_written_after_the_checkpoint(tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    run_batch(StubEngine(), iter(JOBS[:5]), output, concurrency=2)
+    with open(f"{output}.checkpoint", encoding="utf-8") as f:
+        assert json.load(f)["watermark"] == 5
+    # As if the process died after writing job 5 but before the checkpoint caught up, mid-way through job 6
+    with open(output, "ab") as f:
+        f.write(json.dumps({"index": 5, "id": "job-5", "error": None}).encode("utf-8") + b"\n")
+        f.write(b'{"index": 6, "id": "jo')
+    engine = StubEngine()
+    run_batch(engine, iter(JOBS[:8]), output, concurrency=2, resume=True)
+    assert sorted(engine.topics) == ["topic 06", "topic 07"]
+    assert sorted(record["index"] for record in read_output(output)) == list(range(8))
+
+
+def test_existing_output_without_checkpoint_is_not_resumed(tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_text("{}\n")
+    with pytest.raises(ValueError, match="no checkpoint"):
+        run_batch(StubEngine(), iter(JOBS), str(output), resume=True)
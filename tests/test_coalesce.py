@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+from bob_core.coalesce import SingleFlight
+from bob_core.streaming import TokenStream
+
+WORDS = ["Mondays ", "are ", "a ", "scam"]
+
+
+class FakeUpstream:
+    """Streams WORDS, waiting for `gate` before each one when given; records whether it was closed"""
+
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.opened = 0
+        self.pulled = 0
+        self.closed = False
+
+    def open(self):
+        self.opened += 1
+        return TokenStream(lambda _model: self._chunks(), ["m"])
+
+    def _chunks(self):
+        try:
+            for word in WORDS:
+                if self.gate is not None:
+                    self.gate.wait()
+                self.pulled += 1
+                yield word
+        except GeneratorExit:
+            self.closed = True
+            raise
+
+
+def test_late_follower_replays_what_it_missed():
+    flight = SingleFlight(timeout=5)
+    upstream = FakeUpstream()
+    leader = flight.stream("k", upstream.open)
+    leader_chunks = iter(leader)
+    assert [next(leader_chunks), next(leader_chunks)] == WORDS[:2]
+
+    follower = flight.stream("k", upstream.open)
+    assert follower.coalesced and not leader.coalesced
+    assert "".join(follower) == "".join(WORDS)
+    assert "".join(leader_chunks) == "".join(WORDS[2:])
+    assert upstream.opened == 1
+    assert upstream.pulled == len(WORDS)
+
+
+def test_follower_keeps_reading_after_the_leader_leaves():
+    flight = SingleFlight(timeout=5)
+    upstream = FakeUpstream()
+    leader = flight.stream("k", upstream.open)
+    follower = flight.stream("k", upstream.open)
+    leader_chunks = iter(leader)
+    next(leader_chunks)
+    leader_chunks.close()
+    assert not upstream.closed
+    assert "".join(follower) == "".join(WORDS)
+    assert flight.snapshot()["streams_in_flight"] == {}
+
+
+def test_source_is_closed_when_the_last_reader_leaves():
+    flight = SingleFlight(timeout=5)
+    upstream = FakeUpstream()
+    readers = [iter(flight.stream("k", upstream.open)) for _ in range(2)]
+    for chunks in readers:
+        next(chunks)
+    readers[0].close()
+    assert not upstream.closed
+    readers[1].close()
+    assert upstream.closed
+    assert flight.snapshot()["streams_in_flight"] == {}
+    # The next identical request starts a new stream rather than joining the dead one
+    assert "".join(flight.stream("k", upstream.open)) == "".join(WORDS)
+    assert upstream.opened == 2
+
+
+def test_follower_gives_up_on_a_stuck_stream():
+    flight = SingleFlight(timeout=0.2)
+    gate = threading.Event()
+    upstream = FakeUpstream(gate)
+    leader = flight.stream("k", upstream.open)
+    follower = flight.stream("k", upstream.open)
+    # The leader blocks inside the upstream pull, so the follower can only wait for it
+    reading = threading.Thread(target=lambda: "".join(leader))
+    reading.start()
+    try:
+        with pytest.raises(Exception, match="No tokens from the shared stream"):
+            "".join(follower)
+    finally:
+        gate.set()
+        reading.join()
+
+
+def test_follower_of_a_stuck_call_runs_it_itself():
+    flight = SingleFlight(timeout=0.2)
+    release = threading.Event()
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", lambda: release.wait() and "leader")))
+    leader.start()
+    while not flight.snapshot()["in_flight"]:
+        time.sleep(0.01)
+    try:
+        assert flight.do("k", lambda: "follower") == "follower"
+        assert flight.snapshot()["follower_timeouts"] == 1
+    finally:
+        release.set()
+        leader.join()
+    assert results == ["leader"]
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from bob_core import config
+from bob_core.engine import ComedyEngine, text_completion
+from bob_core.jsonstream import IncrementalJSONParser, repair_json
+from bob_core.memes import MemeStreamParser
+from bob_core.streaming import TokenStream
+
+MEMES = [
+    {"top_text": "Monday", "bottom_text": "again", "meme_template": "drake", "description": "tired"},
+    {"top_text": "Coffee", "bottom_text": "please", "meme_template": "stonks", "description": "hopeful"},
+]
+
+
+def feed_in_pieces(parser, text, size=3):
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return events + parser.close()
+
+
+def test_values_are_reported_as_soon_as_they_close():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"a": "x", "b": [1, ') == [(("a",), "x"), (("b", 0), 1)]
+    assert parser.feed('2]}') == [(("b", 1), 2), (("b",), [1, 2]), ((), {"a": "x", "b": [1, 2]})]
+    assert parser.complete
+
+
+def test_truncated_reply_is_closed_and_the_cut_string_marked():
+    parser = IncrementalJSONParser()
+    parser.feed('{"memes": [{"top_text": "Monday", "bottom_text": "aga')
+    parser.close()
+    assert parser.value == {"memes": [{"top_text": "Monday", "bottom_text": "aga"}]}
+    assert parser.repaired and not parser.complete
+    assert parser.cut == ("memes", 0, "bottom_text")
+
+
+def test_model_slips_are_accepted():
+    text = "{'top_text': 'It\\'s Monday', bottom_text: \"again\", 'count': 2, 'ok': True, 'tags': ['a', 'b',],}"
+    assert repair_json(text) == {"top_text": "It's Monday", "bottom_text": "again", "count": 2, "ok": True, "tags": ["a", "b"]}
+
+
+def test_prose_and_code_fences_around_the_document_are_skipped():
+    text = 'Sure! Here are your memes:\n```json\n{"memes": []}\n```\nEnjoy {"not": "this"}'
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    assert parser.value == {"memes": []}
+    assert parser.complete
+    assert repair_json("no JSON here") is None
+
+
+def test_meme_specs_are_ready_before_the_reply_ends():
+    parser = MemeStreamParser(2)
+    text = json.dumps({"memes": MEMES})
+    cut = text.index('"description"')
+    events = parser.feed(text[:cut])
+    assert events == [("spec", 0, dict(MEMES[0], description=""))]
+    events = feed_in_pieces(parser, text[cut:])
+    assert [event[:2] for event in events] == [("description", 0), ("spec", 1), ("description", 1)]
+    assert parser.specs == MEMES
+
+
+def test_cut_off_meme_text_is_never_used():
+    parser = MemeStreamParser(2)
+    text = json.dumps({"memes": MEMES})
+    feed_in_pieces(parser, text[:text.index("please") + 3])
+    assert parser.specs == [MEMES[0], dict(MEMES[1], bottom_text="", meme_template="drake", description="")]
+    parser = MemeStreamParser(2)
+    feed_in_pieces(parser, text[:text.index("Coffee") + 3])
+    assert parser.specs == [MEMES[0], None]
+
+
+def test_duplicate_memes_stay_missing():
+    parser = MemeStreamParser(2)
+    feed_in_pieces(parser, json.dumps({"memes": [MEMES[0], dict(MEMES[0], description="again")]}))
+    assert parser.specs == [MEMES[0], None]
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    for setting in ("CACHE_PATH", "ARCHIVE_PATH", "SPAN_LOG"):
+        monkeypatch.setattr(config, setting, "")
+    engine = ComedyEngine("test-key", hedging=False, prewarm=False)
+    yield engine
+    engine.tracer.close()
+
+
+def test_only_missing_memes_are_requested_again(engine, monkeypatch):
+    requests = []
+    truncated = json.dumps({"memes": MEMES})
+    truncated = truncated[:truncated.index("Coffee") + 3]
+
+    def safe_completion_create(messages, model, temperature, max_tokens, stream=False, **kwargs):
+        requests.append(stream)
+        if stream:
+            return TokenStream.from_text(truncated, model)
+        return text_completion(json.dumps({"memes": [dict(MEMES[1], top_text="Tea")]}), model)
+
+    monkeypatch.setattr(engine, "safe_completion_create", safe_completion_create)
+    events = list(engine.stream_meme_specs("mondays", "Savage Roast", 3, 2, 0.7, 300))
+    assert requests == [True, False]
+    assert [event[:2] for event in events if event[0] == "spec"] == [("spec", 0), ("spec", 1)]
+    assert events[-1] == ("spec", 1, dict(MEMES[1], top_text="Tea"))
@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+
+import pytest
+
+from bob_core import routing
+from bob_core.routing import CircuitOpenError, ModelRouter, call_with_routing, is_model_failure
+
+
+class APIError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class APIConnectionError(Exception):
+    """Stand-in for groq.APIConnectionError, matched by name"""
+
+
+class APITimeoutError(APIConnectionError):
+    pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(routing.time, "time", lambda: clock.now)
+    return clock
+
+
+@pytest.fixture
+def router(clock):
+    return ModelRouter({"a": "b"}, window_seconds=60, failure_threshold=0.5, min_requests=4, cooldown_seconds=30)
+
+
+def state(router, model="a"):
+    return router.snapshot()["models"][model]["state"]
+
+
+def fail(router, model="a", times=1):
+    for _ in range(times):
+        router.acquire(model)
+        router.record_failure(model, 0.1, APIError(503))
+
+
+def test_only_server_and_connection_errors_are_the_models_fault():
+    assert is_model_failure(APIError(500))
+    assert is_model_failure(APIError(503))
+    assert is_model_failure(APITimeoutError("timed out"))
+    assert is_model_failure(ConnectionError())
+    assert not is_model_failure(APIError(400))
+    assert not is_model_failure(APIError(401))
+    assert not is_model_failure(APIError(429))
+    assert not is_model_failure(TimeoutError("Timed out waiting for a rate limit"))
+
+
+def test_circuit_opens_after_enough_failures(router):
+    fail(router, times=3)
+    assert state(router) == routing.CLOSED
+    fail(router)
+    assert state(router) == routing.OPEN
+    with pytest.raises(CircuitOpenError):
+        router.acquire("a")
+
+
+def test_successful_probe_closes_the_circuit(router, clock):
+    fail(router, times=4)
+    clock.now += 31
+    router.acquire("a")
+    assert state(router) == routing.HALF_OPEN
+    router.record_success("a", 0.1)
+    assert state(router) == routing.CLOSED
+    assert router.snapshot()["models"]["a"]["requests_in_window"] == 1
+
+
+def test_failed_probe_reopens_the_circuit(router, clock):
+    fail(router, times=4)
+    clock.now += 31
+    fail(router)
+    assert state(router) == routing.OPEN
+    assert router.snapshot()["models"]["a"]["times_opened"] == 2
+    clock.now += 10
+    with pytest.raises(CircuitOpenError):
+        router.acquire("a")
+
+
+def test_half_open_circuit_allows_one_probe_at_a_time(router, clock):
+    fail(router, times=4)
+    clock.now += 31
+    router.acquire("a")
+    with pytest.raises(CircuitOpenError, match="probe already in flight"):
+        router.acquire("a")
+    # A probe that was never sent gives its slot back
+    router.release("a")
+    router.acquire("a")
+
+
+def test_client_errors_leave_the_circuit_closed(router):
+    def call(candidate):
+        raise APIError(429 if candidate == "a" else 400)
+
+    for _ in range(5):
+        with pytest.raises(Exception, match="All models failed"):
+            call_with_routing(router, "a", call)
+    assert state(router) == routing.CLOSED
+    assert router.snapshot()["models"]["a"]["requests_in_window"] == 0
+
+
+def test_open_circuit_routes_to_the_fallback(router):
+    fail(router, times=4)
+    fallbacks = []
+    assert call_with_routing(router, "a", lambda candidate: candidate, on_fallback=lambda *hop: fallbacks.append(hop)) == "b"
+    assert fallbacks == [("a", "b")]
+    assert router.snapshot()["serving"] == {"a": "b"}
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from bob_core import scheduler as scheduler_module
+from bob_core.scheduler import RateLimitScheduler
+
+
+class RateLimited(Exception):
+    """Stand-in for groq.RateLimitError"""
+
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        self.response = SimpleNamespace(headers={"retry-after": retry_after} if retry_after else {})
+
+
+class FakeClient:
+    """Answers 429 (with Retry-After when given) `failures` times, then succeeds"""
+
+    def __init__(self, failures, retry_after=None):
+        self.failures = failures
+        self.retry_after = retry_after
+        self.calls = []
+
+    def create(self, reservation):
+        self.calls.append(time.monotonic())
+        if len(self.calls) <= self.failures:
+            raise RateLimited(self.retry_after)
+        return SimpleNamespace(usage=SimpleNamespace(total_tokens=reservation.tokens))
+
+    async def acreate(self, reservation):
+        return self.create(reservation)
+
+
+def tokens_available(scheduler, model="m"):
+    return scheduler.snapshot()[model]["tokens_available"]
+
+
+def test_retries_after_retry_after_and_refunds_rejected_tokens():
+    scheduler = RateLimitScheduler(default_rpm=1000, default_tpm=100000, base_backoff=0.01)
+    client = FakeClient(failures=1, retry_after="0.3")
+    started = time.monotonic()
+    scheduler.call("m", 1000, client.create)
+    assert len(client.calls) == 2
+    assert client.calls[1] - client.calls[0] >= 0.3
+    assert time.monotonic() - started >= 0.3
+    # Only the attempt that got through is charged
+    assert tokens_available(scheduler) >= 100000 - 1000 - 5
+    assert scheduler.snapshot()["m"]["rate_limited"] == 1
+
+
+def test_backoff_grows_exponentially_and_gives_up(monkeypatch):
+    delays = []
+    monkeypatch.setattr(scheduler_module.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(scheduler_module.time, "sleep", delays.append)
+    scheduler = RateLimitScheduler(default_rpm=1000, default_tpm=100000, max_retries=3, base_backoff=0.5)
+    client = FakeClient(failures=10)
+    with pytest.raises(RateLimited):
+        scheduler.call("m", 100, client.create)
+    assert delays == [0.5, 1.0, 2.0]
+    assert len(client.calls) == 4
+
+
+def test_async_call_retries_after_retry_after():
+    scheduler = RateLimitScheduler(default_rpm=1000, default_tpm=100000, base_backoff=0.01)
+    client = FakeClient(failures=2, retry_after="0.1")
+    asyncio.run(scheduler.async_call("m", 1000, client.acreate))
+    assert len(client.calls) == 3
+    assert client.calls[2] - client.calls[0] >= 0.2
+    assert tokens_available(scheduler) >= 100000 - 1000 - 5
+
+
+def test_failed_attempts_refund_their_tokens():
+    scheduler = RateLimitScheduler(default_rpm=1000, default_tpm=100000, max_retries=0)
+
+    def unavailable(reservation):
+        error = Exception("service unavailable")
+        error.status_code = 503
+        raise error
+
+    for fn in (unavailable, FakeClient(failures=1).create):
+        with pytest.raises(Exception):
+            scheduler.call("m", 5000, fn)
+    assert tokens_available(scheduler) >= 100000 - 5
+
+
+def test_cancelled_async_attempt_refunds_its_tokens():
+    scheduler = RateLimitScheduler(default_rpm=1000, default_tpm=100000)
+
+    async def hang(reservation):
+        await asyncio.sleep(10)
+
+    async def main():
+        task = asyncio.create_task(scheduler.async_call("m", 5000, hang))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert tokens_available(scheduler) >= 100000 - 5
+
+
+def test_sessions_are_served_round_robin():
+    scheduler = RateLimitScheduler(default_rpm=1000, default_tpm=100000)
+    # Blocked as after a 429, so every request queues up
+    scheduler.observe_headers("m", {"retry-after": "0.3"})
+    order = []
+
+    def request(session, n):
+        scheduler.acquire("m", 10, session)
+        order.append(f"{session}{n}")
+
+    threads = []
+    for session, n in (("a", 1), ("a", 2), ("a", 3), ("b", 1)):
+        thread = threading.Thread(target=request, args=(session, n))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_async_waiters_share_the_queue_without_threads():
+    scheduler = RateLimitScheduler(default_rpm=1000, default_tpm=100000)
+    scheduler.observe_headers("m", {"retry-after": "0.3"})
+    order = []
+
+    async def request(session, n):
+        await scheduler.async_acquire("m", 10, session)
+        order.append(f"{session}{n}")
+
+    async def main():
+        tasks = []
+        for session, n in (("a", 1), ("a", 2), ("a", 3), ("b", 1)):
+            tasks.append(asyncio.create_task(request(session, n)))
+            await asyncio.sleep(0.02)
+        threads = threading.active_count()
+        await asyncio.gather(*tasks)
+        return threads
+
+    threads_before = threading.active_count()
+    assert asyncio.run(main()) == threads_before
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_share_scales_limits_for_each_worker():
+    scheduler = RateLimitScheduler(default_rpm=40, default_tpm=40000, share=0.25)
+    scheduler.acquire("m", 1000)
+    assert tokens_available(scheduler) == 9000
+    # Header limits are for the whole API key, so they are scaled too
+    scheduler.observe_headers("m", {"x-ratelimit-limit-tokens": "8000", "x-ratelimit-remaining-tokens": "4000"})
+    assert tokens_available(scheduler) == 1000